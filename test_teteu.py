@@ -1,19 +1,19 @@
 import os
+import io
+import json
+import importlib.util
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
 import sqlite3
 import subprocess
-import requests
-from openai import OpenAI
-from RestrictedPython import compile_restricted, safe_globals
-import chardet
-import glob
-import cohere
-from deep_translator import GoogleTranslator
-from github import Github
-from win10toast import ToastNotifier
-import readline
-import nbformat as nbf
+import sys
 
+import teteu
 from teteu import (
     resumir_texto,
     explicar_codigo,
@@ -26,506 +26,29 @@ from teteu import (
     sugerir_projetos,
 )
 
-# Substitua a configuração da API key:
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-if not client.api_key:
-    raise ValueError("API Key da OpenAI não encontrada. Verifique a variável de ambiente 'OPENAI_API_KEY'.")
-
-modelo_gpt = "gpt-3.5-turbo"
-
-# 📦 Banco de Dados SQLite
-con = sqlite3.connect('teteu.db')
-cur = con.cursor()
-
-# Cria tabela se não existir
-cur.execute('''
-    CREATE TABLE IF NOT EXISTS historico (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        comando TEXT,
-        resposta TEXT
-    )
-''')
-con.commit()
-
-def obter_contexto(limite=5):
-    cur.execute('SELECT comando, resposta FROM historico ORDER BY id DESC LIMIT ?', (limite,))
-    registros = cur.fetchall()
-    return registros[::-1]
-
-def perguntar_ao_gpt(prompt, contexto_limite=5):
-    try:
-        mensagens = []
-        contexto = obter_contexto(contexto_limite)
-        for comando, resposta in contexto:
-            mensagens.append({"role": "user", "content": comando})
-            mensagens.append({"role": "assistant", "content": resposta})
-        prompt_personalizado = (
-            "Você é o TETEU, um assistente de programação divertido, que responde de forma descontraída e amigável, "
-            "usando gírias brasileiras quando possível. "
-            "Seja claro, didático e incentive o usuário a aprender. "
-            f"Pergunta do usuário: {prompt}"
-        )
-        mensagens.append({"role": "user", "content": prompt_personalizado})
 
-        resposta = client.chat.completions.create(
-            model=modelo_gpt,
-            messages=mensagens,
-            temperature=0.7,
-            max_tokens=1500
-        )
-        texto = resposta.choices[0].message.content.strip()
-        return texto
-    except Exception as e:
-        if "insufficient_quota" in str(e):
-            return "⚠️ Sua cota da OpenAI acabou. Verifique seu plano e billing em https://platform.openai.com/account/usage"
-        return f"Erro ao acessar OpenAI: {e}"
-
-def executar_codigo(codigo):
-    try:
-        byte_code = compile_restricted(codigo, '<string>', 'exec')
-        exec(byte_code, safe_globals.copy())
-    except Exception as e:
-        print(f"Erro ao executar: {e}")
-
-def mostrar_historico(limite=10):
-    cur.execute('SELECT id, comando, resposta FROM historico ORDER BY id DESC LIMIT ?', (limite,))
-    registros = cur.fetchall()
-    if registros:
-        for r in registros[::-1]:
-            print(f"\n🆔 {r[0]} — Comando: {r[1]}\nResposta: {r[2]}")
-    else:
-        print("📭 Histórico vazio.")
-
-def buscar_no_historico(termo):
-    cur.execute("SELECT id, comando, resposta FROM historico WHERE comando LIKE ? OR resposta LIKE ? ORDER BY id", 
-                (f"%{termo}%", f"%{termo}%"))
-    resultados = cur.fetchall()
-    if resultados:
-        for r in resultados:
-            print(f"\n🆔 {r[0]} — Comando: {r[1]}\nResposta: {r[2]}")
-    else:
-        print(f"🔍 Nada encontrado para '{termo}'.")
-
-def mostrar_ajuda():
-    print("""
-Comandos disponíveis:
-- sair: Encerra o programa
-- exec <codigo>: Executa código Python
-- historico: Mostra as últimas interações
-- buscar <termo>: Busca no histórico
-- limpar_historico: Limpa todo o histórico
-- exportar_historico: Exporta o histórico para um arquivo
-- modelo <nome>: Troca o modelo GPT (ex: modelo gpt-4)
-- explica <codigo>: Explica detalhadamente um código Python
-- resuma <texto>: Resume um texto longo
-- erro <mensagem>: Explica um erro de Python e como resolver
-- corrija <codigo>: Sugere melhorias e corrige um código Python
-- quiz: Recebe uma pergunta de múltipla escolha sobre programação
-- desafio: Recebe um desafio de programação para praticar
-- materiais: Sugere materiais gratuitos para aprender Python
-- ajuda: Mostra esta mensagem de ajuda
-""")
-
-def limpar_historico():
-    cur.execute('DELETE FROM historico')
-    con.commit()
-    print("🧹 Histórico limpo com sucesso!")
-
-def exportar_historico():
-    cur.execute('SELECT id, comando, resposta FROM historico ORDER BY id')
-    registros = cur.fetchall()
-    if registros:
-        with open("historico_teteu.txt", "w", encoding="utf-8") as f:
-            for r in registros:
-                f.write(f"ID: {r[0]}\nComando: {r[1]}\nResposta: {r[2]}\n{'-'*40}\n")
-        print("📤 Histórico exportado para 'historico_teteu.txt'.")
-    else:
-        print("📭 Histórico vazio, nada para exportar.")
-
-def exportar_para_notebook():
-    cur.execute('SELECT comando, resposta FROM historico ORDER BY id')
-    registros = cur.fetchall()
-    nb = nbf.v4.new_notebook()
-    cells = []
-    for comando, resposta in registros:
-        cells.append(nbf.v4.new_markdown_cell(f"**Comando:** `{comando}`\n\n**Resposta:**\n{resposta}"))
-    nb['cells'] = cells
-    with open("historico_teteu.ipynb", "w", encoding="utf-8") as f:
-        nbf.write(nb, f)
-    print("📓 Histórico exportado para 'historico_teteu.ipynb'.")
-
-def explicar_codigo(codigo):
-    prompt = f"Explique detalhadamente o que faz o seguinte código Python:\n\n{codigo}"
-    return perguntar_ao_gpt(prompt)
-
-def resumir_texto(texto):
-    prompt = f"Resuma o texto a seguir em poucas linhas, de forma clara e objetiva:\n\n{texto}"
-    return perguntar_ao_gpt(prompt)
-
-def explicar_erro(erro):
-    prompt = f"Explique o seguinte erro de Python e como resolvê-lo:\n\n{erro}"
-    return perguntar_ao_gpt(prompt)
-
-def corrigir_codigo(codigo):
-    prompt = f"Revise o seguinte código Python, aponte erros e sugira melhorias:\n\n{codigo}"
-    return perguntar_ao_gpt(prompt)
-
-def sugerir_materiais():
-    prompt = "Sugira materiais gratuitos para aprender Python, como sites, vídeos e livros."
-    return perguntar_ao_gpt(prompt)
-
-def quiz_programacao():
-    prompt = (
-        "Crie uma pergunta de múltipla escolha sobre programação Python, "
-        "com 4 alternativas e indique a correta no final."
-    )
-    return perguntar_ao_gpt(prompt)
-
-def desafio_programacao():
-    prompt = (
-        "Me proponha um desafio simples de programação em Python para iniciantes, "
-        "explique o que deve ser feito e mostre a solução ao final."
-    )
-    return perguntar_ao_gpt(prompt)
-
-def explicar_biblioteca(nome):
-    prompt = f"Explique para que serve a biblioteca Python '{nome}' e mostre um exemplo de uso."
-    return perguntar_ao_gpt(prompt)
-
-def buscar_stackoverflow(pergunta):
-    url = "https://api.stackexchange.com/2.3/search/advanced"
-    params = {
-        "order": "desc",
-        "sort": "relevance",
-        "q": pergunta,
-        "site": "stackoverflow",
-        "accepted": True,
-        "answers": 1
-    }
-    resp = requests.get(url, params=params)
-    data = resp.json()
-    if data["items"]:
-        titulo = data["items"][0]["title"]
-        link = data["items"][0]["link"]
-        return f"Encontrei isso no Stack Overflow:\n{titulo}\n{link}"
-    else:
-        return "Nenhuma resposta encontrada no Stack Overflow."
-
-def analisar_codigo(codigo):
-    with open("temp_code.py", "w", encoding="utf-8") as f:
-        f.write(codigo)
-    resultados = []
-    try:
-        # Flake8
-        flake8 = subprocess.run(["flake8", "temp_code.py"], capture_output=True, text=True)
-        if flake8.stdout:
-            resultados.append(f"⚠️ Flake8 encontrou problemas:\n{flake8.stdout}")
-        else:
-            resultados.append("✅ Flake8: Nenhum problema encontrado.")
-
-        # Pylint
-        pylint = subprocess.run(
-            ["pylint", "temp_code.py", "--disable=all", "--enable=errors,warnings"],
-            capture_output=True, text=True
-        )
-        if pylint.stdout and "Your code has been rated" not in pylint.stdout:
-            resultados.append(f"⚠️ Pylint encontrou problemas:\n{pylint.stdout}")
-        else:
-            resultados.append("✅ Pylint: Nenhum problema encontrado.")
-
-        # Mypy (opcional, se usar type hints)
-        mypy = subprocess.run(["mypy", "temp_code.py"], capture_output=True, text=True)
-        if mypy.stdout and "Success" not in mypy.stdout:
-            resultados.append(f"⚠️ Mypy encontrou problemas de tipos:\n{mypy.stdout}")
-        else:
-            resultados.append("✅ Mypy: Tipos corretos ou não utilizados.")
-
-        # Black (sugestão de formatação)
-        black = subprocess.run(["black", "--check", "temp_code.py"], capture_output=True, text=True)
-        if "would reformat" in black.stdout:
-            resultados.append("💡 Black: O código pode ser melhor formatado. Use o Black para padronizar.")
-        else:
-            resultados.append("✅ Black: O código já está bem formatado.")
-    finally:
-        if os.path.exists("temp_code.py"):
-            os.remove("temp_code.py")
-    return "\n\n".join(resultados)
-
-def sugerir_projetos(nivel="iniciante"):
-    prompt = f"Me sugira 3 ideias de projetos em Python para o nível {nivel}, com breve descrição de cada."
-    return perguntar_ao_gpt(prompt)
-
-def revisar_com_gpt(codigo):
-    prompt = (
-        "Analise o seguinte código Python, explique os principais erros encontrados, "
-        "mostre exemplos de código corrigido quando possível e sugira melhorias de clareza, performance e boas práticas:\n\n"
-        f"{codigo}"
-    )
-    return perguntar_ao_gpt(prompt)
-
-def teteu_loop():
-    global modelo_gpt
-    print("🤖 TETEU IA — Assistente de Código")
-    print("Comandos: 'sair', 'exec <codigo>', 'historico', 'buscar <termo>'")
-
-    while True:
-        comando = input(">>> ")
-
-        if comando.lower() == 'sair':
-            print("Tchau! 👋")
-            break
-
-        elif comando.lower().startswith('exec'):
-            codigo = comando[5:]
-            executar_codigo(codigo)
-            print("Código executado.")
-            continue
-
-        elif comando.lower() == 'historico':
-            texto_hist = mostrar_historico_interface()
-            print(texto_hist)
-            continue
-
-        elif comando.lower().startswith('buscar'):
-            termo = comando[7:].strip()
-            if termo:
-                buscar_no_historico(termo)
-            else:
-                print("⚠️ Informe um termo para buscar. Exemplo: buscar print")
-            continue
-
-        elif comando.lower() == 'ajuda':
-            mostrar_ajuda()
-            continue
-
-        elif comando.lower() == 'limpar_historico':
-            limpar_historico()
-            print("🧹 Histórico limpo com sucesso!")
-            continue
-
-        elif comando.lower() == 'exportar_historico':
-            exportar_historico()
-            print("Histórico exportado para 'historico_teteu.txt'.")
-            continue
-
-        elif comando.lower() == 'exportar_para_notebook':
-            exportar_para_notebook()
-            print("Histórico exportado para 'historico_teteu.ipynb'.")
-            continue
-
-        elif comando.lower().startswith('modelo'):
-            novo_modelo = comando[7:].strip()
-            if novo_modelo:
-                modelo_gpt = novo_modelo
-                print(f"🤖 Modelo alterado para: {modelo_gpt}")
-            else:
-                print("⚠️ Informe o nome do modelo. Exemplo: modelo gpt-4")
-            continue
-
-        elif comando.lower().startswith('explica'):
-            codigo = comando[8:]
-            explicacao = perguntar_todas_ias(f"Explique detalhadamente o que faz o seguinte código Python:\n\n{codigo}")
-            print(f"\nTETEU 🤖 {explicacao}")
-            cur.execute('INSERT INTO historico (comando, resposta) VALUES (?, ?)', (comando, explicacao))
-            con.commit()
-            continue
-
-        elif comando.lower().startswith('resuma'):
-            texto = comando[7:]
-            resumo = resumir_texto(texto)
-            print(f"\nTETEU 🤖 {resumo}")
-            cur.execute('INSERT INTO historico (comando, resposta) VALUES (?, ?)', (comando, resumo))
-            con.commit()
-            continue
-
-        elif comando.lower().startswith('erro'):
-            erro = comando[5:]
-            explicacao = explicar_erro(erro)
-            print(f"\nTETEU 🤖 {explicacao}")
-            cur.execute('INSERT INTO historico (comando, resposta) VALUES (?, ?)', (comando, explicacao))
-            con.commit()
-            continue
-
-        elif comando.lower() == 'quiz':
-            quiz = quiz_programacao()
-            print(f"\nTETEU 🤖 {quiz}")
-            cur.execute('INSERT INTO historico (comando, resposta) VALUES (?, ?)', (comando, quiz))
-            con.commit()
-            continue
-
-        elif comando.lower() == 'desafio':
-            desafio = desafio_programacao()
-            print(f"\nTETEU 🤖 {desafio}")
-            cur.execute('INSERT INTO historico (comando, resposta) VALUES (?, ?)', (comando, desafio))
-            con.commit()
-            continue
-
-        elif comando.lower().startswith('corrija'):
-            codigo = comando[7:]
-            correcao = corrigir_codigo(codigo)
-            print(f"\nTETEU 🤖 {correcao}")
-            cur.execute('INSERT INTO historico (comando, resposta) VALUES (?, ?)', (comando, correcao))
-            con.commit()
-            continue
-
-        elif comando.lower() == 'materiais':
-            materiais = sugerir_materiais()
-            print(f"\nTETEU 🤖 {materiais}")
-            cur.execute('INSERT INTO historico (comando, resposta) VALUES (?, ?)', (comando, materiais))
-            con.commit()
-            continue
-
-        elif comando.lower().startswith('stackoverflow'):
-            pergunta = comando[13:].strip()
-            resposta = buscar_stackoverflow(pergunta)
-            print(f"\nTETEU 🤖 {resposta}")
-            cur.execute('INSERT INTO historico (comando, resposta) VALUES (?, ?)', (comando, resposta))
-            con.commit()
-            continue
-
-        elif comando.lower().startswith('biblioteca'):
-            nome = comando[11:].strip()
-            explicacao = explicar_biblioteca(nome)
-            print(f"\nTETEU 🤖 {explicacao}")
-            cur.execute('INSERT INTO historico (comando, resposta) VALUES (?, ?)', (comando, explicacao))
-            con.commit()
-            continue
-
-        elif comando.lower().startswith('analisar'):
-            codigo = comando[8:].strip()
-            analise = analisar_codigo(codigo)
-            print(f"\nTETEU 🤖 {analise}")
-            try:
-                revisao = revisar_com_gpt(codigo)
-                print(f"\nTETEU 🤖 Sugestão GPT:\n{revisao}")
-                resposta_final = analise + "\n\nSugestão GPT:\n" + revisao
-            except Exception as e:
-                print("\nTETEU 🤖 Não foi possível acessar o GPT para revisão. Mostrando apenas análise automática.")
-                resposta_final = analise
-            cur.execute('INSERT INTO historico (comando, resposta) VALUES (?, ?)', (comando, resposta_final))
-            con.commit()
-            continue
-
-        elif comando.lower().startswith('projetos'):
-            nivel = comando[8:].strip() or "iniciante"
-            sugestoes = sugerir_projetos(nivel)
-            print(f"\nTETEU 🤖 {sugestoes}")
-            cur.execute('INSERT INTO historico (comando, resposta) VALUES (?, ?)', (comando, sugestoes))
-            con.commit()
-            continue
-
-        else:
-            print("🤖 TETEU: Não entendi esse comando. Digite 'ajuda' para ver as opções.")
-
-def limpar_arquivos_temporarios(padrao="temp_code*.py"):
-    for arquivo in glob.glob(padrao):
-        try:
-            os.remove(arquivo)
-        except Exception as e:
-            print(f"Não foi possível remover {arquivo}: {e}")
+# Banco, caches e vetores dos testes ficam numa pasta temporária, longe do teteu.db versionado
+_pasta_testes = None
+_patches_modulo = []
 
-# 🚀 Rodar
-if __name__ == "__main__":
-    try:
-        teteu_loop()
-    finally:
-        limpar_arquivos_temporarios()
-        con.close()
+def setUpModule():
+    global _pasta_testes
+    _pasta_testes = tempfile.mkdtemp(prefix="teteu-testes-")
+    for nome, arquivo in (("CAMINHO_BANCO", "teteu.db"), ("CAMINHO_CACHE", "teteu_cache.db"),
+                          ("ARQUIVO_VETORES", "teteu_vetores.f32"), ("ARQUIVO_IDS_VETORES", "teteu_vetores.ids"),
+                          ("PASTA_BYTECODE", "bytecode")):
+        patch = mock.patch.object(teteu, nome, os.path.join(_pasta_testes, arquivo))
+        patch.start()
+        _patches_modulo.append(patch)
+    teteu.fechar_banco()
+    teteu.iniciar_banco(teteu.CAMINHO_BANCO, teteu.CAMINHO_CACHE)
+
+def tearDownModule():
+    teteu.fechar_banco()
+    for patch in reversed(_patches_modulo):
+        patch.stop()
+    shutil.rmtree(_pasta_testes, ignore_errors=True)
 
-def perguntar_ao_cohere(prompt):
-    try:
-        co = cohere.Client(os.getenv("COHERE_API_KEY"))  # Ou coloque sua chave direto aqui
-        resposta = co.generate(
-            model='command',  # ou 'command-light'
-            prompt=prompt,
-            max_tokens=300
-        )
-        return resposta.generations[0].text.strip()
-    except Exception as e:
-        return f"Erro Cohere: {e}"
-
-def perguntar_ao_huggingface(prompt):
-    try:
-        API_URL = "https://api-inference.huggingface.co/models/bigscience/bloomz-560m"  # Você pode trocar por outro modelo!
-        headers = {"Authorization": f"Bearer {os.getenv('HF_API_KEY')}"}
-        payload = {"inputs": prompt}
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=30)
-        resposta = response.json()
-        # Alguns modelos retornam uma lista, outros um dicionário
-        if isinstance(resposta, list) and resposta and "generated_text" in resposta[0]:
-            return resposta[0]["generated_text"].strip()
-        elif isinstance(resposta, dict) and "error" in resposta:
-            return f"Erro Hugging Face: {resposta['error']}"
-        else:
-            return str(resposta)
-    except Exception as e:
-        return f"Erro Hugging Face: {e}"
-
-def perguntar_todas_ias(prompt, contexto_limite=5):
-    respostas = []
-
-    # OpenAI GPT
-    try:
-        resposta_gpt = perguntar_ao_gpt(prompt, contexto_limite)
-        if resposta_gpt and not resposta_gpt.startswith("⚠️ Sua cota da OpenAI acabou"):
-            respostas.append("🤖 GPT:\n" + resposta_gpt)
-    except Exception:
-        pass
-
-    # Cohere
-    try:
-        prompt_en = traduzir_para_ingles(prompt)
-        resposta_cohere = perguntar_ao_cohere(prompt_en)
-        if resposta_cohere and not "quota" in str(resposta_cohere).lower():
-            respostas.append("🟣 Cohere:\n" + resposta_cohere)
-    except Exception:
-        pass
-
-    # Hugging Face
-    try:
-        prompt_en = traduzir_para_ingles(prompt)
-        resposta_hf = perguntar_ao_huggingface(prompt_en)
-        if resposta_hf and not "quota" in str(resposta_hf).lower():
-            respostas.append("🤗 Hugging Face:\n" + resposta_hf)
-    except Exception:
-        pass
-
-    if respostas:
-        return "\n\n".join(respostas)
-    else:
-        return "Nenhuma IA pôde responder no momento (todas atingiram o limite ou houve erro)."
-
-def traduzir_para_ingles(texto):
-    try:
-        return GoogleTranslator(source='pt', target='en').translate(texto)
-    except Exception:
-        return texto
-
-def baixar_repositorio_github(url):
-    try:
-        g = Github()
-        repo_name = url.split("github.com/")[1]
-        repo = g.get_repo(repo_name)
-        arquivos = repo.get_contents("")
-        for arquivo in arquivos:
-            print(arquivo.name)
-    except Exception as e:
-        print(f"Erro ao baixar repositório: {e}")
-
-def notificar(texto):
-    toaster = ToastNotifier()
-    toaster.show_toast("TETEU IA", texto, duration=5)
-
-def mostrar_historico_interface(limite=10):
-    cur.execute('SELECT id, comando, resposta FROM historico ORDER BY id DESC LIMIT ?', (limite,))
-    registros = cur.fetchall()
-    if registros:
-        texto = ""
-        for r in registros[::-1]:
-            texto += f"\n🆔 {r[0]} — Comando: {r[1]}\nResposta: {r[2]}\n"
-        return texto
-    else:
-        return "📭 Histórico vazio."
 
 class TestTeteuIA(unittest.TestCase):
     def test_resumir_texto(self):
@@ -573,5 +96,1678 @@ class TestTeteuIA(unittest.TestCase):
         self.assertIsInstance(projetos, str)
         self.assertTrue("projeto" in projetos.lower() or "python" in projetos.lower())
 
+class TestTodasIAs(unittest.TestCase):
+    def _fakes(self, atraso_gpt=0.0, atraso_cohere=0.0, atraso_hf=0.0):
+        def gpt(prompt, **kwargs):
+            time.sleep(atraso_gpt)
+            return "resposta gpt"
+
+        def cohere_(prompt, **kwargs):
+            time.sleep(atraso_cohere)
+            return "resposta cohere"
+
+        def hf(prompt, **kwargs):
+            time.sleep(atraso_hf)
+            return "resposta hf"
+
+        return [
+            mock.patch.object(teteu, "montar_mensagens", return_value=[]),
+            mock.patch.object(teteu, "perguntar_ao_gpt", side_effect=gpt),
+            mock.patch.object(teteu, "perguntar_ao_cohere", side_effect=cohere_),
+            mock.patch.object(teteu, "perguntar_ao_huggingface", side_effect=hf),
+        ]
+
+    def _rodar(self, fakes, **kwargs):
+        with fakes[0], fakes[1], fakes[2], fakes[3], \
+                mock.patch.object(teteu, "traduzir_para_ingles", return_value="hi") as traduzir:
+            resposta = teteu.perguntar_todas_ias("oi", **kwargs)
+        return resposta, traduzir
+
+    def test_traduz_uma_vez_e_mantem_ordem(self):
+        resposta, traduzir = self._rodar(self._fakes(atraso_gpt=0.2))
+        self.assertEqual(traduzir.call_count, 1)
+        self.assertLess(resposta.index("GPT"), resposta.index("Cohere"))
+        self.assertIn("Hugging Face", resposta)
+
+    def test_primeira_boa_nao_espera_o_mais_lento(self):
+        inicio = time.monotonic()
+        resposta, _ = self._rodar(self._fakes(atraso_gpt=1.0, atraso_hf=1.0), modo="primeira_boa")
+        self.assertLess(time.monotonic() - inicio, 0.8)
+        self.assertEqual(resposta, "🟣 Cohere:\nresposta cohere")
+
+    def test_prazo_por_provedor(self):
+        resposta, _ = self._rodar(self._fakes(atraso_hf=1.0), prazos={"huggingface": 0.2})
+        self.assertIn("GPT", resposta)
+        self.assertNotIn("Hugging Face", resposta)
+
+class TestRoteador(unittest.TestCase):
+    class Falso(teteu.Provedor):
+        def __init__(self, nome, atraso=0.0, erros=(), pedacos=None, idioma="pt"):
+            self.nome = nome
+            self.atraso = atraso
+            self.erros = list(erros)    # levantados um por chamada, antes de responder
+            self.pedacos = pedacos
+            self.idioma = idioma
+            self.chamadas = 0
+
+        def configurado(self):
+            return True
+
+        def _gerar(self, prompt, mensagens, timeout):
+            self.chamadas += 1
+            time.sleep(self.atraso)
+            if self.erros:
+                raise self.erros.pop(0)
+            return f"{self.nome}: {prompt}"
+
+        def _gerar_stream(self, prompt, mensagens, timeout):
+            self.chamadas += 1
+            if self.erros:
+                raise self.erros.pop(0)
+            for pedaco in self.pedacos or [f"{self.nome}: {prompt}"]:
+                if isinstance(pedaco, Exception):
+                    raise pedaco
+                yield pedaco
+
+    def test_classifica_erros_das_bibliotecas(self):
+        def erro(nome, **atributos):
+            excecao = type(nome, (Exception,), {})("falhou")
+            for chave, valor in atributos.items():
+                setattr(excecao, chave, valor)
+            return excecao
+        casos = [
+            (erro("RateLimitError", code="insufficient_quota"), teteu.CotaEsgotada),
+            (erro("RateLimitError", response=mock.Mock(status_code=429, headers={"Retry-After": "7"})),
+             teteu.LimiteRequisicoes),
+            (erro("APIStatusError", status_code=503), teteu.ErroTemporario),
+            (erro("AuthenticationError"), teteu.ErroConfiguracao),
+            (erro("BadRequestError", status_code=400), teteu.ErroRequisicao),
+            (ImportError("No module named 'cohere'"), teteu.ErroConfiguracao),
+            (TimeoutError("lento"), teteu.ErroTemporario),
+        ]
+        for excecao, tipo in casos:
+            classificado = teteu.classificar_erro(excecao, "gpt")
+            self.assertIsInstance(classificado, tipo, excecao)
+            self.assertEqual(classificado.provedor, "gpt")
+        self.assertEqual(teteu.classificar_erro(casos[1][0], "gpt").espera, 7)
+
+    def _medir(self, roteador, nome, segundos, vezes=5):
+        for _ in range(vezes):
+            roteador._registrar_resultado(nome, time.monotonic() - segundos)
+
+    def test_mais_rapido_medido_ganha_do_preferido(self):
+        roteador = teteu.Roteador([self.Falso("gpt"), self.Falso("cohere")])
+        self._medir(roteador, "gpt", 2.0)
+        self._medir(roteador, "cohere", 0.5, vezes=4)
+        self.assertEqual([p.nome for p in roteador.candidatos()], ["gpt", "cohere"])  # cohere ainda sem medição
+        self._medir(roteador, "cohere", 0.5, vezes=1)
+        self.assertEqual([p.nome for p in roteador.candidatos()], ["cohere", "gpt"])
+        self.assertEqual(roteador.gerar("oi")[0], "cohere")
+        preferencia = teteu.Roteador([self.Falso("gpt"), self.Falso("cohere")], criterio="preferencia")
+        self._medir(preferencia, "gpt", 2.0)
+        self._medir(preferencia, "cohere", 0.5)
+        self.assertEqual([p.nome for p in preferencia.candidatos()], ["gpt", "cohere"])
+        with self.assertRaises(ValueError):
+            teteu.Roteador(criterio="barato")
+
+    def test_sem_medicao_segue_a_ordem_e_rebaixa_quem_erra(self):
+        gpt, cohere = self.Falso("gpt", atraso=0.02), self.Falso("cohere")
+        roteador = teteu.Roteador([gpt, cohere])
+        for _ in range(3):
+            self.assertEqual(roteador.gerar("oi")[0], "gpt")   # poucas medições: vale a ordem configurada
+        self.assertEqual(cohere.chamadas, 0)
+        self.assertEqual([p.nome for p in roteador.candidatos(("cohere", "gpt"))], ["cohere", "gpt"])
+        # Erros intermitentes (sem abrir o circuito) acima da taxa máxima mandam o preferido para trás
+        falha = teteu.ErroTemporario("t", "gpt")
+        for erro in [falha, falha, None, falha, falha, None, falha, falha]:
+            roteador._registrar_resultado("gpt", time.monotonic(), erro)
+        self.assertEqual(roteador.estado()["gpt"]["estado"], "fechado")
+        self.assertEqual([p.nome for p in roteador.candidatos()], ["cohere", "gpt"])
+        self.assertEqual(roteador.gerar("oi"), ("cohere", "cohere: oi"))
+        # Passada a janela de tempo, as falhas antigas deixam de contar e o preferido volta
+        with mock.patch.object(teteu, "ROTEADOR_JANELA_SEGUNDOS", -1):
+            self.assertEqual([p.nome for p in roteador.candidatos()], ["gpt", "cohere"])
+
+    def test_circuito_abre_pula_sem_chamar_e_testa_de_novo(self):
+        caido = self.Falso("caido", erros=[TimeoutError("t")] * 3)
+        reserva = self.Falso("reserva", atraso=0.01)
+        roteador = teteu.Roteador([caido, reserva], limite_falhas=3, espera=0.1)
+        for _ in range(3):
+            with self.assertRaises(teteu.ErroTemporario):
+                roteador.chamar("caido", "oi")
+        self.assertEqual(roteador.estado()["caido"]["estado"], "aberto")
+        self.assertEqual(roteador.estado()["caido"]["taxa_erro"], 1.0)
+        self.assertEqual(roteador.gerar("oi", nomes=("caido", "reserva"))[0], "reserva")
+        self.assertEqual(caido.chamadas, 3)
+        with self.assertRaises(teteu.CircuitoAberto):
+            roteador.chamar("caido", "oi")
+        time.sleep(0.12)
+        self.assertEqual(roteador.estado()["caido"]["estado"], "meio_aberto")
+        self.assertEqual(roteador.chamar("caido", "oi"), "caido: oi")
+        self.assertEqual(roteador.estado()["caido"]["estado"], "fechado")
+
+    def test_cota_abre_na_primeira_falha_e_pedido_invalido_nao_troca(self):
+        sem_cota = self.Falso("gpt", erros=[teteu.CotaEsgotada("acabou", espera=60)])
+        reserva = self.Falso("cohere")
+        roteador = teteu.Roteador([sem_cota, reserva])
+        self.assertEqual(roteador.gerar("oi")[0], "cohere")
+        self.assertEqual(roteador.estado()["gpt"]["estado"], "aberto")
+        invalido = self.Falso("a", erros=[teteu.ErroRequisicao("contexto grande demais")])
+        outro = self.Falso("b")
+        roteador = teteu.Roteador([invalido, outro])
+        with self.assertRaises(teteu.ErroRequisicao):
+            roteador.gerar("oi")
+        self.assertEqual((outro.chamadas, roteador.estado()["a"]["estado"]), (0, "fechado"))
+
+    def test_stream_troca_so_antes_do_primeiro_pedaco(self):
+        falha_cedo = self.Falso("a", erros=[ConnectionError("caiu")])
+        roteador = teteu.Roteador([falha_cedo, self.Falso("b", pedacos=["x", "y"])])
+        self.assertEqual(list(roteador.gerar_stream("oi")), [("b", "x"), ("b", "y")])
+        roteador = teteu.Roteador([self.Falso("a", pedacos=["x", ConnectionError("caiu")]), self.Falso("b")])
+        pedacos = roteador.gerar_stream("oi")
+        self.assertEqual(next(pedacos), ("a", "x"))
+        with self.assertRaises(teteu.ErroTemporario):
+            next(pedacos)
+
+    def test_sem_provedor_e_async(self):
+        import asyncio
+        roteador = teteu.Roteador([self.Falso("a", erros=[TimeoutError()]), self.Falso("b", erros=[TimeoutError()])])
+        with self.assertRaises(teteu.SemProvedorDisponivel):
+            roteador.gerar("oi")
+        roteador = teteu.Roteador([self.Falso("a")])
+        self.assertEqual(asyncio.run(roteador.gerar_async("oi")), ("a", "a: oi"))
+        self.assertEqual(asyncio.run(roteador.provedores["a"].gerar_async("oi")), "a: oi")
+
+    def test_perguntar_ao_gpt_cai_para_outro_provedor(self):
+        teteu.limpar_cache()
+        cliente = mock.Mock()
+        cliente.chat.completions.create.side_effect = TimeoutError("openai fora do ar")
+        reserva = self.Falso("cohere", idioma="en")
+        roteador = teteu.Roteador([teteu.ProvedorOpenAI(), reserva])
+        with mock.patch.object(teteu, "client", cliente), mock.patch.object(teteu, "roteador", roteador), \
+                mock.patch.object(teteu, "montar_mensagens", return_value=[]), \
+                mock.patch.object(teteu, "traduzir_para_ingles", return_value="hi"):
+            self.assertEqual(teteu.perguntar_ao_gpt("oi", provedores=("gpt", "cohere")), "cohere: hi")
+            self.assertEqual(teteu.perguntar_ao_gpt("oi", provedores=("gpt",)),
+                             "Erro ao acessar OpenAI: openai fora do ar")
+            self.assertEqual(teteu.cache_stats["misses"], 2)
+
+    def test_mensagem_de_cota_e_circuito_aberto_responde_na_hora(self):
+        cliente = mock.Mock()
+        erro = type("RateLimitError", (Exception,), {})("Error code: 429 - insufficient_quota")
+        cliente.chat.completions.create.side_effect = erro
+        roteador = teteu.Roteador([teteu.ProvedorOpenAI(), self.Falso("cohere", atraso=0.2, erros=[TimeoutError()])],
+                                  limite_falhas=1, espera=60)
+        with mock.patch.object(teteu, "client", cliente), mock.patch.object(teteu, "roteador", roteador), \
+                mock.patch.object(teteu, "montar_mensagens", return_value=[]):
+            resposta = teteu.perguntar_ao_gpt("oi", usar_cache=False, provedores=("gpt",))
+            self.assertTrue(resposta.startswith("⚠️ Sua cota da OpenAI acabou"))
+            teteu.perguntar_ao_cohere("hi")
+            inicio = time.monotonic()
+            resposta = teteu.perguntar_ao_cohere("hi")
+        self.assertLess(time.monotonic() - inicio, 0.1)
+        self.assertIn("circuito aberto", resposta)
+        with mock.patch.object(teteu, "roteador", roteador):
+            self.assertIn("cohere: aberto", teteu.COMANDOS["provedores"].chamar(""))
+
+class TestLimitadorTaxa(unittest.TestCase):
+    def test_segura_pedidos_por_minuto_sem_falhar(self):
+        limitador = teteu.LimitadorTaxa(rpm=600, margem=1, rajada=0.1)    # 10/s, saldo de 1
+        inicio = time.monotonic()
+        for _ in range(5):
+            limitador.reservar()
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.35)
+        self.assertEqual(limitador.stats["reservas"], 5)
+
+    def test_tokens_devolvidos_liberam_a_fila(self):
+        limitador = teteu.LimitadorTaxa(tpm=60, margem=1, rajada=100)      # 1 token/s, balde de 100
+        reservados = limitador.reservar(100)
+        limitador.ajustar(reservados, 10)
+        inicio = time.monotonic()
+        limitador.reservar(90)
+        self.assertLess(time.monotonic() - inicio, 0.1)
+        cheio = teteu.LimitadorTaxa(tpm=60, margem=1, rajada=100)
+        self.assertEqual(cheio.reservar(10 ** 6), 100)   # maior que o balde: reserva o balde inteiro
+
+    def test_faixa_interativa_passa_na_frente_do_lote(self):
+        limitador = teteu.LimitadorTaxa(rpm=120, margem=1, rajada=0.1)     # 2/s, saldo de 1
+        limitador.reservar()
+        ordem = []
+
+        def pedir(faixa):
+            with teteu.prioridade_ia(faixa):
+                limitador.reservar()
+            ordem.append(faixa)
+        lote = threading.Thread(target=pedir, args=("lote",))
+        lote.start()
+        time.sleep(0.05)
+        interativo = threading.Thread(target=pedir, args=("interativo",))
+        interativo.start()
+        lote.join(5)
+        interativo.join(5)
+        self.assertEqual(ordem, ["interativo", "lote"])
+        with self.assertRaises(ValueError):
+            with teteu.prioridade_ia("urgente"):
+                pass
+
+    def test_pausa_depois_de_429(self):
+        limitador = teteu.LimitadorTaxa()
+        limitador.pausar(0.15)
+        inicio = time.monotonic()
+        limitador.reservar()
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.14)
+
+    def test_limites_do_ambiente(self):
+        with mock.patch.dict(os.environ, {"TETEU_LIMITE_GPT": "3500/90000"}):
+            self.assertEqual(teteu.limites_ia("gpt"), (3500, 90000))
+        self.assertEqual(teteu.limites_ia("desconhecido"), (0, 0))
+
+    def test_roteador_espera_o_429_curto_e_tenta_de_novo(self):
+        provedor = TestRoteador.Falso("a", erros=[teteu.LimiteRequisicoes("devagar", espera=0.1)])
+        roteador = teteu.Roteador([provedor])
+        inicio = time.monotonic()
+        self.assertEqual(roteador.chamar("a", "oi"), "a: oi")
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.09)
+        self.assertEqual((provedor.chamadas, roteador.estado()["a"]["estado"]), (2, "fechado"))
+        longo = TestRoteador.Falso("b", erros=[teteu.LimiteRequisicoes("amanhã", espera=3600)])
+        roteador = teteu.Roteador([longo, TestRoteador.Falso("c")])
+        self.assertEqual(roteador.gerar("oi")[0], "c")
+        self.assertEqual(roteador.estado()["b"]["estado"], "aberto")
+
+    def test_lote_usa_a_faixa_lote(self):
+        faixas = []
+
+        def gpt(prompt, stream=False, **kwargs):
+            faixas.append(teteu._prioridade_ia.get())
+            return iter(["ok"])
+        with mock.patch.object(teteu, "perguntar_ao_gpt", side_effect=gpt), \
+             mock.patch.object(teteu, "salvar_no_historico"), mock.patch("builtins.print"):
+            teteu.processar_lote(io.StringIO('"explica x"\n'), io.StringIO())
+            teteu.despachar("resuma y &").result(5)
+            teteu.despachar("explica z")
+        self.assertEqual(faixas, ["lote", "fundo", "interativo"])
+
+class TestCacheRespostas(unittest.TestCase):
+    def setUp(self):
+        teteu.limpar_cache()
+        resposta = mock.Mock()
+        resposta.choices = [mock.Mock(message=mock.Mock(content=" resposta em cache "))]
+        self.cliente = mock.Mock()
+        self.cliente.chat.completions.create.return_value = resposta
+
+    def test_segunda_chamada_vem_do_cache(self):
+        with mock.patch.object(teteu, "client", self.cliente), \
+                mock.patch.object(teteu, "montar_mensagens", return_value=[{"role": "user", "content": "pandas"}]):
+            primeira = teteu.perguntar_ao_gpt("pandas")
+            segunda = teteu.perguntar_ao_gpt("pandas")
+        self.assertEqual(primeira, segunda)
+        self.assertEqual(self.cliente.chat.completions.create.call_count, 1)
+        self.assertEqual(teteu.cache_stats, {"hits": 1, "misses": 1})
+
+    def test_comando_repetido_acerta_mesmo_com_historico_novo(self):
+        # Cada resposta salva entra no contexto da próxima chamada
+        contextos = iter([
+            [{"role": "user", "content": "pandas"}],
+            [{"role": "user", "content": "biblioteca pandas"}, {"role": "assistant", "content": "resposta em cache"},
+             {"role": "user", "content": "pandas"}],
+        ])
+        with mock.patch.object(teteu, "client", self.cliente), \
+                mock.patch.object(teteu, "montar_mensagens", side_effect=lambda *a: next(contextos)):
+            primeira = teteu.explicar_biblioteca("pandas")
+            segunda = teteu.explicar_biblioteca("pandas")
+        self.assertEqual(primeira, segunda)
+        self.assertEqual(self.cliente.chat.completions.create.call_count, 1)
+
+    def test_pergunta_livre_depende_do_contexto(self):
+        contextos = iter([[], [{"role": "user", "content": "o que é uma lista?"}]])
+        with mock.patch.object(teteu, "client", self.cliente), \
+                mock.patch.object(teteu, "montar_mensagens", side_effect=lambda *a: next(contextos)):
+            teteu.perguntar_ao_gpt("e o segundo?", cache_com_contexto=True)
+            teteu.perguntar_ao_gpt("e o segundo?", cache_com_contexto=True)
+        self.assertEqual(self.cliente.chat.completions.create.call_count, 2)
+
+    def test_bypass_sempre_chama_a_api(self):
+        with mock.patch.object(teteu, "client", self.cliente), \
+                mock.patch.object(teteu, "montar_mensagens", return_value=[]):
+            teteu.perguntar_ao_gpt("quiz", usar_cache=False)
+            teteu.perguntar_ao_gpt("quiz", usar_cache=False)
+        self.assertEqual(self.cliente.chat.completions.create.call_count, 2)
+
+    def test_ttl_expirado_conta_como_miss(self):
+        chave = teteu.chave_cache("gpt-3.5-turbo", [], 0.7, 1500)
+        teteu.gravar_cache(chave, "velha")
+        with mock.patch.object(teteu, "CACHE_TTL", -1):
+            self.assertIsNone(teteu.ler_cache(chave))
+
+class TestStreaming(unittest.TestCase):
+    def _evento(self, texto):
+        return mock.Mock(choices=[mock.Mock(delta=mock.Mock(content=texto))])
+
+    def test_stream_entrega_pedacos_e_grava_historico(self):
+        teteu.limpar_cache()
+        cliente = mock.Mock()
+        cliente.chat.completions.create.return_value = iter(
+            [self._evento("  Olá"), self._evento(None), self._evento(", mundo!")]
+        )
+        with mock.patch.object(teteu, "client", cliente), \
+                mock.patch.object(teteu, "montar_mensagens", return_value=[]), \
+                mock.patch.object(teteu, "salvar_no_historico") as salvar, \
+                mock.patch("builtins.print"):
+            pedacos = teteu.explicar_codigo("print(1)", stream=True)
+            resposta = teteu.imprimir_stream("explica print(1)", pedacos)
+        self.assertEqual(resposta, "Olá, mundo!")
+        salvar.assert_called_once_with("explica print(1)", "Olá, mundo!", modelo=teteu.modelo_gpt, latencia_ms=mock.ANY)
+        self.assertTrue(cliente.chat.completions.create.call_args.kwargs["stream"])
+
+class TestBuscaHistorico(unittest.TestCase):
+    def setUp(self):
+        for i in range(3):
+            teteu.salvar_no_historico(f"explica zibelina{i}", f"Resposta sobre zibelinas número {i}")
+        teteu.salvar_no_historico("explica outro", "zibelina zibelina zibelina")
+
+    def tearDown(self):
+        teteu.descarregar_escritas()
+        teteu.banco.executar("DELETE FROM historico WHERE resposta LIKE '%zibelina%'")
+
+    def test_busca_por_prefixo_com_destaque(self):
+        resultados, tem_mais = teteu.pesquisar_historico("zibel")
+        self.assertEqual(len(resultados), 4)
+        self.assertFalse(tem_mais)
+        self.assertTrue(any("«" in r[2] for r in resultados))
+
+    def test_ranking_bm25(self):
+        resultados, _ = teteu.pesquisar_historico("zibelina")
+        self.assertEqual(resultados[0][2].count("«zibelina»"), 3)
+
+    def test_paginacao(self):
+        primeira, tem_mais = teteu.pesquisar_historico("zibelina", pagina=1, por_pagina=3)
+        segunda, _ = teteu.pesquisar_historico("zibelina", pagina=2, por_pagina=3)
+        self.assertTrue(tem_mais)
+        self.assertEqual(len(primeira) + len(segunda), 4)
+        self.assertFalse({r[0] for r in primeira} & {r[0] for r in segunda})
+
+    def test_indice_acompanha_remocao(self):
+        self.tearDown()
+        resultados, _ = teteu.pesquisar_historico("zibelina")
+        self.assertEqual(resultados, [])
+
+class TestContextoPorTokens(unittest.TestCase):
+    def setUp(self):
+        self.banco = teteu.GerenciadorConexoes(":memory:")
+        self.con = self.banco.conexao()
+        self.con.execute("CREATE TABLE historico (id INTEGER PRIMARY KEY AUTOINCREMENT, comando TEXT, resposta TEXT, tokens INTEGER)")
+        self.con.executemany("INSERT INTO historico (comando, resposta) VALUES (?, ?)", [
+            ("antigo", "palavra " * 50),
+            ("enorme", "palavra " * 5000),
+            ("recente 1", "curta"),
+            ("recente 2", "curta"),
+        ])
+        self.patches = [mock.patch.object(teteu, "banco", self.banco)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.banco.fechar()
+
+    def test_respeita_orcamento_e_trunca_turno_grande(self):
+        contexto = teteu.obter_contexto(orcamento=500)
+        self.assertEqual([c for c, _ in contexto], ["enorme", "recente 1", "recente 2"])
+        self.assertTrue(contexto[0][1].endswith("[…]"))
+        total = sum(teteu.tokens_do_turno(c, r) for c, r in contexto)
+        self.assertLessEqual(total, 500)
+
+    def test_orcamento_folgado_inclui_tudo(self):
+        self.assertEqual(len(teteu.obter_contexto(orcamento=100000)), 4)
+
+    def test_memoriza_tokens_no_banco(self):
+        teteu.obter_contexto(orcamento=100000)
+        pendentes = self.con.execute("SELECT COUNT(*) FROM historico WHERE tokens IS NULL").fetchone()[0]
+        self.assertEqual(pendentes, 0)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+@unittest.skipIf(numpy is None, "numpy não instalado")
+class TestContextoSemantico(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.banco = teteu.GerenciadorConexoes(":memory:")
+        self.con = self.banco.conexao()
+        self.con.execute("CREATE TABLE historico (id INTEGER PRIMARY KEY AUTOINCREMENT, comando TEXT, resposta TEXT, tokens INTEGER)")
+        self.con.executemany("INSERT INTO historico (comando, resposta) VALUES (?, ?)", [
+            ("biblioteca pandas", "pandas serve para manipular DataFrames e tabelas"),
+            ("explica for", "o laço for percorre listas e iteráveis"),
+            ("erro NameError", "NameError aparece quando a variável não foi definida"),
+        ])
+        self.patches = [
+            mock.patch.object(teteu, "banco", self.banco),
+            mock.patch.object(teteu, "ARQUIVO_VETORES", os.path.join(self.pasta.name, "v.f32")),
+            mock.patch.object(teteu, "ARQUIVO_IDS_VETORES", os.path.join(self.pasta.name, "v.ids")),
+            mock.patch.object(teteu, "_indice_mapeado", None),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.banco.fechar()
+        self.pasta.cleanup()
+
+    def test_escolhe_turno_parecido(self):
+        contexto = teteu.recuperar_contexto_semantico("como filtrar um DataFrame do pandas?", k=1)
+        self.assertEqual(contexto[0][0], "biblioteca pandas")
+
+    def test_indexacao_incremental(self):
+        self.assertEqual(teteu.indexar_historico(), 3)
+        self.assertEqual(teteu.indexar_historico(), 0)
+        self.con.execute("INSERT INTO historico (comando, resposta) VALUES ('explica while', 'o laço while repete')")
+        self.assertEqual(teteu.indexar_historico(), 1)
+        self.assertEqual(os.path.getsize(teteu.ARQUIVO_IDS_VETORES), 4 * 8)
+
+class TestAnalisarCodigo(unittest.TestCase):
+    @unittest.skipUnless(importlib.util.find_spec("flake8"), "flake8 não instalado")
+    def test_relatorio_mantem_formato(self):
+        relatorio = teteu.analisar_codigo("import os\nx=1\n")
+        self.assertIn("⚠️ Flake8 encontrou problemas:", relatorio)
+        self.assertIn("F401", relatorio)
+        self.assertEqual(relatorio.count("\n\n"), 3)
+        self.assertFalse(os.path.exists("temp_code.py"))
+
+    @unittest.skipUnless(importlib.util.find_spec("flake8"), "flake8 não instalado")
+    def test_worker_reaproveitado_nao_mistura_codigos(self):
+        teteu.analisar_codigo("import os\n")
+        relatorio = teteu.analisar_codigo("x = 1\n")
+        self.assertIn("✅ Flake8: Nenhum problema encontrado.", relatorio)
+
+    def test_worker_travado_nao_derruba_outras_analises(self):
+        from concurrent.futures import Future
+        travada, alheia = Future(), Future()
+        processo = mock.Mock()
+        pool = mock.Mock(_processes={1: processo})
+        pool.submit.side_effect = [alheia, travada]
+        with mock.patch.object(teteu, "_pool_linters", pool), mock.patch.object(teteu, "TEMPO_LIMITE_LINT", 0.2), \
+                mock.patch.object(teteu, "_linter_por_subprocesso", return_value="via executável"):
+            teteu._enviar_linter(pool, "flake8", "x = 1\n")     # análise de outro usuário, ainda rodando
+            self.assertEqual(teteu._rodar_linters(["mypy"], "y = 2\n"), {"mypy": "via executável"})
+            self.assertIsNone(teteu._pool_linters)
+            time.sleep(0.05)
+            processo.terminate.assert_not_called()
+            alheia.set_result("ok")
+            time.sleep(0.4)
+        self.assertEqual(alheia.result(), "ok")
+        processo.terminate.assert_called_once()
+        pool.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+class TestCacheAnalises(unittest.TestCase):
+    def setUp(self):
+        teteu.banco.executar("DELETE FROM cache_analises")
+        teteu._cache_analises_memoria.clear()
+
+    def _saidas(self, ferramentas, codigo):
+        return {ferramenta: f"saida {ferramenta}" for ferramenta in ferramentas}
+
+    def test_reenvio_igual_nao_roda_linters(self):
+        with mock.patch.object(teteu, "_rodar_linters", side_effect=self._saidas) as rodar:
+            primeira = teteu.analisar_codigo("x = 1\n")
+            segunda = teteu.analisar_codigo("x = 1\n")
+        self.assertEqual(primeira, segunda)
+        self.assertEqual(rodar.call_count, 1)
+
+    def test_persistido_no_banco(self):
+        with mock.patch.object(teteu, "_rodar_linters", side_effect=self._saidas):
+            teteu.analisar_codigo("y = 2\n")
+        teteu._cache_analises_memoria.clear()
+        with mock.patch.object(teteu, "_rodar_linters", side_effect=self._saidas) as rodar:
+            teteu.analisar_codigo("y = 2\n")
+        rodar.assert_not_called()
+
+    def test_so_reroda_ferramenta_com_versao_nova(self):
+        with mock.patch.object(teteu, "_rodar_linters", side_effect=self._saidas):
+            teteu.analisar_codigo("z = 3\n")
+        original = teteu.assinatura_linter
+
+        def assinatura(ferramenta):
+            return "mypy-novo" if ferramenta == "mypy" else original(ferramenta)
+
+        with mock.patch.object(teteu, "assinatura_linter", side_effect=assinatura), \
+                mock.patch.object(teteu, "_rodar_linters", side_effect=self._saidas) as rodar:
+            teteu.analisar_codigo("z = 3\n")
+        rodar.assert_called_once_with(["mypy"], "z = 3\n")
+
+    def test_lru_em_memoria_aguenta_threads(self):
+        with mock.patch.object(teteu, "CACHE_ANALISES_MEMORIA", 8), \
+                mock.patch.object(teteu, "banco", mock.Mock(consultar_um=mock.Mock(return_value=None))):
+            def martelar(n):
+                for i in range(300):
+                    teteu._guardar_em_memoria(("flake8", f"{n}-{i % 20}"), "a", "saida")
+                    teteu.ler_cache_analise("flake8", f"{n}-{(i + 7) % 20}", "a")
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(martelar, range(8)))
+        self.assertLessEqual(len(teteu._cache_analises_memoria), 8)
+
+class TestArquivosTemporarios(unittest.TestCase):
+    def test_limpeza_so_remove_a_pasta_do_processo(self):
+        with tempfile.TemporaryDirectory() as outra_instancia:
+            arquivo_alheio = os.path.join(outra_instancia, "temp_code.py")
+            open(arquivo_alheio, "w").close()
+            pasta = teteu.pasta_privada()
+            self.assertTrue(os.path.isdir(pasta))
+            cwd = os.getcwd()
+            os.chdir(outra_instancia)
+            try:
+                teteu.limpar_arquivos_temporarios()
+            finally:
+                os.chdir(cwd)
+            self.assertFalse(os.path.exists(pasta))
+            self.assertTrue(os.path.exists(arquivo_alheio))
+
+    @unittest.skipUnless(shutil.which("flake8"), "flake8 não instalado")
+    def test_analises_simultaneas_nao_se_misturam(self):
+        codigos = {f"import modulo_{i}\n": f"modulo_{i}" for i in range(6)}
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            saidas = dict(zip(codigos, pool.map(lambda c: teteu._linter_por_subprocesso("flake8", c), codigos)))
+        for codigo, modulo in codigos.items():
+            self.assertIn(modulo, saidas[codigo])
+            self.assertEqual(saidas[codigo].count("F401"), 1)
+
+@unittest.skipUnless(hasattr(os, "fork"), "limites de recursos só em sistemas POSIX")
+class TestSandbox(unittest.TestCase):
+    def setUp(self):
+        self.pool = teteu.PoolSandbox(workers=1, reciclar_apos=3, cpu_limite=1, memoria_mb=64, saida_max=100)
+
+    def tearDown(self):
+        self.pool.encerrar()
+
+    def test_captura_print(self):
+        resultado = self.pool.executar("for i in range(3):\n    print(i)")
+        self.assertTrue(resultado["ok"])
+        self.assertEqual(resultado["stdout"], "0\n1\n2\n")
+
+    def test_laco_infinito_nao_trava_e_pool_se_recupera(self):
+        resultado = self.pool.executar("while True:\n    pass", tempo_limite=3)
+        self.assertFalse(resultado["ok"])
+        self.assertTrue(self.pool.executar("print('ok')")["ok"])
+
+    def test_limite_de_memoria(self):
+        resultado = self.pool.executar("x = [0] * (10 ** 9)")
+        self.assertFalse(resultado["ok"])
+        self.assertIn("memória", resultado["erro"])
+
+    def test_saida_cortada(self):
+        resultado = self.pool.executar("print('a' * 1000)")
+        self.assertTrue(resultado["cortada"])
+        self.assertEqual(len(resultado["stdout"]), 100)
+
+    def test_worker_reciclado(self):
+        pids = set()
+        for _ in range(4):
+            pids.add(self.pool._ociosos.queue[0].processo.pid)
+            self.pool.executar("x = 1")
+        self.assertEqual(len(pids), 2)
+
+    def test_import_bloqueado(self):
+        resultado = self.pool.executar("import os")
+        self.assertFalse(resultado["ok"])
+
+class TestCacheBytecode(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.patches = [
+            mock.patch.object(teteu, "PASTA_BYTECODE", self.pasta.name),
+            mock.patch.dict(teteu.bytecode_stats, {"hits": 0, "hits_disco": 0, "misses": 0, "tempo_economizado": 0.0}),
+        ]
+        for p in self.patches:
+            p.start()
+        teteu._cache_bytecode.clear()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        teteu._cache_bytecode.clear()
+        self.pasta.cleanup()
+
+    def test_compila_uma_vez(self):
+        with mock.patch.object(teteu, "_compilar_restrito", wraps=teteu._compilar_restrito) as compilar:
+            for _ in range(5):
+                teteu.compilar_com_cache("total = sum([1, 2, 3])")
+        self.assertEqual(compilar.call_count, 1)
+        self.assertEqual(teteu.bytecode_stats["hits"], 4)
+        self.assertGreater(teteu.bytecode_stats["tempo_economizado"], 0)
+
+    def test_reinicio_aproveita_o_disco(self):
+        primeiro = teteu.compilar_com_cache("x = 1")
+        teteu._cache_bytecode.clear()
+        with mock.patch.object(teteu, "_compilar_restrito") as compilar:
+            self.assertEqual(teteu.compilar_com_cache("x = 1"), primeiro)
+        compilar.assert_not_called()
+        self.assertEqual(teteu.bytecode_stats["hits_disco"], 1)
+
+    def test_codigo_invalido_nao_entra_no_cache(self):
+        with self.assertRaises(SyntaxError):
+            teteu.compilar_com_cache("def (:")
+        self.assertEqual(len(teteu._cache_bytecode), 0)
+
+    def test_entrada_adulterada_no_disco_e_descartada(self):
+        teteu.compilar_com_cache("x = 1")
+        teteu._cache_bytecode.clear()
+        arquivo = teteu._arquivo_bytecode(teteu._chave_do_codigo("x = 1"))
+        with open(arquivo, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            ultimo = f.read(1)[0]
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([ultimo ^ 0xFF]))
+        with mock.patch.object(teteu, "_compilar_restrito", wraps=teteu._compilar_restrito) as compilar:
+            teteu.compilar_com_cache("x = 1")
+        compilar.assert_called_once()
+        self.assertEqual(teteu.bytecode_stats["hits_disco"], 0)
+
+    def test_pasta_aberta_para_outros_nao_e_usada(self):
+        os.chmod(self.pasta.name, 0o755)
+        teteu._chave_hmac_bytecode.cache_clear()
+        self.addCleanup(teteu._chave_hmac_bytecode.cache_clear)
+        teteu.compilar_com_cache("x = 2")
+        self.assertEqual([n for n in os.listdir(self.pasta.name) if n.endswith(".marshal")], [])
+
+    def test_worker_descarta_bytecode_invalido(self):
+        chave = teteu._chave_do_codigo("x = 3")
+        teteu._cache_bytecode[chave] = (b"lixo", 0.0)
+        resultado = teteu._executar_no_worker(b"lixo", 1000)
+        self.assertTrue(resultado["bytecode_invalido"])
+        teteu.descartar_bytecode("x = 3")
+        self.assertNotIn(chave, teteu._cache_bytecode)
+
+class TestTransporteHTTP(unittest.TestCase):
+    def setUp(self):
+        teteu._espera_por_rota.clear()
+        self.addCleanup(teteu._espera_por_rota.clear)
+
+    def _resposta(self, status=200, corpo=None, cabecalhos=None):
+        resposta = mock.Mock(status_code=status, headers=cabecalhos or {})
+        resposta.json.return_value = corpo or {}
+        return resposta
+
+    def test_sessao_compartilhada(self):
+        self.addCleanup(teteu.encerrar_http)
+        sessao = teteu.sessao_http()
+        self.assertIs(sessao, teteu.sessao_http())
+        adaptador = sessao.get_adapter("https://api.stackexchange.com")
+        self.assertEqual(adaptador._pool_maxsize, teteu.HTTP_CONEXOES_POR_HOST)
+
+    def test_repete_com_retry_after(self):
+        sessao = mock.Mock()
+        sessao.request.side_effect = [self._resposta(503, cabecalhos={"Retry-After": "2"}), self._resposta(200)]
+        with mock.patch.object(teteu, "sessao_http", return_value=sessao), \
+             mock.patch.object(teteu.time, "sleep") as dormir:
+            resposta = teteu.requisicao_http("GET", "https://exemplo.test/api")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(sessao.request.call_count, 2)
+        self.assertEqual(sessao.request.call_args.kwargs["timeout"], teteu.HTTP_TIMEOUT)
+        # A segunda tentativa esperou o Retry-After (com alguma folga de relógio)
+        self.assertAlmostEqual(max(c.args[0] for c in dormir.call_args_list), 2, delta=0.1)
+
+    def test_repete_apos_falha_de_conexao(self):
+        import requests
+        sessao = mock.Mock()
+        sessao.request.side_effect = [requests.ConnectionError("reset"), self._resposta(200)]
+        with mock.patch.object(teteu, "sessao_http", return_value=sessao), \
+             mock.patch.object(teteu.time, "sleep"):
+            self.assertEqual(teteu.requisicao_http("GET", "https://exemplo.test/api").status_code, 200)
+
+    def test_desiste_apos_tentativas(self):
+        sessao = mock.Mock()
+        sessao.request.return_value = self._resposta(502)
+        with mock.patch.object(teteu, "sessao_http", return_value=sessao), \
+             mock.patch.object(teteu.time, "sleep"):
+            self.assertEqual(teteu.requisicao_http("GET", "https://exemplo.test/api").status_code, 502)
+        self.assertEqual(sessao.request.call_count, teteu.HTTP_TENTATIVAS)
+
+    def test_post_nao_repete_timeout_de_leitura_nem_5xx(self):
+        import requests
+        for efeito in (requests.ReadTimeout("lento"), self._resposta(503)):
+            sessao = mock.Mock()
+            sessao.request.side_effect = [efeito, self._resposta(200)]
+            with mock.patch.object(teteu, "sessao_http", return_value=sessao), \
+                 mock.patch.object(teteu.time, "sleep"):
+                if isinstance(efeito, Exception):
+                    with self.assertRaises(requests.ReadTimeout):
+                        teteu.requisicao_http("POST", "https://exemplo.test/modelo", json={})
+                else:
+                    self.assertEqual(teteu.requisicao_http("POST", "https://exemplo.test/modelo", json={}).status_code, 503)
+            self.assertEqual(sessao.request.call_count, 1)
+
+    def test_post_repete_quando_nem_conectou(self):
+        import requests
+        sessao = mock.Mock()
+        sessao.request.side_effect = [requests.ConnectTimeout("sem rota"), self._resposta(200)]
+        with mock.patch.object(teteu, "sessao_http", return_value=sessao), \
+             mock.patch.object(teteu.time, "sleep"):
+            self.assertEqual(teteu.requisicao_http("POST", "https://exemplo.test/modelo", json={}).status_code, 200)
+        self.assertEqual(sessao.request.call_count, 2)
+
+    def test_tentativas_respeitam_o_prazo_de_quem_chama(self):
+        relogio = [1000.0]
+        sessao = mock.Mock()
+
+        def pedido(*args, **kwargs):
+            relogio[0] += min(2, kwargs["timeout"][1])  # servidor lento: cada tentativa leva até 2 s
+            return self._resposta(503)
+        sessao.request.side_effect = pedido
+        with mock.patch.object(teteu, "sessao_http", return_value=sessao), \
+             mock.patch.object(teteu.time, "monotonic", side_effect=lambda: relogio[0]), \
+             mock.patch.object(teteu.time, "sleep", side_effect=lambda s: relogio.__setitem__(0, relogio[0] + s)):
+            resposta = teteu.requisicao_http("GET", "https://exemplo.test/api", tentativas=10, timeout=(1, 4))
+        self.assertEqual(resposta.status_code, 503)
+        # Conexão + leitura = 5 s para tudo, com no máximo a folga mínima de uma tentativa
+        self.assertLessEqual(relogio[0] - 1000.0, 5.5)
+        self.assertLess(sessao.request.call_count, 10)
+        # O timeout de leitura de cada tentativa encolhe para o que sobra do prazo
+        self.assertLess(sessao.request.call_args.kwargs["timeout"][1], 4)
+
+    def test_backoff_do_stackexchange(self):
+        sessao = mock.Mock()
+        sessao.request.return_value = self._resposta(corpo={"items": [{"title": "t", "link": "l"}], "backoff": 10})
+        with mock.patch.object(teteu, "sessao_http", return_value=sessao), \
+             mock.patch.object(teteu, "_ler_cache_stackoverflow", return_value=None), \
+             mock.patch.object(teteu, "_gravar_cache_stackoverflow"), \
+             mock.patch.object(teteu.time, "sleep") as dormir:
+            self.assertIn("Stack Overflow", teteu.buscar_stackoverflow("lista"))
+            dormir.assert_not_called()
+            teteu.buscar_stackoverflow("lista")
+        self.assertGreater(dormir.call_args.args[0], 9)
+
+    def test_cliente_cohere_reaproveitado(self):
+        with mock.patch.dict(os.environ, {"COHERE_API_KEY": "x"}):
+            self.assertIs(teteu.cliente_cohere(25), teteu.cliente_cohere(25))
+
+
+class TestCacheStackOverflow(unittest.TestCase):
+    # Servidor local no lugar da API do StackExchange: conta as requisições recebidas
+    def setUp(self):
+        import http.server
+        import json
+        self.requisicoes = []
+        teste = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                teste.requisicoes.append(self.path)
+                time.sleep(teste.atraso)
+                itens = [{"title": f"Resposta &quot;{i}&quot;", "link": f"https://so.test/{i}", "score": i} for i in range(3)]
+                corpo = json.dumps({"items": itens, "quota_remaining": 100}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.atraso = 0
+        self.servidor = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        self.addCleanup(self.servidor.server_close)
+        self.addCleanup(self.servidor.shutdown)
+        url = f"http://127.0.0.1:{self.servidor.server_port}/2.3"
+        for patch in (mock.patch.object(teteu, "STACKEXCHANGE_URL", url),
+                      mock.patch.dict(os.environ, {"NO_PROXY": "127.0.0.1", "no_proxy": "127.0.0.1"})):
+            patch.start()
+            self.addCleanup(patch.stop)
+        teteu.banco_cache.executar("DELETE FROM cache_stackoverflow")
+
+    def test_consulta_normalizada_e_proximo_vem_do_cache(self):
+        primeira = teteu.buscar_stackoverflow("Como ordenar   uma LISTA?")
+        self.assertIn('Resposta "0"', primeira)
+        self.assertIn("(1/3)", primeira)
+        self.assertIn("https://so.test/0", teteu.buscar_stackoverflow("como ordenar uma lista"))
+        self.assertIn("https://so.test/1", teteu.proximo_stackoverflow())
+        self.assertIn("https://so.test/2", teteu.proximo_stackoverflow())
+        self.assertIn("Não há mais resultados", teteu.proximo_stackoverflow())
+        self.assertEqual(len(self.requisicoes), 1)
+
+    def test_buscas_simultaneas_fazem_uma_requisicao(self):
+        self.atraso = 0.3
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            respostas = list(executor.map(teteu.buscar_stackoverflow, ["dicionário python"] * 8))
+        self.assertEqual(len(self.requisicoes), 1)
+        self.assertTrue(all("https://so.test/0" in r for r in respostas))
+
+    def test_expira_pelo_ttl(self):
+        teteu.buscar_stackoverflow("decoradores")
+        with mock.patch.object(teteu, "STACKOVERFLOW_TTL", -1):
+            teteu.buscar_stackoverflow("decoradores")
+        self.assertEqual(len(self.requisicoes), 2)
+
+    def test_consulta_nao_latina_tem_chave_propria(self):
+        self.assertEqual(teteu.normalizar_consulta("Как  ОТСОРТИРОВАТЬ список?"), "как отсортировать список")
+        self.assertNotEqual(teteu.normalizar_consulta("排序列表"), teteu.normalizar_consulta("字典"))
+        teteu.buscar_stackoverflow("Ordenação de LISTA")
+        self.assertIn("q=Ordena%C3%A7%C3%A3o+de+LISTA", self.requisicoes[0])
+
+
+class TestMemoriaTraducao(unittest.TestCase):
+    def setUp(self):
+        teteu.banco_cache.executar("DELETE FROM memoria_traducao")
+        teteu._memoria_traducao.clear()
+        for chave in teteu.traducao_stats:
+            teteu.traducao_stats[chave] = 0
+        self.chamadas = []
+
+    def _remoto(self, atraso=0.0):
+        def traduzir(textos, origem, destino, ao_traduzir=None):
+            self.chamadas.append(list(textos))
+            time.sleep(atraso)
+            traducoes = [f"{destino}:{texto}" for texto in textos]
+            if ao_traduzir:
+                ao_traduzir(list(textos), traducoes)
+            return traducoes
+        return mock.patch.object(teteu, "_traduzir_remoto", side_effect=traduzir)
+
+    def test_memoria_e_disco(self):
+        with self._remoto():
+            self.assertEqual(teteu.traduzir_para_ingles("olá mundo"), "en:olá mundo")
+            self.assertEqual(teteu.traduzir_para_ingles("olá mundo"), "en:olá mundo")
+            teteu._memoria_traducao.clear()
+            self.assertEqual(teteu.traduzir_para_ingles("olá mundo"), "en:olá mundo")
+        self.assertEqual(len(self.chamadas), 1)
+        estatisticas = teteu.estatisticas_traducao()
+        self.assertEqual((estatisticas["memoria"], estatisticas["disco"], estatisticas["misses"]), (1, 1, 1))
+        self.assertAlmostEqual(estatisticas["taxa_acerto"], 2 / 3)
+
+    def test_lote_so_traduz_o_que_falta(self):
+        with self._remoto():
+            teteu.traduzir("um")
+            resultado = teteu.traduzir_lote(["um", "dois", "três", "dois", ""])
+        self.assertEqual(resultado, ["en:um", "en:dois", "en:três", "en:dois", ""])
+        self.assertEqual(self.chamadas, [["um"], ["dois", "três"]])
+
+    def test_traducoes_simultaneas_sao_deduplicadas(self):
+        with self._remoto(atraso=0.3), ThreadPoolExecutor(max_workers=8) as executor:
+            resultados = list(executor.map(teteu.traduzir_para_ingles, ["mesmo texto"] * 8))
+        self.assertEqual(resultados, ["en:mesmo texto"] * 8)
+        self.assertEqual(len(self.chamadas), 1)
+
+    def test_falha_devolve_original_sem_guardar(self):
+        with mock.patch.object(teteu, "_traduzir_remoto", side_effect=RuntimeError("sem rede")):
+            self.assertEqual(teteu.traduzir_para_ingles("bom dia"), "bom dia")
+        with self._remoto():
+            self.assertEqual(teteu.traduzir_para_ingles("bom dia"), "en:bom dia")
+        self.assertEqual(teteu.traducao_stats["erros"], 1)
+
+    def test_lote_em_uma_requisicao(self):
+        tradutor = mock.Mock()
+        tradutor.translate.side_effect = lambda texto: texto.upper()
+        with mock.patch("deep_translator.GoogleTranslator", return_value=tradutor):
+            self.assertEqual(teteu._traduzir_remoto(["a", "b", "c"], "pt", "en"), ["A", "B", "C"])
+        self.assertEqual(tradutor.translate.call_count, 1)
+
+    def test_falha_num_grupo_preserva_os_anteriores(self):
+        tradutor = mock.Mock()
+        tradutor.translate.side_effect = [f"en:{'a' * 10}", RuntimeError("sem rede")]
+        with mock.patch("deep_translator.GoogleTranslator", return_value=tradutor), \
+             mock.patch.object(teteu, "TRADUCAO_LOTE_CARACTERES", 12):
+            self.assertEqual(teteu.traduzir_lote(["a" * 10, "b" * 10]), [f"en:{'a' * 10}", "b" * 10])
+        self.assertEqual(teteu._traducao_guardada(teteu._chave_traducao("a" * 10, "pt", "en")), f"en:{'a' * 10}")
+        self.assertEqual(teteu._traducoes_em_andamento, {})
+
+    def test_interrupcao_resolve_quem_espera(self):
+        comecou, liberar = threading.Event(), threading.Event()
+
+        def remoto(textos, origem, destino, ao_traduzir=None):
+            comecou.set()
+            liberar.wait(5)
+            raise KeyboardInterrupt
+
+        def interrompida():
+            with self.assertRaises(KeyboardInterrupt):
+                teteu.traduzir_para_ingles("bom dia")
+
+        with mock.patch.object(teteu, "_traduzir_remoto", side_effect=remoto):
+            dono = threading.Thread(target=interrompida)
+            dono.start()
+            comecou.wait(5)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                espera = executor.submit(teteu.traduzir_para_ingles, "bom dia")
+                time.sleep(0.05)
+                liberar.set()
+                with self.assertRaises(RuntimeError):
+                    espera.result(timeout=5)
+            dono.join(5)
+        self.assertEqual(teteu._traducoes_em_andamento, {})
+
+
+class TestExportacao(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.banco = teteu.GerenciadorConexoes(":memory:")
+        self.addCleanup(self.banco.fechar)
+        self.con = self.banco.conexao()
+        teteu.aplicar_migracoes(self.con)
+        self._inserir(1, 25)
+        for p in (mock.patch.object(teteu, "banco", self.banco), mock.patch.object(teteu, "EXPORTACAO_LOTE", 4)):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _inserir(self, inicio, fim):
+        self.con.executemany("INSERT INTO historico (comando, resposta, criado_em) VALUES (?, ?, ?)",
+                             [(f"comando {i}", f"resposta {i} — ção", i * 1000) for i in range(inicio, fim + 1)])
+
+    def _caminho(self, nome):
+        return os.path.join(self.pasta.name, nome)
+
+    def _ids_jsonl(self, caminho):
+        import json
+        with open(caminho, encoding="utf-8") as f:
+            return [json.loads(linha)["id"] for linha in f]
+
+    def test_jsonl_com_filtro_de_ids(self):
+        caminho = self._caminho("h.jsonl")
+        self.assertEqual(teteu.exportar(caminho, id_inicio=5, id_fim=9), 5)
+        self.assertEqual(self._ids_jsonl(caminho), [5, 6, 7, 8, 9])
+
+    def test_filtro_por_data(self):
+        import datetime
+        caminho = self._caminho("h.jsonl")
+        fim = datetime.datetime.fromtimestamp(12000)
+        self.assertEqual(teteu.exportar(caminho, data_inicio=10000, data_fim=fim), 2)
+        self.assertEqual(self._ids_jsonl(caminho), [10, 11])
+
+    def test_incremental_acrescenta_so_o_novo(self):
+        caminho = self._caminho("h.ndjson")
+        self.assertEqual(teteu.exportar(caminho, incremental=True), 25)
+        self.assertEqual(teteu.exportar(caminho, incremental=True), 0)
+        self._inserir(26, 30)
+        self.assertEqual(teteu.exportar(caminho, incremental=True), 5)
+        self.assertEqual(self._ids_jsonl(caminho), list(range(1, 31)))
+
+    def test_lido_em_lotes(self):
+        cursor = mock.MagicMock()
+        cursor.fetchmany.side_effect = [[(1, "a", "b")] * 4, [(2, "c", "d")], []]
+        with mock.patch.object(teteu, "banco") as banco:
+            banco.executar.return_value = cursor
+            self.assertEqual(len(list(teteu.iterar_historico())), 5)
+        cursor.fetchall.assert_not_called()
+        cursor.fetchmany.assert_called_with(4)
+
+    def test_txt(self):
+        caminho = self._caminho("h.txt")
+        teteu.exportar_historico(caminho, id_fim=2)
+        with open(caminho, encoding="utf-8") as f:
+            self.assertEqual(f.read().count("ID: "), 2)
+
+    @unittest.skipIf(importlib.util.find_spec("nbformat") is None, "nbformat não instalado")
+    def test_notebook_valido(self):
+        import nbformat
+        caminho = self._caminho("h.ipynb")
+        teteu.exportar_para_notebook(caminho)
+        nb = nbformat.read(caminho, as_version=4)
+        nbformat.validate(nb)
+        self.assertEqual(len(nb.cells), 25)
+        self.assertIn("resposta 25 — ção", nb.cells[-1].source)
+
+    @unittest.skipIf(importlib.util.find_spec("nbformat") is None, "nbformat não instalado")
+    def test_notebook_incremental_mantem_celulas_antigas(self):
+        import nbformat
+        caminho = self._caminho("h.ipynb")
+        self.assertEqual(teteu.exportar(caminho, incremental=True), 25)
+        self._inserir(26, 27)
+        # O notebook antigo é copiado em blocos, nunca carregado inteiro
+        with mock.patch.object(teteu.json, "load", side_effect=AssertionError("notebook lido inteiro")):
+            self.assertEqual(teteu.exportar(caminho, incremental=True), 2)
+        nb = nbformat.read(caminho, as_version=4)
+        nbformat.validate(nb)
+        self.assertEqual(len(nb.cells), 27)
+        self.assertIn("comando 1`", nb.cells[0].source)
+        self.assertIn("comando 27`", nb.cells[-1].source)
+        self.assertEqual(os.listdir(self.pasta.name), ["h.ipynb"])
+
+    def test_exportacao_filtrada_nao_avanca_o_incremental(self):
+        caminho = self._caminho("h.jsonl")
+        self.assertEqual(teteu.exportar(caminho, id_inicio=20), 6)
+        os.remove(caminho)
+        self.assertEqual(teteu.exportar(caminho, incremental=True), 25)
+        self.assertEqual(self._ids_jsonl(caminho), list(range(1, 26)))
+
+    def test_exportacao_vazia_nao_apaga_o_arquivo(self):
+        caminho = self._caminho("h.jsonl")
+        teteu.exportar(caminho)
+        self.assertEqual(teteu.exportar(caminho, id_inicio=100), 0)
+        self.assertEqual(len(self._ids_jsonl(caminho)), 25)
+        self.assertEqual(teteu.exportar(self._caminho("nada.jsonl"), id_inicio=100), 0)
+        self.assertFalse(os.path.exists(self._caminho("nada.jsonl")))
+
+
+class TestMigracoes(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.caminho = os.path.join(self.pasta.name, "antigo.db")
+        # Banco no formato anterior às migrações
+        con = sqlite3.connect(self.caminho)
+        con.execute("CREATE TABLE historico (id INTEGER PRIMARY KEY AUTOINCREMENT, comando TEXT, resposta TEXT)")
+        con.execute("CREATE TABLE ranking (nome TEXT PRIMARY KEY, pontos INTEGER DEFAULT 0, quizzes INTEGER DEFAULT 0)")
+        con.execute("INSERT INTO historico (comando, resposta) VALUES ('oi', 'olá')")
+        con.commit()
+        con.close()
+        self.con = teteu.configurar_conexao(sqlite3.connect(self.caminho))
+        self.addCleanup(self.con.close)
+
+    def test_atualiza_banco_antigo(self):
+        self.assertEqual(teteu.aplicar_migracoes(self.con), len(teteu.MIGRACOES))
+        colunas = teteu._colunas(self.con.cursor(), "historico")
+        for coluna in ("tokens", "criado_em", "usuario", "modelo", "latencia_ms"):
+            self.assertIn(coluna, colunas)
+        self.assertEqual(self.con.execute("SELECT comando, resposta FROM historico").fetchall(), [("oi", "olá")])
+        # Rodar de novo não faz nada
+        self.assertEqual(teteu.aplicar_migracoes(self.con), len(teteu.MIGRACOES))
+
+    def test_consulta_por_periodo_usa_indice(self):
+        teteu.aplicar_migracoes(self.con)
+        plano = " ".join(str(linha) for linha in self.con.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM historico WHERE criado_em >= ? AND criado_em < ?", (0, 1)))
+        self.assertIn("idx_historico_criado_em", plano)
+
+    def test_pragmas(self):
+        self.assertEqual(self.con.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(self.con.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+
+    def test_migracao_com_erro_e_desfeita(self):
+        def quebrada(cur):
+            cur.execute("CREATE TABLE temporaria (x)")
+            raise RuntimeError("falhou")
+        with mock.patch.object(teteu, "MIGRACOES", teteu.MIGRACOES + [quebrada]):
+            with self.assertRaises(RuntimeError):
+                teteu.aplicar_migracoes(self.con)
+        self.assertEqual(teteu.versao_esquema(self.con), len(teteu.MIGRACOES))
+        self.assertIsNone(self.con.execute("SELECT 1 FROM sqlite_master WHERE name = 'temporaria'").fetchone())
+
+
+class TestGerenciadorConexoes(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.banco = teteu.GerenciadorConexoes(os.path.join(self.pasta.name, "t.db"))
+        self.addCleanup(self.banco.fechar)
+        self.banco.executar("CREATE TABLE t (x INTEGER)")
+
+    def test_conexao_por_thread(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            conexoes = set(executor.map(lambda _: id(self.banco.conexao()), range(4)))
+        self.assertNotIn(id(self.banco.conexao()), conexoes)
+
+    def test_conexao_fechada_quando_a_thread_termina(self):
+        guardadas = []
+        for _ in range(5):
+            thread = threading.Thread(target=lambda: guardadas.append(self.banco.conexao()))
+            thread.start()
+            thread.join()
+        self.assertEqual(len(self.banco._conexoes), 1)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            guardadas[0].execute("SELECT 1")
+
+    def test_escritas_concorrentes(self):
+        def escrever(i):
+            for j in range(25):
+                self.banco.executar("INSERT INTO t VALUES (?)", (i * 100 + j,))
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(escrever, range(8)))
+        self.assertEqual(self.banco.consultar_um("SELECT COUNT(*) FROM t")[0], 200)
+
+    def test_transacao_desfeita_em_erro(self):
+        with self.assertRaises(ValueError):
+            with self.banco.transacao() as conexao:
+                conexao.execute("INSERT INTO t VALUES (1)")
+                with self.banco.transacao() as interna:
+                    interna.execute("INSERT INTO t VALUES (2)")
+                raise ValueError
+        self.assertEqual(self.banco.consultar("SELECT x FROM t"), [])
+        with self.banco.transacao() as conexao:
+            conexao.execute("INSERT INTO t VALUES (3)")
+        self.assertEqual(self.banco.consultar("SELECT x FROM t"), [(3,)])
+
+    def test_escrita_em_lote(self):
+        self.assertEqual(self.banco.executar_lote("INSERT INTO t VALUES (?)", ((i,) for i in range(10)), tamanho=3), 10)
+        self.assertEqual(self.banco.consultar_um("SELECT SUM(x) FROM t")[0], 45)
+
+    def test_fachada_assincrona(self):
+        import asyncio
+
+        async def principal():
+            await self.banco.executar_lote_async("INSERT INTO t VALUES (?)", [(1,), (2,)])
+            thread = await self.banco.assincrono(threading.get_ident)
+            return await self.banco.consultar_async("SELECT x FROM t ORDER BY x"), thread
+
+        linhas, thread = asyncio.run(principal())
+        self.assertEqual(linhas, [(1,), (2,)])
+        self.assertNotEqual(thread, threading.get_ident())
+
+
+class TestEscritaAdiada(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.caminho = os.path.join(self.pasta.name, "t.db")
+        self.banco = teteu.GerenciadorConexoes(self.caminho)
+        self.addCleanup(self.banco.fechar)
+        teteu.aplicar_migracoes(self.banco.conexao())
+        self.banco.executar("INSERT INTO ranking (nome) VALUES ('ana')")
+        self.fila = teteu.FilaEscrita(self.banco, intervalo=0.05)
+        self.addCleanup(self.fila.encerrar)
+        for p in (mock.patch.object(teteu, "banco", self.banco), mock.patch.object(teteu, "fila_escrita", self.fila),
+                  mock.patch.object(teteu, "busca_fts", False)):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _contar_fora(self, sql):
+        # Outra conexão: só enxerga o que já foi confirmado
+        con = sqlite3.connect(self.caminho)
+        try:
+            return con.execute(sql).fetchone()
+        finally:
+            con.close()
+
+    def test_rajada_agrupada_em_poucas_transacoes(self):
+        def aluno(i):
+            for j in range(10):
+                teteu.atualizar_pontuacao("ana", 1)
+            teteu.salvar_no_historico(f"quiz {i}", "ok")
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            list(executor.map(aluno, range(10)))
+        self.fila.descarregar()
+        self.assertEqual(self._contar_fora("SELECT pontos, quizzes FROM ranking WHERE nome = 'ana'"), (100, 100))
+        self.assertEqual(self._contar_fora("SELECT COUNT(*) FROM historico")[0], 10)
+        self.assertEqual(self.fila.stats["operacoes"], 110)
+        self.assertLess(self.fila.stats["transacoes"], 20)
+
+    def test_sincrono_confirma_antes_de_retornar(self):
+        teteu.salvar_no_historico("comando", "resposta", sincrono=True)
+        self.assertEqual(self._contar_fora("SELECT COUNT(*) FROM historico")[0], 1)
+
+    def test_leitura_enxerga_escrita_pendente(self):
+        with mock.patch.object(self.fila, "intervalo", 60):
+            teteu.salvar_no_historico("pergunta sobre listas", "resposta")
+            resultados, _ = teteu.pesquisar_historico("listas")
+        self.assertEqual(len(resultados), 1)
+
+    def test_encerrar_grava_o_restante(self):
+        self.fila.intervalo = 60
+        teteu.atualizar_pontuacao("ana", 3)
+        self.fila.encerrar()
+        self.assertEqual(self._contar_fora("SELECT pontos FROM ranking WHERE nome = 'ana'")[0], 3)
+
+    def test_erro_de_gravacao_chega_a_quem_espera(self):
+        quebrado = mock.Mock()
+        quebrado.transacao.side_effect = sqlite3.OperationalError("database is locked")
+        self.fila.gerenciador = quebrado
+        with mock.patch("builtins.print") as imprimir, mock.patch.object(teteu.time, "sleep") as dormir:
+            with self.assertRaises(sqlite3.OperationalError):
+                teteu.atualizar_pontuacao("ana", 1, sincrono=True)
+        # A perda só é avisada depois de esgotar as tentativas, com espera crescente entre elas
+        self.assertEqual(quebrado.transacao.call_count, teteu.ESCRITA_TENTATIVAS)
+        self.assertEqual([c.args[0] for c in dormir.call_args_list],
+                         [teteu.ESCRITA_BACKOFF_BASE * 2 ** i for i in range(teteu.ESCRITA_TENTATIVAS - 1)])
+        self.assertEqual(self.fila.stats["erros"], 1)
+        imprimir.assert_called_once()
+
+    def test_falha_passageira_nao_perde_o_lote(self):
+        real = self.banco.transacao
+        falhas = [sqlite3.OperationalError("database is locked")]
+
+        def transacao():
+            if falhas:
+                raise falhas.pop()
+            return real()
+        self.fila.intervalo = 60
+        teteu.atualizar_pontuacao("ana", 2)
+        teteu.salvar_no_historico("comando", "resposta")
+        with mock.patch.object(self.banco, "transacao", side_effect=transacao), \
+             mock.patch.object(teteu.time, "sleep"), mock.patch("builtins.print") as imprimir:
+            self.fila.descarregar()
+        self.assertEqual(self._contar_fora("SELECT pontos FROM ranking WHERE nome = 'ana'")[0], 2)
+        self.assertEqual(self._contar_fora("SELECT COUNT(*) FROM historico")[0], 1)
+        self.assertEqual((self.fila.stats["repeticoes"], self.fila.stats["erros"]), (1, 0))
+        imprimir.assert_not_called()
+
+
+class TestPlacar(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.banco = teteu.GerenciadorConexoes(os.path.join(self.pasta.name, "t.db"))
+        self.addCleanup(self.banco.fechar)
+        teteu.aplicar_migracoes(self.banco.conexao())
+        self.banco.executar_lote("INSERT INTO ranking (nome, pontos, quizzes) VALUES (?, ?, ?)",
+                                 [(f"aluno{i:04d}", (i * 37) % 500, i % 7) for i in range(2000)])
+        self.fila = teteu.FilaEscrita(self.banco, intervalo=0.05)
+        self.addCleanup(self.fila.encerrar)
+        self.placar = teteu.Placar(self.banco)
+        for p in (mock.patch.object(teteu, "banco", self.banco), mock.patch.object(teteu, "fila_escrita", self.fila),
+                  mock.patch.object(teteu, "placar", self.placar), mock.patch.object(teteu, "usuario", "aluno0001")):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _posicao_sql(self, nome):
+        pontos, quizzes = self.banco.consultar_um("SELECT pontos, quizzes FROM ranking WHERE nome = ?", (nome,))
+        return self.banco.consultar_um(
+            "SELECT COUNT(*) + 1 FROM ranking WHERE pontos > ? OR (pontos = ? AND quizzes > ?)", (pontos, pontos, quizzes))[0]
+
+    def test_paginas_batem_com_o_banco(self):
+        esperado = self.banco.consultar("SELECT nome, pontos, quizzes FROM ranking ORDER BY pontos DESC, quizzes DESC, nome")
+        primeira, tem_mais = self.placar.pagina(1, 25)
+        terceira, _ = self.placar.pagina(3, 25)
+        self.assertTrue(tem_mais)
+        self.assertEqual([linha[1:] for linha in primeira], esperado[:25])
+        self.assertEqual([linha[1:] for linha in terceira], esperado[50:75])
+        self.assertFalse(self.placar.pagina(80, 25)[1])
+        self.assertEqual(self.placar.pagina(81, 25), ([], False))
+
+    def test_posicao_com_empates(self):
+        for nome in ("aluno0000", "aluno0500", "aluno1999"):
+            self.assertEqual(self.placar.posicao(nome), (self._posicao_sql(nome), 2000))
+        self.assertIsNone(self.placar.posicao("ninguem"))
+
+    def test_atualizacao_incremental(self):
+        self.placar.pagina()
+        with mock.patch.object(self.banco, "consultar", wraps=self.banco.consultar) as consultar:
+            teteu.atualizar_pontuacao("aluno0001", 10000)
+            self.assertEqual(self.placar.posicao("aluno0001"), (1, 2000))
+            self.assertEqual(self.placar.pagina(1, 1)[0][0][1:], ("aluno0001", 10037, 2))
+            consultar.assert_not_called()
+        self.fila.descarregar()
+        self.assertEqual(self._posicao_sql("aluno0001"), 1)
+
+    def test_recarga_nao_conta_duas_vezes(self):
+        self.placar.pagina()
+        teteu.atualizar_pontuacao("aluno0002", 5)
+        self.placar.carregar()
+        self.assertEqual(self.placar._jogadores["aluno0002"], (79, 3))
+
+    def test_jogador_novo_entra_no_banco_e_no_placar(self):
+        self.placar.pagina()
+        teteu.atualizar_pontuacao("novato", 7, sincrono=True)
+        self.assertEqual(self.banco.consultar_um("SELECT pontos, quizzes FROM ranking WHERE nome = 'novato'"), (7, 1))
+        self.placar.carregar()
+        self.assertEqual(self.placar.posicao("novato")[1], 2001)
+
+    def test_indice_de_cobertura(self):
+        plano = " ".join(str(linha) for linha in self.banco.consultar(
+            "EXPLAIN QUERY PLAN SELECT nome, pontos, quizzes FROM ranking ORDER BY pontos DESC, quizzes DESC, nome"))
+        self.assertIn("COVERING INDEX idx_ranking_placar", plano)
+
+    def test_mostrar_ranking_inclui_posicao_do_usuario(self):
+        with mock.patch("builtins.print") as imprimir:
+            teteu.mostrar_ranking(1, 5)
+        saida = "\n".join(str(c.args[0]) for c in imprimir.call_args_list)
+        self.assertIn(f"você (aluno0001) está em {self._posicao_sql('aluno0001')}º de 2000", saida)
+        self.assertIn("ranking 2", saida)
+
+
+class TestComandos(unittest.TestCase):
+    def test_verbo_e_chave_do_registro_e_argumento_mantem_a_caixa(self):
+        with mock.patch.object(teteu, "executar_codigo") as executar:
+            teteu.despachar('EXEC print("OlÁ Mundo")')
+        executar.assert_called_once_with('print("OlÁ Mundo")')
+        self.assertIs(teteu.COMANDOS["explica_erro"], teteu.COMANDOS["erro"])
+
+    def test_comando_desconhecido_e_argumento_faltando(self):
+        with mock.patch("builtins.print") as saida:
+            self.assertIsNone(teteu.despachar("voar alto"))
+            self.assertIsNone(teteu.despachar("exec"))
+        mensagens = " ".join(str(c.args[0]) for c in saida.call_args_list)
+        self.assertIn("Não entendi", mensagens)
+        self.assertIn("Uso: exec <codigo>", mensagens)
+
+    def test_stream_passa_por_imprimir_stream(self):
+        with mock.patch.object(teteu, "perguntar_ao_gpt", return_value=iter(["a", "b"])) as gpt, \
+             mock.patch.object(teteu, "imprimir_stream", return_value="ab") as imprimir:
+            self.assertEqual(teteu.despachar("explica X = 1"), "ab")
+        self.assertIn("X = 1", gpt.call_args.args[0])
+        self.assertTrue(gpt.call_args.kwargs["stream"])
+        imprimir.assert_called_once()
+        self.assertEqual(imprimir.call_args.args[0], "explica X = 1")
+
+    def test_opcional_vazio_usa_o_padrao_da_funcao(self):
+        with mock.patch.object(teteu, "perguntar_ao_gpt", return_value=iter([])) as gpt, \
+             mock.patch.object(teteu, "imprimir_stream", return_value=""):
+            teteu.despachar("projetos")
+            teteu.despachar("projetos avançado")
+        self.assertIn("nível iniciante", gpt.call_args_list[0].args[0])
+        self.assertIn("nível avançado", gpt.call_args_list[1].args[0])
+
+    def test_em_fundo_devolve_future_e_grava_resposta(self):
+        liberar = threading.Event()
+
+        def lento(*args, **kwargs):
+            liberar.wait(5)
+            yield "resposta"
+        with mock.patch.object(teteu, "perguntar_ao_gpt", side_effect=lento), \
+             mock.patch.object(teteu, "salvar_no_historico") as salvar, mock.patch("builtins.print"):
+            tarefa = teteu.despachar("resuma texto longo &")
+            self.assertFalse(tarefa.done())
+            self.assertIn("⏳", teteu.COMANDOS["tarefas"].chamar(""))
+            liberar.set()
+            self.assertEqual(tarefa.result(5), "resposta")
+            teteu.aguardar_tarefas_fundo()
+        salvar.assert_called_once_with("resuma texto longo", "resposta", modelo=teteu.modelo_gpt)
+
+    def test_analisar_roda_linters_e_revisao_em_paralelo(self):
+        ambos = threading.Barrier(2, timeout=5)
+
+        def linters(codigo):
+            ambos.wait()
+            return "lint ok"
+
+        def revisao(codigo):
+            ambos.wait()
+            return "revisão ok"
+        with mock.patch.object(teteu, "analisar_codigo", side_effect=linters), \
+             mock.patch.object(teteu, "revisar_com_gpt", side_effect=revisao), \
+             mock.patch.object(teteu, "salvar_no_historico"), mock.patch("builtins.print"):
+            resposta = teteu.despachar("analisar x = 1")
+        self.assertIn("lint ok", resposta)
+        self.assertIn("revisão ok", resposta)
+
+    def test_ajuda_lista_todos_os_comandos(self):
+        with mock.patch("builtins.print") as saida:
+            teteu.despachar("ajuda")
+        texto = saida.call_args.args[0]
+        for verbo in ("sair", "exec", "historico", "buscar", "limpar_historico", "exportar_historico",
+                      "exportar_para_notebook", "modelo", "contexto", "explica", "resuma", "erro", "corrija",
+                      "quiz", "desafio", "ranking", "corrigir_exercicio", "explica_erro", "mini_projeto",
+                      "desafio_diario", "entrevista", "conceito", "materiais", "materiais_personalizados",
+                      "curva_aprendizado", "exercicios_online", "debug", "stackoverflow", "proximo",
+                      "biblioteca", "analisar", "revisar", "projetos", "ajuda"):
+            self.assertIn(verbo, teteu.COMANDOS)
+            self.assertIn(f"- {verbo}", texto.replace("(ou ", "- "))
+
+    def test_loop_encerra_com_sair_e_com_eof(self):
+        with mock.patch("builtins.input", side_effect=["", "sair", "exec nunca"]) as entrada, \
+             mock.patch("builtins.print"), mock.patch.object(teteu, "executar_codigo") as executar:
+            teteu.teteu_loop()
+        self.assertEqual(entrada.call_count, 2)
+        executar.assert_not_called()
+        with mock.patch("builtins.input", side_effect=EOFError), mock.patch("builtins.print"):
+            teteu.teteu_loop()
+
+
+class TestModoLote(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.banco = teteu.GerenciadorConexoes(os.path.join(self.pasta.name, "t.db"))
+        self.addCleanup(self.banco.fechar)
+        teteu.aplicar_migracoes(self.banco.conexao())
+        self.fila = teteu.FilaEscrita(self.banco, intervalo=0.05)
+        self.addCleanup(self.fila.encerrar)
+        self.rodando = 0
+        self.maximo = 0
+        self.lock = threading.Lock()
+        for p in (mock.patch.object(teteu, "banco", self.banco), mock.patch.object(teteu, "fila_escrita", self.fila),
+                  mock.patch.object(teteu, "busca_fts", False),
+                  mock.patch.object(teteu, "perguntar_ao_gpt", side_effect=self._gpt)):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _gpt(self, prompt, stream=False, **kwargs):
+        # "resuma <n>": quanto menor o n, mais demora — termina na ordem inversa da entrada
+        atraso = int(prompt.splitlines()[-1]) if prompt.startswith("Resuma") else 0
+        with self.lock:
+            self.rodando += 1
+            self.maximo = max(self.maximo, self.rodando)
+        try:
+            time.sleep(0.02 * (5 - atraso))
+        finally:
+            with self.lock:
+                self.rodando -= 1
+        yield f"resumo {atraso}"
+
+    def _rodar(self, linhas, **kwargs):
+        saida = io.StringIO()
+        resumo = teteu.processar_lote(io.StringIO("\n".join(linhas) + "\n"), saida, **kwargs)
+        return resumo, [json.loads(linha) for linha in saida.getvalue().splitlines()]
+
+    def test_ordem_de_entrada_e_de_conclusao(self):
+        linhas = [json.dumps({"id": f"r{n}", "comando": f"resuma {n}"}) for n in range(5)]
+        _, em_ordem = self._rodar(linhas, concorrencia=5)
+        _, conforme = self._rodar(linhas, concorrencia=5, ordem="conclusao")
+        self.assertEqual([r["id"] for r in em_ordem], ["r0", "r1", "r2", "r3", "r4"])
+        self.assertEqual([r["resposta"] for r in em_ordem], [f"resumo {n}" for n in range(5)])
+        self.assertEqual([r["id"] for r in conforme], ["r4", "r3", "r2", "r1", "r0"])
+
+    def test_concorrencia_limitada_e_historico_em_poucas_transacoes(self):
+        linhas = [json.dumps(f"explica x = {n}") for n in range(12)]
+        resumo, resultados = self._rodar(linhas, concorrencia=3)
+        self.assertEqual(resumo, {"total": 12, "erros": 0})
+        self.assertLessEqual(self.maximo, 3)
+        self.assertEqual(self.banco.consultar_um("SELECT COUNT(*) FROM historico")[0], 12)
+        self.assertLess(self.fila.stats["transacoes"], 12)
+        self.assertEqual([r["id"] for r in resultados], list(range(1, 13)))
+
+    def test_erros_viram_linhas_e_o_lote_continua(self):
+        linhas = ["{quebrado", json.dumps("voar alto"), json.dumps("exec"), json.dumps({"x": 1}),
+                  json.dumps("sair"), "", json.dumps("explica ok")]
+        resumo, resultados = self._rodar(linhas)
+        self.assertEqual(resumo, {"total": 6, "erros": 5})
+        self.assertEqual([r["ok"] for r in resultados], [False] * 5 + [True])
+        self.assertIn("uso: exec <codigo>", resultados[2]["erro"])
+        self.assertEqual(resultados[-1]["id"], 7)
+
+    def test_falha_do_provedor_vira_erro_sem_ir_ao_historico(self):
+        def gpt(prompt, stream=False, **kwargs):
+            yield teteu.mensagem_erro_ia(teteu.CotaEsgotada("sem créditos", "gpt"))
+        with mock.patch.object(teteu, "perguntar_ao_gpt", side_effect=gpt):
+            resumo, resultados = self._rodar([json.dumps("explica x = 1")])
+        self.assertEqual(resumo, {"total": 1, "erros": 1})
+        self.assertFalse(resultados[0]["ok"])
+        self.assertIn("CotaEsgotada", resultados[0]["erro"])
+        self.assertNotIn("resposta", resultados[0])
+        self.assertEqual(self.banco.consultar_um("SELECT COUNT(*) FROM historico")[0], 0)
+
+    def test_saida_impressa_pelo_handler_vira_resposta(self):
+        def executar(codigo):
+            print(f"saída de {codigo}")
+        with mock.patch.object(teteu, "executar_codigo", side_effect=executar):
+            _, resultados = self._rodar([json.dumps(f"exec print({n})") for n in range(6)], concorrencia=3)
+        self.assertEqual([r["resposta"] for r in resultados], [f"saída de print({n})" for n in range(6)])
+
+    def test_linha_de_comando(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, True)
+        entrada = "\n".join([json.dumps({"id": "a", "comando": "tarefas"}), json.dumps("voar")]) + "\n"
+        processo = subprocess.run([sys.executable, os.path.abspath(teteu.__file__), "--lote", "-", "--usuario", "lote"],
+                                  input=entrada, capture_output=True, text=True, cwd=pasta, timeout=120)
+        self.assertEqual(processo.returncode, 1, processo.stderr)
+        resultados = [json.loads(linha) for linha in processo.stdout.splitlines()]
+        self.assertEqual([(r["id"], r["ok"]) for r in resultados], [("a", True), (2, False)])
+        self.assertIn("2 comandos, 1 com erro", processo.stderr)
+
+
+class TestServidor(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.banco = teteu.GerenciadorConexoes(os.path.join(self.pasta.name, "t.db"))
+        self.addCleanup(self.banco.fechar)
+        teteu.aplicar_migracoes(self.banco.conexao())
+        self.banco.executar_lote("INSERT INTO ranking (nome, pontos, quizzes) VALUES (?, ?, ?)",
+                                 [("ana", 30, 3), ("bia", 50, 5), ("caio", 10, 1)])
+        self.fila = teteu.FilaEscrita(self.banco, intervalo=0.05)
+        self.addCleanup(self.fila.encerrar)
+        self.liberar = threading.Event()
+        self.liberar.set()
+        for p in (mock.patch.object(teteu, "banco", self.banco), mock.patch.object(teteu, "fila_escrita", self.fila),
+                  mock.patch.object(teteu, "placar", teteu.Placar(self.banco)),
+                  mock.patch.object(teteu, "busca_fts", False),
+                  mock.patch.object(teteu, "perguntar_ao_gpt", side_effect=self._gpt)):
+            p.start()
+            self.addCleanup(p.stop)
+        self.servidor = teteu.ServidorTeteu("127.0.0.1", 0, fila_max=2, workers_rede=4, workers_cpu=1).iniciar()
+        self.addCleanup(self.servidor.encerrar, 5)
+
+    def _gpt(self, prompt, stream=False, **kwargs):
+        self.liberar.wait(5)
+        pedacos = ["Olá", ", ", "turma"]
+        return iter(pedacos) if stream else "".join(pedacos)
+
+    def _pedir(self, metodo, caminho, dados=None, cabecalhos=None):
+        import urllib.request
+        import urllib.error
+        corpo = None if dados is None else json.dumps(dados).encode("utf-8")
+        pedido = urllib.request.Request(f"http://127.0.0.1:{self.servidor.porta}{caminho}", data=corpo, method=metodo,
+                                        headers=cabecalhos or {})
+        try:
+            with urllib.request.urlopen(pedido, timeout=10) as resposta:
+                return resposta.status, json.loads(resposta.read()), resposta.headers
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read()), e.headers
+
+    def test_rotas_http(self):
+        status, dados, _ = self._pedir("POST", "/comando", {"comando": "explica x = 1"})
+        self.assertEqual((status, dados["resposta"]), (200, "Olá, turma"))
+        status, dados, _ = self._pedir("POST", "/perguntar", {"pergunta": "o que é uma lista?"})
+        self.assertEqual((status, dados["resposta"]), (200, "Olá, turma"))
+        status, dados, _ = self._pedir("GET", "/ranking?por_pagina=2")
+        self.assertEqual(status, 200)
+        self.assertEqual([(r["posicao"], r["nome"]) for r in dados["ranking"]], [(1, "bia"), (2, "ana")])
+        self.assertTrue(dados["tem_mais"])
+        status, dados, _ = self._pedir("GET", "/historico/busca?termo=lista")
+        self.assertEqual([r["comando"] for r in dados["resultados"]], ["o que é uma lista?"])
+
+    def test_falha_do_provedor_responde_502(self):
+        def gpt(prompt, stream=False, **kwargs):
+            return iter([teteu.mensagem_erro_ia(teteu.ErroTemporario("timeout", "gpt"))])
+        with mock.patch.object(teteu, "perguntar_ao_gpt", side_effect=gpt):
+            status, dados, _ = self._pedir("POST", "/perguntar", {"pergunta": "o que é uma lista?"})
+        self.assertEqual(status, 502)
+        self.assertIn("timeout", dados["erro"])
+        self.fila.descarregar()
+        self.assertEqual(self.banco.consultar_um("SELECT COUNT(*) FROM historico")[0], 0)
+
+    def test_usuario_por_pedido(self):
+        self.banco.executar_lote("INSERT INTO ranking (nome, pontos) VALUES (?, 20)", [(f"aluno{i}",) for i in range(10)])
+        with mock.patch.object(teteu, "usuario", "servidor"):
+            self._pedir("POST", "/perguntar", {"pergunta": "listas?", "usuario": "ana"})
+            self._pedir("POST", "/comando", {"comando": "explica x = 1"}, {"X-Teteu-Usuario": "caio"})
+            self._pedir("POST", "/perguntar", {"pergunta": "sem nome"})
+            status, dados, _ = self._pedir("GET", "/ranking?por_pagina=1", cabecalhos={"X-Teteu-Usuario": "caio"})
+            self.assertEqual((status, dados["voce"]), (200, {"nome": "caio", "posicao": 13, "total": 13}))
+            status, dados, _ = self._pedir("POST", "/comando", {"comando": "curva_aprendizado", "usuario": "bia"})
+            self.assertIn("bia: 50 pontos", dados["resposta"])
+            status, dados, _ = self._pedir("POST", "/comando", {"comando": "ranking", "usuario": "caio"})
+            self.assertIn("você (caio) está em 13º de 13", dados["resposta"])
+        self.assertEqual(self._pedir("POST", "/perguntar", {"pergunta": "x", "usuario": ["ana"]})[0], 400)
+        self.fila.descarregar()
+        self.assertEqual(self.banco.consultar("SELECT comando, usuario FROM historico ORDER BY id")[:3],
+                         [("listas?", "ana"), ("explica x = 1", "caio"), ("sem nome", "servidor")])
+
+    def test_ranking_passa_pelo_pool_sem_acumular_conexoes(self):
+        teteu.placar.ttl = 0    # toda leitura recarrega do banco
+        for _ in range(20):
+            self.assertEqual(self._pedir("GET", "/ranking")[0], 200)
+        self.assertLessEqual(len(self.banco._conexoes), 1 + 4 + 1)  # principal, workers de rede, fila de escrita
+        self.assertEqual(self.servidor.stats["aceitos"], 20)
+
+    def test_erros_de_pedido(self):
+        self.assertEqual(self._pedir("GET", "/nada")[0], 404)
+        self.assertEqual(self._pedir("POST", "/comando", {"comando": "limpar_historico"})[0], 400)
+        for comando in ("exportar_historico /tmp/x.txt", "exportar_para_notebook /tmp/x.ipynb", "proximo", "sair"):
+            self.assertEqual(self._pedir("POST", "/comando", {"comando": comando})[0], 400, comando)
+        self.assertLessEqual(teteu.COMANDOS_SERVIDOR, {c.nome for c in teteu.COMANDOS.values()})
+        self.assertEqual(self._pedir("POST", "/comando", {})[0], 400)
+        self.assertEqual(self._pedir("POST", "/executar", ["x"])[0], 400)
+
+    def test_cpu_e_rede_em_pools_separados(self):
+        threads = {}
+
+        def sandbox(codigo):
+            threads["cpu"] = threading.current_thread().name
+            return {"ok": True, "stdout": "1\n", "stderr": "", "erro": None, "cortada": False}
+        with mock.patch.object(teteu, "executar_no_sandbox", side_effect=sandbox):
+            status, dados, _ = self._pedir("POST", "/executar", {"codigo": "print(1)"})
+        self.assertEqual((status, dados["stdout"]), (200, "1\n"))
+        self.assertTrue(threads["cpu"].startswith("teteu-cpu"))
+        self.assertEqual(teteu.COMANDOS["exec"].pool, "cpu")
+        self.assertEqual(teteu.COMANDOS["explica"].pool, "rede")
+
+    def test_fila_cheia_responde_429_e_encerramento_drena(self):
+        self.liberar.clear()
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            lentos = [executor.submit(self._pedir, "POST", "/perguntar", {"pergunta": f"p{n}"}) for n in range(2)]
+            while self.servidor.saude()["em_andamento"] < 2:
+                time.sleep(0.01)
+            status, _, cabecalhos = self._pedir("POST", "/perguntar", {"pergunta": "mais uma"})
+            self.assertEqual((status, cabecalhos["Retry-After"]), (429, "1"))
+            self.assertEqual(self.servidor.stats["recusados"], 1)
+            encerramento = executor.submit(self.servidor.encerrar, 5)
+            while not self.servidor.drenando:
+                time.sleep(0.01)
+            self.assertEqual(self._pedir("POST", "/perguntar", {"pergunta": "tarde demais"})[0], 503)
+            self.liberar.set()
+            self.assertEqual([tarefa.result()[0] for tarefa in lentos], [200, 200])
+            self.assertTrue(encerramento.result())
+
+    def test_websocket_envia_pedacos(self):
+        import base64
+        import socket
+        import struct
+        conexao = socket.create_connection(("127.0.0.1", self.servidor.porta), timeout=10)
+        self.addCleanup(conexao.close)
+        chave = base64.b64encode(os.urandom(16)).decode()
+        conexao.sendall((f"GET /ws HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                         f"Sec-WebSocket-Key: {chave}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        arquivo = conexao.makefile("rb")
+        cabecalho = b""
+        while not cabecalho.endswith(b"\r\n\r\n"):
+            cabecalho += arquivo.read(1)
+        self.assertIn(b"101", cabecalho.split(b"\r\n")[0])
+
+        def enviar(mensagem):
+            dados = json.dumps(mensagem).encode()
+            mascara = os.urandom(4)
+            conexao.sendall(struct.pack("!BB", 0x81, 0x80 | len(dados)) + mascara
+                            + bytes(b ^ mascara[i % 4] for i, b in enumerate(dados)))
+
+        def receber():
+            _, tamanho = arquivo.read(2)
+            if tamanho == 126:
+                tamanho = struct.unpack("!H", arquivo.read(2))[0]
+            return json.loads(arquivo.read(tamanho))
+        enviar({"id": 7, "pergunta": "oi"})
+        mensagens = [receber() for _ in range(4)]
+        self.assertEqual([m["tipo"] for m in mensagens], ["pedaco", "pedaco", "pedaco", "fim"])
+        self.assertEqual("".join(m["texto"] for m in mensagens[:3]), "Olá, turma")
+        self.assertEqual((mensagens[-1]["id"], mensagens[-1]["resposta"]), (7, "Olá, turma"))
+        enviar({"id": 8, "comando": "voar"})
+        self.assertEqual((receber()["status"]), 400)
+        conexao.sendall(struct.pack("!BB", 0x88, 0x80) + os.urandom(4))
+        self.assertEqual(arquivo.read(2)[0] & 0x0F, 0x8)
+
+
+class TestInicio(unittest.TestCase):
+    def test_import_nao_carrega_integracoes(self):
+        pesados = ["openai", "cohere", "requests", "RestrictedPython", "deep_translator", "github", "nbformat", "numpy"]
+        script = "import sys, teteu; print(','.join(m for m in %r if m in sys.modules))" % (pesados,)
+        processo = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(teteu.__file__)))
+        self.assertEqual(processo.returncode, 0, processo.stderr)
+        self.assertEqual(processo.stdout.strip(), "")
+
+    def test_import_sem_efeitos_colaterais(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, True)
+        script = "import teteu; assert teteu.banco is None and teteu.client is None"
+        processo = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, cwd=pasta,
+                                  env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(teteu.__file__))),
+                                  stdin=subprocess.DEVNULL)
+        self.assertEqual(processo.returncode, 0, processo.stderr)
+        self.assertEqual(os.listdir(pasta), [])
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
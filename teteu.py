@@ -1,101 +1,1288 @@
 import os
+import io
+import re
+import sys
 import sqlite3
 import subprocess
-import requests
-from openai import OpenAI
-from RestrictedPython import compile_restricted, safe_globals
-import chardet
-import glob
-import cohere
-from deep_translator import GoogleTranslator
-from github import Github
-from win10toast import ToastNotifier
-import readline
-import nbformat as nbf
-
-# Substitua a configuração da API key:
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-if not client.api_key:
-    raise ValueError("API Key da OpenAI não encontrada. Verifique a variável de ambiente 'OPENAI_API_KEY'.")
+import time
+import contextlib
+import atexit
+import shutil
+import tempfile
+import queue
+import signal
+import operator
+import warnings
+import multiprocessing
+import marshal
+import struct
+import importlib
+import importlib.util
+import functools
+import bisect
+import heapq
+import itertools
+import contextvars
+from collections import OrderedDict, deque
+import json
+import html
+import hashlib
+import hmac
+import random
+import urllib.parse
+import threading
+import unicodedata
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# ⏱️ Inicialização rápida: openai, cohere, requests, RestrictedPython, nbformat, deep_translator, github,
+# win10toast e readline só são importados no primeiro uso; banco e nome do ranking ficam em iniciar()
+ORCAMENTO_INICIO_MS = 100   # tempo máximo de "import teteu" (verificado por --perfil-inicio, que sai com 1 se estourar)
+
+client = None   # cliente da OpenAI, criado no primeiro uso por cliente_openai()
+_client_lock = threading.Lock()
+
+def cliente_openai():
+    global client
+    with _client_lock:
+        if client is None:
+            from openai import OpenAI
+            # Substitua a configuração da API key:
+            if not os.getenv("OPENAI_API_KEY"):
+                raise ValueError("API Key da OpenAI não encontrada. Verifique a variável de ambiente 'OPENAI_API_KEY'.")
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return client
+
+# 🌐 Transporte HTTP compartilhado: uma requests.Session com keep-alive para todas as integrações,
+# limite de conexões por host, timeout em toda chamada e novas tentativas com backoff exponencial
+HTTP_TIMEOUT = (5, 30)          # segundos (conexão, leitura)
+HTTP_CONEXOES_POR_HOST = 8
+HTTP_TENTATIVAS = 3
+HTTP_BACKOFF_BASE = 0.5         # segundos; dobra a cada tentativa
+HTTP_BACKOFF_MAX = 30
+HTTP_STATUS_REPETIR = {429, 500, 502, 503, 504}
+HTTP_METODOS_IDEMPOTENTES = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+_sessao_http = None
+_sessao_http_lock = threading.Lock()
+_espera_por_rota = {}           # "host/caminho" -> instante (time.monotonic) liberado para a próxima chamada
+_espera_lock = threading.Lock()
+
+def sessao_http():
+    global _sessao_http
+    with _sessao_http_lock:
+        if _sessao_http is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            sessao = requests.Session()
+            # pool_block: além do limite por host a chamada espera uma conexão livre em vez de abrir outra
+            adaptador = HTTPAdapter(pool_connections=HTTP_CONEXOES_POR_HOST, pool_maxsize=HTTP_CONEXOES_POR_HOST,
+                                    pool_block=True, max_retries=0)
+            sessao.mount("https://", adaptador)
+            sessao.mount("http://", adaptador)
+            _sessao_http = sessao
+        return _sessao_http
+
+def encerrar_http():
+    global _sessao_http
+    with _sessao_http_lock:
+        sessao, _sessao_http = _sessao_http, None
+    if sessao is not None:
+        sessao.close()
+
+def _rota(url):
+    partes = urllib.parse.urlsplit(url)
+    return f"{partes.netloc}{partes.path}"
+
+def registrar_backoff(url, segundos):
+    # Ex.: campo "backoff" da API do StackExchange ou cabeçalho Retry-After
+    liberado = time.monotonic() + max(0.0, float(segundos))
+    with _espera_lock:
+        rota = _rota(url)
+        _espera_por_rota[rota] = max(_espera_por_rota.get(rota, 0.0), liberado)
+
+def _aguardar_rota(url):
+    with _espera_lock:
+        liberado = _espera_por_rota.get(_rota(url), 0.0)
+    espera = liberado - time.monotonic()
+    if espera > 0:
+        time.sleep(espera)
+
+def _ler_retry_after(valor):
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# A falha aconteceu antes de o pedido sair: conexão recusada, DNS, timeout de conexão
+def _sem_conectar(erro):
+    import requests
+    if isinstance(erro, requests.ConnectTimeout):
+        return True
+    from urllib3.exceptions import NewConnectionError
+    motivo = getattr(erro.args[0], "reason", erro.args[0]) if erro.args else None
+    return isinstance(motivo, NewConnectionError)
+
+# O timeout de quem chama vale para todas as tentativas somadas, esperas incluídas. Método não idempotente
+# (o POST de inferência do Hugging Face) só é repetido quando com certeza não foi processado: falha ao
+# conectar ou 429. Timeout de leitura e 5xx podem ter gastado (e cobrado) o trabalho, então não repetem
+def requisicao_http(metodo, url, tentativas=None, timeout=None, **kwargs):
+    import requests
+    tentativas = tentativas or HTTP_TENTATIVAS
+    timeout = timeout or HTTP_TIMEOUT
+    conexao, leitura = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    prazo = time.monotonic() + conexao + leitura
+    idempotente = metodo.upper() in HTTP_METODOS_IDEMPOTENTES
+    for tentativa in range(tentativas):
+        _aguardar_rota(url)
+        ultima = tentativa == tentativas - 1
+        espera = min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** tentativa) * random.uniform(0.5, 1.0)
+        restante = max(0.5, prazo - time.monotonic())
+        try:
+            resposta = sessao_http().request(metodo, url, timeout=(conexao, min(leitura, restante)), **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if ultima or not (idempotente or _sem_conectar(e)) or time.monotonic() + espera >= prazo:
+                raise
+        else:
+            repetir = resposta.status_code == 429 or (idempotente and resposta.status_code in HTTP_STATUS_REPETIR)
+            if not repetir or ultima:
+                return resposta
+            retry_after = _ler_retry_after(resposta.headers.get("Retry-After"))
+            if retry_after is not None:
+                if retry_after > HTTP_BACKOFF_MAX:
+                    return resposta  # o servidor pediu mais do que vale esperar: devolve o erro
+                espera = retry_after
+            if time.monotonic() + espera >= prazo:
+                return resposta  # a próxima tentativa passaria do prazo de quem chamou
+            if retry_after is not None:
+                registrar_backoff(url, retry_after)
+                espera = 0  # a espera fica a cargo de _aguardar_rota
+            resposta.close()
+        time.sleep(espera)
 
 modelo_gpt = "gpt-3.5-turbo"
 
-# 📦 Banco de Dados SQLite
-con = sqlite3.connect('teteu.db')
-cur = con.cursor()
+# 📦 Banco de Dados SQLite (aberto por iniciar_banco)
+CAMINHO_BANCO = 'teteu.db'
+CAMINHO_CACHE = 'teteu_cache.db'
+banco = None          # GerenciadorConexoes do teteu.db
+banco_cache = None    # GerenciadorConexoes do teteu_cache.db
+busca_fts = False
+usuario = None
+_usuario_pedido = contextvars.ContextVar("usuario_pedido", default=None)
 
-# Cria tabela se não existir
-cur.execute('''
-    CREATE TABLE IF NOT EXISTS historico (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        comando TEXT,
-        resposta TEXT
-    )
-''')
-con.commit()
-
-cur.execute('''
-    CREATE TABLE IF NOT EXISTS ranking (
-        nome TEXT PRIMARY KEY,
-        pontos INTEGER DEFAULT 0,
-        quizzes INTEGER DEFAULT 0
-    )
-''')
-con.commit()
+# Quem fez o pedido: no servidor cada pedido traz o seu nome; no terminal e no lote vale o `usuario` global
+def usuario_atual():
+    return _usuario_pedido.get() or usuario
+
+@contextlib.contextmanager
+def como_usuario(nome):
+    marca = _usuario_pedido.set(nome)
+    try:
+        yield
+    finally:
+        _usuario_pedido.reset(marca)
+
+# 🗂️ Migrações versionadas do teteu.db (PRAGMA user_version guarda quantas já foram aplicadas).
+# Cada migração roda numa transação; só acrescente novas ao fim da lista, nunca altere as antigas
+def _migracao_esquema_inicial(cur):
+    # Esquema anterior ao versionamento: bancos antigos podem já ter parte dessas tabelas
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS historico (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            comando TEXT,
+            resposta TEXT
+        )
+    ''')
+    # Contagem de tokens de cada interação, calculada uma vez e reaproveitada por obter_contexto
+    if 'tokens' not in _colunas(cur, 'historico'):
+        cur.execute('ALTER TABLE historico ADD COLUMN tokens INTEGER')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS ranking (
+            nome TEXT PRIMARY KEY,
+            pontos INTEGER DEFAULT 0,
+            quizzes INTEGER DEFAULT 0
+        )
+    ''')
+    # Último id exportado para cada arquivo de destino (exportação incremental)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS exportacoes (
+            destino TEXT PRIMARY KEY,
+            ultimo_id INTEGER,
+            exportado_em REAL
+        )
+    ''')
+    # Resultados de analisar_codigo por ferramenta (ver cache das análises)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS cache_analises (
+            ferramenta TEXT,
+            hash_codigo TEXT,
+            assinatura TEXT,
+            saida TEXT,
+            acessado_em REAL,
+            PRIMARY KEY (ferramenta, hash_codigo)
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_cache_analises_acesso ON cache_analises (acessado_em)')
+
+def _migracao_metadados_historico(cur):
+    # Registros antigos ficam com NULL: não há como saber quando/quem/qual modelo
+    for coluna, tipo in (("criado_em", "REAL"), ("usuario", "TEXT"), ("modelo", "TEXT"), ("latencia_ms", "INTEGER")):
+        if coluna not in _colunas(cur, 'historico'):
+            cur.execute(f'ALTER TABLE historico ADD COLUMN {coluna} {tipo}')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_historico_criado_em ON historico (criado_em)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_historico_usuario ON historico (usuario, criado_em)')
+
+def _migracao_indice_placar(cur):
+    # Índice de cobertura: nome, pontos e quizzes saem do próprio índice, já na ordem do placar
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_ranking_placar ON ranking (pontos DESC, quizzes DESC, nome)')
+
+MIGRACOES = [
+    _migracao_esquema_inicial,
+    _migracao_metadados_historico,
+    _migracao_indice_placar,
+]
+
+# WAL: leitores não bloqueiam quem escreve; synchronous=NORMAL é seguro em WAL (só perde o último
+# commit numa queda de energia); cache_size negativo é em KiB
+PRAGMAS_BANCO = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),
+)
+
+def _colunas(cur, tabela):
+    return [coluna[1] for coluna in cur.execute(f'PRAGMA table_info({tabela})')]
+
+def configurar_conexao(conexao):
+    for nome, valor in PRAGMAS_BANCO:
+        conexao.execute(f'PRAGMA {nome} = {valor}')
+    return conexao
+
+def versao_esquema(conexao):
+    return conexao.execute('PRAGMA user_version').fetchone()[0]
+
+def aplicar_migracoes(conexao):
+    cursor = conexao.cursor()
+    for versao, migracao in enumerate(MIGRACOES, 1):
+        if versao <= versao_esquema(conexao):
+            continue
+        cursor.execute('BEGIN')
+        try:
+            migracao(cursor)
+            cursor.execute(f'PRAGMA user_version = {versao}')
+            conexao.commit()
+        except Exception:
+            conexao.rollback()
+            raise
+    return versao_esquema(conexao)
+
+# 🔌 Conexões por thread: objetos sqlite3 não podem ser compartilhados entre threads e um cursor
+# compartilhado mistura resultados; cada thread recebe sua própria conexão, aberta no primeiro uso.
+# Fora de transacao() cada comando é confirmado sozinho (autocommit)
+LOTE_ESCRITA = 500
+
+# Fica no threading.local ao lado da conexão: some quando a thread termina, e o finalize fecha a conexão
+class _FimDaThread:
+    pass
+
+class GerenciadorConexoes:
+    def __init__(self, caminho, max_workers_async=4):
+        self.caminho = caminho
+        self.max_workers_async = max_workers_async
+        self._local = threading.local()
+        self._conexoes = []
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            # isolation_level=None: as transações são abertas explicitamente por transacao()
+            conexao = configurar_conexao(sqlite3.connect(self.caminho, isolation_level=None, check_same_thread=False))
+            self._local.conexao = conexao
+            self._local.profundidade = 0
+            self._local.fim = _FimDaThread()
+            weakref.finalize(self._local.fim, self._descartar, conexao)
+            with self._lock:
+                self._conexoes.append(conexao)
+        return conexao
+
+    # Threads de vida curta (uma por conexão HTTP, lotes) não deixam conexões abertas para trás
+    def _descartar(self, conexao):
+        with self._lock:
+            if conexao in self._conexoes:
+                self._conexoes.remove(conexao)
+        conexao.close()
+
+    def executar(self, sql, params=()):
+        # Cursor novo a cada chamada: resultados de chamadas diferentes nunca se misturam
+        return self.conexao().execute(sql, params)
+
+    def consultar(self, sql, params=()):
+        return self.executar(sql, params).fetchall()
+
+    def consultar_um(self, sql, params=()):
+        return self.executar(sql, params).fetchone()
+
+    def executar_script(self, script):
+        self.conexao().executescript(script)
+
+    @contextlib.contextmanager
+    def transacao(self):
+        conexao = self.conexao()
+        # Transações aninhadas fazem parte da mais externa
+        if self._local.profundidade:
+            self._local.profundidade += 1
+            try:
+                yield conexao
+            finally:
+                self._local.profundidade -= 1
+            return
+        conexao.execute('BEGIN IMMEDIATE')
+        self._local.profundidade = 1
+        try:
+            yield conexao
+        except BaseException:
+            conexao.rollback()
+            raise
+        else:
+            conexao.commit()
+        finally:
+            self._local.profundidade = 0
+
+    def executar_lote(self, sql, linhas, tamanho=None):
+        # Uma transação para o lote inteiro, enviado em blocos de LOTE_ESCRITA linhas
+        tamanho = tamanho or LOTE_ESCRITA
+        total = 0
+        with self.transacao() as conexao:
+            bloco = []
+            for linha in linhas:
+                bloco.append(linha)
+                if len(bloco) >= tamanho:
+                    conexao.executemany(sql, bloco)
+                    total += len(bloco)
+                    bloco = []
+            if bloco:
+                conexao.executemany(sql, bloco)
+                total += len(bloco)
+        return total
+
+    # Fachada para asyncio: a função roda numa thread do executor (com a conexão daquela thread)
+    # e o event loop continua livre
+    async def assincrono(self, funcao, *args, **kwargs):
+        import asyncio
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers_async, thread_name_prefix="teteu-banco")
+            executor = self._executor
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(funcao, *args, **kwargs))
+
+    async def consultar_async(self, sql, params=()):
+        return await self.assincrono(self.consultar, sql, params)
+
+    async def executar_async(self, sql, params=()):
+        await self.assincrono(self.executar, sql, params)
+
+    async def executar_lote_async(self, sql, linhas, tamanho=None):
+        return await self.assincrono(self.executar_lote, sql, list(linhas), tamanho)
+
+    def fechar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            conexoes, self._conexoes = self._conexoes, []
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for conexao in conexoes:
+            conexao.close()
+        self._local = threading.local()
+
+# ✍️ Escrita adiada (write-behind): inserts no histórico e pontos do ranking entram numa fila e uma
+# thread grava tudo numa única transação a cada ESCRITA_INTERVALO segundos ou ESCRITA_LOTE operações.
+# Pontos do mesmo jogador no mesmo lote viram um único UPDATE. Leituras chamam descarregar() antes
+ESCRITA_INTERVALO = 0.25    # segundos
+ESCRITA_LOTE = 500
+# Lote que falha (banco travado, disco cheio por um instante) é regravado inteiro: a transação é atômica,
+# então nada fica pela metade. Só depois da última tentativa a perda é avisada
+ESCRITA_TENTATIVAS = 5
+ESCRITA_BACKOFF_BASE = 0.1  # segundos; dobra a cada tentativa
+# Botão de durabilidade: True confirma cada escrita antes de retornar (como antes da fila)
+ESCRITA_SINCRONA = os.getenv("TETEU_ESCRITA_SINCRONA", "") not in ("", "0")
+_ENCERRAR_FILA = object()
+
+class FilaEscrita:
+    def __init__(self, gerenciador, intervalo=None, lote=None):
+        self.gerenciador = gerenciador
+        self.intervalo = intervalo or ESCRITA_INTERVALO
+        self.lote = lote or ESCRITA_LOTE
+        self.stats = {"operacoes": 0, "transacoes": 0, "repeticoes": 0, "erros": 0}
+        self._fila = queue.Queue()
+        self._pendentes = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def adicionar_historico(self, linha, sincrono=False):
+        self._adicionar(("historico", linha), sincrono)
+
+    def adicionar_pontuacao(self, nome, pontos, sincrono=False):
+        self._adicionar(("pontuacao", (nome, pontos)), sincrono)
+
+    def _adicionar(self, operacao, sincrono):
+        with self._lock:
+            self._pendentes += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._trabalhar, name="teteu-escrita", daemon=True)
+                self._thread.start()
+            self._fila.put(operacao)
+        if sincrono or ESCRITA_SINCRONA:
+            self.descarregar()
+
+    # Espera até tudo o que foi enfileirado antes desta chamada estar gravado (erros de gravação sobem aqui)
+    def descarregar(self):
+        with self._lock:
+            if not self._pendentes:
+                return
+            aviso = Future()
+            self._fila.put(aviso)
+        aviso.result()
+
+    def encerrar(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._fila.put(_ENCERRAR_FILA)
+        if thread is not None:
+            thread.join()
+
+    def _trabalhar(self):
+        while True:
+            operacoes, avisos = [], []
+            item = self._fila.get()
+            prazo = time.monotonic() + self.intervalo
+            while True:
+                if item is _ENCERRAR_FILA or isinstance(item, Future):
+                    break
+                operacoes.append(item)
+                if len(operacoes) >= self.lote:
+                    break
+                try:
+                    item = self._fila.get(timeout=max(0.0, prazo - time.monotonic()))
+                except queue.Empty:
+                    item = None
+                    break
+            if isinstance(item, Future):
+                avisos.append(item)
+            erro = self._gravar(operacoes) if operacoes else None
+            for aviso in avisos:
+                if erro is None:
+                    aviso.set_result(None)
+                else:
+                    aviso.set_exception(erro)
+            if item is _ENCERRAR_FILA:
+                return
+
+    def _gravar(self, operacoes):
+        historico = [dados for tipo, dados in operacoes if tipo == "historico"]
+        pontos = {}
+        for tipo, dados in operacoes:
+            if tipo == "pontuacao":
+                nome, ganhos = dados
+                total, quizzes = pontos.get(nome, (0, 0))
+                pontos[nome] = (total + ganhos, quizzes + 1)
+        try:
+            for tentativa in range(ESCRITA_TENTATIVAS):
+                try:
+                    with self.gerenciador.transacao() as conexao:
+                        if historico:
+                            conexao.executemany('''
+                                INSERT INTO historico (comando, resposta, tokens, criado_em, usuario, modelo, latencia_ms)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)
+                            ''', historico)
+                        if pontos:
+                            # Upsert: quem ainda não tinha linha no ranking entra nela, como já entrou no Placar em memória
+                            conexao.executemany('''
+                                INSERT INTO ranking (nome, pontos, quizzes) VALUES (?, ?, ?)
+                                ON CONFLICT(nome) DO UPDATE SET pontos = pontos + excluded.pontos,
+                                                                quizzes = quizzes + excluded.quizzes
+                            ''', [(nome, total, quizzes) for nome, (total, quizzes) in pontos.items()])
+                except Exception as e:
+                    if tentativa == ESCRITA_TENTATIVAS - 1:
+                        self.stats["erros"] += 1
+                        print(f"⚠️ Erro ao gravar {len(operacoes)} operações no banco, "
+                              f"perdidas após {ESCRITA_TENTATIVAS} tentativas: {e}")
+                        return e
+                    self.stats["repeticoes"] += 1
+                    time.sleep(ESCRITA_BACKOFF_BASE * 2 ** tentativa)
+                else:
+                    self.stats["transacoes"] += 1
+                    self.stats["operacoes"] += len(operacoes)
+                    return None
+        finally:
+            with self._lock:
+                self._pendentes -= len(operacoes)
 
-usuario = input("Digite seu nome para o ranking: ")
-cur.execute('INSERT OR IGNORE INTO ranking (nome) VALUES (?)', (usuario,))
-con.commit()
+fila_escrita = None
 
-def obter_contexto(limite=5):
-    cur.execute('SELECT comando, resposta FROM historico ORDER BY id DESC LIMIT ?', (limite,))
-    registros = cur.fetchall()
+# Leituras do histórico/ranking passam por aqui para enxergar o que ainda está na fila
+def descarregar_escritas():
+    if fila_escrita is not None:
+        fila_escrita.descarregar()
+
+def iniciar_banco(caminho=CAMINHO_BANCO, caminho_cache=CAMINHO_CACHE):
+    global banco, banco_cache, busca_fts, fila_escrita, placar
+    if banco is not None:
+        return
+    banco = GerenciadorConexoes(caminho)
+    aplicar_migracoes(banco.conexao())
+    fila_escrita = FilaEscrita(banco)
+    placar = Placar(banco)
+
+    # SQLite compilado sem FTS5 continua funcionando com a busca por LIKE
+    try:
+        criar_indice_busca()
+        busca_fts = True
+    except sqlite3.OperationalError:
+        busca_fts = False
+
+    # 💾 Cache de respostas do GPT (arquivo separado, ao lado do teteu.db)
+    banco_cache = GerenciadorConexoes(caminho_cache)
+    with banco_cache.transacao() as conexao:
+        conexao.execute('''
+            CREATE TABLE IF NOT EXISTS cache_respostas (
+                chave TEXT PRIMARY KEY,
+                resposta TEXT,
+                criado_em REAL,
+                acessado_em REAL
+            )
+        ''')
+        conexao.execute('CREATE INDEX IF NOT EXISTS idx_cache_respostas_acesso ON cache_respostas (acessado_em)')
+        # Memória de tradução (ver traduzir_lote)
+        conexao.execute('''
+            CREATE TABLE IF NOT EXISTS memoria_traducao (
+                origem TEXT,
+                destino TEXT,
+                hash_texto TEXT,
+                traducao TEXT,
+                criado_em REAL,
+                PRIMARY KEY (origem, destino, hash_texto)
+            )
+        ''')
+        # Resultados do Stack Overflow por consulta normalizada (ver buscar_stackoverflow)
+        conexao.execute('''
+            CREATE TABLE IF NOT EXISTS cache_stackoverflow (
+                consulta TEXT PRIMARY KEY,
+                itens TEXT,
+                criado_em REAL
+            )
+        ''')
+
+def fechar_banco():
+    global banco, banco_cache, fila_escrita
+    # Grava o que ainda estiver na fila antes de fechar as conexões
+    if fila_escrita is not None:
+        fila_escrita.encerrar()
+        fila_escrita = None
+    for gerenciador in (banco, banco_cache):
+        if gerenciador is not None:
+            gerenciador.fechar()
+    banco = banco_cache = None
+
+# 🔎 Índice de texto completo (FTS5) espelhando o histórico, mantido por triggers
+def criar_indice_busca():
+    existia = banco.consultar_um("SELECT 1 FROM sqlite_master WHERE name = 'historico_fts'")
+    banco.executar('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS historico_fts
+        USING fts5(comando, resposta, content='historico', content_rowid='id')
+    ''')
+    banco.executar_script('''
+        CREATE TRIGGER IF NOT EXISTS historico_fts_ai AFTER INSERT ON historico BEGIN
+            INSERT INTO historico_fts (rowid, comando, resposta) VALUES (new.id, new.comando, new.resposta);
+        END;
+        CREATE TRIGGER IF NOT EXISTS historico_fts_ad AFTER DELETE ON historico BEGIN
+            INSERT INTO historico_fts (historico_fts, rowid, comando, resposta)
+            VALUES ('delete', old.id, old.comando, old.resposta);
+        END;
+        CREATE TRIGGER IF NOT EXISTS historico_fts_au AFTER UPDATE OF comando, resposta ON historico BEGIN
+            INSERT INTO historico_fts (historico_fts, rowid, comando, resposta)
+            VALUES ('delete', old.id, old.comando, old.resposta);
+            INSERT INTO historico_fts (rowid, comando, resposta) VALUES (new.id, new.comando, new.resposta);
+        END;
+    ''')
+    if not existia:
+        # Migração: indexa as linhas que já estavam no histórico
+        banco.executar("INSERT INTO historico_fts (historico_fts) VALUES ('rebuild')")
+
+# Inicialização explícita do programa interativo: banco + nome do jogador no ranking
+def iniciar(nome_usuario=None):
+    global usuario
+    iniciar_banco()
+    usuario = nome_usuario or input("Digite seu nome para o ranking: ")
+    if banco.executar('INSERT OR IGNORE INTO ranking (nome) VALUES (?)', (usuario,)).rowcount:
+        placar.registrar(usuario)
+
+# 💾 Cache de respostas do GPT (arquivo separado, ao lado do teteu.db)
+CACHE_TTL = 7 * 24 * 3600   # segundos
+CACHE_MAX_ITENS = 5000
+cache_stats = {"hits": 0, "misses": 0}
+_cache_lock = threading.Lock()
+
+def chave_cache(modelo, mensagens, temperature, max_tokens):
+    bruto = json.dumps([modelo, mensagens, temperature, max_tokens], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+# Os comandos auxiliares (explicar, resumir, biblioteca...) não dependem da conversa: a chave é só prompt +
+# modelo + parâmetros, senão o histórico, que cresce a cada resposta salva, faz o cache nunca acertar.
+# Pergunta livre (cache_com_contexto=True) depende do que veio antes e mantém o contexto na chave
+def chave_da_pergunta(prompt, mensagens, cache_com_contexto=False):
+    return chave_cache(modelo_gpt, mensagens if cache_com_contexto else prompt, 0.7, 1500)
+
+def ler_cache(chave):
+    agora = time.time()
+    linha = banco_cache.consultar_um('SELECT resposta, criado_em FROM cache_respostas WHERE chave = ?', (chave,))
+    valido = linha is not None and agora - linha[1] <= CACHE_TTL
+    with _cache_lock:
+        cache_stats["hits" if valido else "misses"] += 1
+    if valido:
+        banco_cache.executar('UPDATE cache_respostas SET acessado_em = ? WHERE chave = ?', (agora, chave))
+        return linha[0]
+    if linha:
+        banco_cache.executar('DELETE FROM cache_respostas WHERE chave = ?', (chave,))
+    return None
+
+def gravar_cache(chave, resposta):
+    agora = time.time()
+    with banco_cache.transacao() as conexao:
+        conexao.execute('INSERT OR REPLACE INTO cache_respostas VALUES (?, ?, ?, ?)', (chave, resposta, agora, agora))
+        # LRU: remove as entradas acessadas há mais tempo quando passa do limite
+        excesso = conexao.execute('SELECT COUNT(*) FROM cache_respostas').fetchone()[0] - CACHE_MAX_ITENS
+        if excesso > 0:
+            conexao.execute('''
+                DELETE FROM cache_respostas WHERE chave IN (
+                    SELECT chave FROM cache_respostas ORDER BY acessado_em LIMIT ?
+                )
+            ''', (excesso,))
+
+def limpar_cache():
+    banco_cache.executar('DELETE FROM cache_respostas')
+    with _cache_lock:
+        cache_stats["hits"] = cache_stats["misses"] = 0
+
+# 📏 Orçamento de tokens do contexto enviado a cada modelo
+ORCAMENTO_CONTEXTO = {"gpt-3.5-turbo": 3000, "gpt-4": 4000, "gpt-4-turbo": 8000, "gpt-4o": 8000, "gpt-4o-mini": 8000}
+ORCAMENTO_PADRAO = 3000
+TOKENS_POR_MENSAGEM = 4     # custo fixo de cada mensagem no formato de chat
+TOKENS_MINIMOS_TURNO = 64   # abaixo disso não vale a pena incluir um turno truncado
+_PEDACOS_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# Estimativa local: pontuação conta 1 token, palavras ~1 token a cada 5 caracteres
+def estimar_tokens(texto):
+    return sum((len(pedaco) + 4) // 5 for pedaco in _PEDACOS_TOKEN.findall(texto or ""))
+
+def tokens_do_turno(comando, resposta):
+    return estimar_tokens(comando) + estimar_tokens(resposta) + 2 * TOKENS_POR_MENSAGEM
+
+def truncar_para_tokens(texto, maximo, sufixo=" […]"):
+    if estimar_tokens(texto) <= maximo:
+        return texto
+    maximo -= estimar_tokens(sufixo)
+    usados = 0
+    for pedaco in _PEDACOS_TOKEN.finditer(texto):
+        usados += (len(pedaco.group()) + 4) // 5
+        if usados > maximo:
+            return texto[:pedaco.start()].rstrip() + sufixo
+    return texto
+
+# Recebe turnos (id, comando, resposta, tokens) em ordem de prioridade e fica com os que cabem no orçamento
+def _ajustar_ao_orcamento(linhas, orcamento):
+    registros = []
+    calculados = []
+    for id_, comando, resposta, tokens in linhas:
+        if tokens is None:
+            tokens = tokens_do_turno(comando, resposta)
+            calculados.append((tokens, id_))
+        if tokens > orcamento:
+            # Turno grande demais: entra com a resposta truncada, se ainda couber algo útil
+            restante = orcamento - estimar_tokens(comando) - 2 * TOKENS_POR_MENSAGEM
+            if restante >= TOKENS_MINIMOS_TURNO:
+                registros.append((id_, comando, truncar_para_tokens(resposta, restante)))
+            break
+        registros.append((id_, comando, resposta))
+        orcamento -= tokens
+    if calculados:
+        # Memoriza as contagens das linhas antigas para não recalcular a cada chamada
+        banco.executar_lote('UPDATE historico SET tokens = ? WHERE id = ?', calculados)
+    return registros
+
+# Preenche o contexto do mais recente para o mais antigo até esgotar o orçamento de tokens do modelo
+def obter_contexto(limite=None, orcamento=None):
+    if orcamento is None:
+        orcamento = ORCAMENTO_CONTEXTO.get(modelo_gpt, ORCAMENTO_PADRAO)
+    descarregar_escritas()
+    sql = 'SELECT id, comando, resposta, tokens FROM historico ORDER BY id DESC'
+    consulta = banco.executar(sql + ' LIMIT ?', (limite,)) if limite else banco.executar(sql)
+    registros = _ajustar_ao_orcamento(consulta, orcamento)
+    consulta.close()
     # Inverter para ordem cronológica
-    return registros[::-1]
+    return [(comando, resposta) for _, comando, resposta in registros[::-1]]
+
+# 🧭 Recuperação semântica: índice vetorial local (hashing de palavras), em arquivos mapeados em memória
+# modo_contexto = "semantico" troca os turnos mais recentes pelos mais parecidos com a pergunta (requer numpy)
+modo_contexto = "recentes"
+CONTEXTO_K = 5
+DIMENSAO_VETOR = 512
+ARQUIVO_VETORES = 'teteu_vetores.f32'
+ARQUIVO_IDS_VETORES = 'teteu_vetores.ids'
+_PALAVRAS_VAZIAS = frozenset(
+    "a o as os de da do das dos e em no na nos nas um uma para por com que se como é ao the of to and in is it".split()
+)
+_indice_lock = threading.Lock()
+_indice_mapeado = None  # (quantidade, vetores, ids) do último memmap aberto
+
+def _sem_acentos(texto):
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+
+def vetorizar(texto):
+    import numpy as np
+    vetor = np.zeros(DIMENSAO_VETOR, dtype=np.float32)
+    for palavra in re.findall(r"\w+", _sem_acentos((texto or "").lower())):
+        if palavra in _PALAVRAS_VAZIAS:
+            continue
+        h = int.from_bytes(hashlib.blake2b(palavra.encode("utf-8"), digest_size=8).digest(), "little")
+        # O bit mais alto define o sinal, para colisões se anularem em vez de se somarem
+        vetor[h % DIMENSAO_VETOR] += 1.0 if h >> 63 else -1.0
+    vetor = np.sign(vetor) * np.log1p(np.abs(vetor))
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma else vetor
+
+def _quantidade_indexada():
+    if not os.path.exists(ARQUIVO_IDS_VETORES) or not os.path.exists(ARQUIVO_VETORES):
+        return 0
+    # Os dois arquivos só crescem; se um append foi interrompido, vale o menor
+    return min(os.path.getsize(ARQUIVO_IDS_VETORES) // 8, os.path.getsize(ARQUIVO_VETORES) // (4 * DIMENSAO_VETOR))
+
+def _abrir_indice():
+    global _indice_mapeado
+    import numpy as np
+    quantidade = _quantidade_indexada()
+    if _indice_mapeado is None or _indice_mapeado[0] != quantidade:
+        if quantidade:
+            vetores = np.memmap(ARQUIVO_VETORES, dtype=np.float32, mode='r', shape=(quantidade, DIMENSAO_VETOR))
+            ids = np.memmap(ARQUIVO_IDS_VETORES, dtype=np.int64, mode='r', shape=(quantidade,))
+        else:
+            vetores, ids = np.zeros((0, DIMENSAO_VETOR), dtype=np.float32), np.zeros(0, dtype=np.int64)
+        _indice_mapeado = (quantidade, vetores, ids)
+    return _indice_mapeado[1], _indice_mapeado[2]
+
+# Indexa só as linhas novas do histórico, acrescentando ao fim dos arquivos (sem reconstruir o índice)
+def indexar_historico(lote=1000):
+    global _indice_mapeado
+    import numpy as np
+    descarregar_escritas()
+    with _indice_lock:
+        _, ids = _abrir_indice()
+        ultimo_id = int(ids[-1]) if len(ids) else 0
+        _indice_mapeado = None
+        consulta = banco.executar('SELECT id, comando, resposta FROM historico WHERE id > ? ORDER BY id', (ultimo_id,))
+        total = 0
+        while True:
+            linhas = consulta.fetchmany(lote)
+            if not linhas:
+                break
+            vetores = np.stack([vetorizar(f"{comando}\n{resposta}") for _, comando, resposta in linhas])
+            with open(ARQUIVO_VETORES, 'ab') as f:
+                f.write(vetores.astype(np.float32).tobytes())
+            with open(ARQUIVO_IDS_VETORES, 'ab') as f:
+                f.write(np.array([linha[0] for linha in linhas], dtype=np.int64).tobytes())
+            total += len(linhas)
+        return total
+
+def apagar_indice_vetorial():
+    global _indice_mapeado
+    with _indice_lock:
+        _indice_mapeado = None
+        for arquivo in (ARQUIVO_VETORES, ARQUIVO_IDS_VETORES):
+            if os.path.exists(arquivo):
+                os.remove(arquivo)
+
+# Top-k turnos mais parecidos com o prompt, cortados pelo orçamento de tokens e devolvidos em ordem cronológica
+def recuperar_contexto_semantico(prompt, k=CONTEXTO_K, orcamento=None):
+    import numpy as np
+    if orcamento is None:
+        orcamento = ORCAMENTO_CONTEXTO.get(modelo_gpt, ORCAMENTO_PADRAO)
+    indexar_historico()
+    with _indice_lock:
+        vetores, ids = _abrir_indice()
+        if not len(ids):
+            return []
+        similaridades = vetores @ vetorizar(prompt)
+        k = min(k, len(ids))
+        melhores = np.argpartition(-similaridades, k - 1)[:k]
+        melhores = melhores[np.argsort(-similaridades[melhores])]
+        escolhidos = [int(ids[i]) for i in melhores if similaridades[i] > 0]
+    if not escolhidos:
+        return []
+    linhas = banco.consultar(
+        f'SELECT id, comando, resposta, tokens FROM historico WHERE id IN ({",".join("?" * len(escolhidos))})',
+        escolhidos
+    )
+    # Os mais parecidos têm prioridade no orçamento
+    posicao = {id_: i for i, id_ in enumerate(escolhidos)}
+    linhas.sort(key=lambda linha: posicao[linha[0]])
+    registros = sorted(_ajustar_ao_orcamento(linhas, orcamento))
+    return [(comando, resposta) for _, comando, resposta in registros]
+
+def definir_modo_contexto(modo):
+    global modo_contexto
+    modo = _sem_acentos(modo.strip().lower())
+    if modo not in ("recentes", "semantico"):
+        print("⚠️ Use: contexto recentes | contexto semantico")
+        return
+    if modo == "semantico":
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            print("⚠️ O modo semântico precisa do numpy (pip install numpy).")
+            return
+    modo_contexto = modo
+    print(f"🧭 Contexto agora usa o modo: {modo_contexto}")
+
+def montar_mensagens(prompt, contexto_limite=None):
+    mensagens = []
+    # Adiciona contexto das últimas interações (ou das mais parecidas com a pergunta, no modo semântico)
+    if modo_contexto == "semantico":
+        contexto = recuperar_contexto_semantico(prompt, contexto_limite or CONTEXTO_K)
+    else:
+        contexto = obter_contexto(contexto_limite)
+    for comando, resposta in contexto:
+        mensagens.append({"role": "user", "content": comando})
+        mensagens.append({"role": "assistant", "content": resposta})
+    # Adiciona a nova pergunta com personalidade
+    prompt_personalizado = (
+        "Você é o TETEU, um assistente de programação divertido, que responde de forma descontraída e amigável, "
+        "usando gírias brasileiras quando possível. "
+        "Seja claro, didático e incentive o usuário a aprender. "
+        f"Pergunta do usuário: {prompt}"
+    )
+    mensagens.append({"role": "user", "content": prompt_personalizado})
+    return mensagens
 
 # Função para conversar com o GPT (atualizada para openai>=1.0.0)
-def perguntar_ao_gpt(prompt, contexto_limite=5):
+# `mensagens` pode vir pronta quando a chamada roda fora da thread principal (o SQLite só aceita a thread que o abriu)
+# usar_cache=False para comandos que devem variar a cada chamada (quiz, desafio)
+# stream=True devolve um gerador de pedaços de texto em vez da resposta inteira
+# O roteador manda o pedido para o provedor saudável mais rápido de `provedores` (PROVEDORES_PERGUNTA);
+# sem medição, ou com TETEU_ROTEAMENTO=preferencia, vale a ordem configurada (o GPT antes)
+def perguntar_ao_gpt(prompt, contexto_limite=None, mensagens=None, timeout=None, usar_cache=True, stream=False,
+                     provedores=None, cache_com_contexto=False):
+    if stream:
+        return perguntar_ao_gpt_stream(prompt, contexto_limite, mensagens, timeout, usar_cache, provedores,
+                                       cache_com_contexto)
     try:
-        mensagens = []
-        # Adiciona contexto das últimas interações
-        contexto = obter_contexto(contexto_limite)
-        for comando, resposta in contexto:
-            mensagens.append({"role": "user", "content": comando})
-            mensagens.append({"role": "assistant", "content": resposta})
-        # Adiciona a nova pergunta com personalidade
-        prompt_personalizado = (
-            "Você é o TETEU, um assistente de programação divertido, que responde de forma descontraída e amigável, "
-            "usando gírias brasileiras quando possível. "
-            "Seja claro, didático e incentive o usuário a aprender. "
-            f"Pergunta do usuário: {prompt}"
-        )
-        mensagens.append({"role": "user", "content": prompt_personalizado})
+        if mensagens is None:
+            mensagens = montar_mensagens(prompt, contexto_limite)
+        chave = chave_da_pergunta(prompt, mensagens, cache_com_contexto)
+        if usar_cache:
+            texto = ler_cache(chave)
+            if texto is not None:
+                return texto
 
-        resposta = client.chat.completions.create(
-            model=modelo_gpt,
-            messages=mensagens,
-            temperature=0.7,
-            max_tokens=1500
-        )
-        texto = resposta.choices[0].message.content.strip()
+        nome, texto = roteador.gerar(prompt, mensagens, timeout, provedores or PROVEDORES_PERGUNTA)
+        # Resposta de outro provedor é quebra-galho: não ocupa o lugar da do GPT no cache
+        if usar_cache and nome == "gpt":
+            gravar_cache(chave, texto)
         return texto
     except Exception as e:
-        if "insufficient_quota" in str(e):
-            return "⚠️ Sua cota da OpenAI acabou. Verifique seu plano e billing em https://platform.openai.com/account/usage"
-        return f"Erro ao acessar OpenAI: {e}"
+        return mensagem_erro_ia(e)
 
-# ⚙️ Função para executar código Python de forma segura
-def executar_codigo(codigo):
+# 🌊 Versão em streaming: entrega os tokens conforme chegam (stream=True do cliente OpenAI)
+def perguntar_ao_gpt_stream(prompt, contexto_limite=None, mensagens=None, timeout=None, usar_cache=True,
+                            provedores=None, cache_com_contexto=False):
+    partes = []
+    nome = None
     try:
-        byte_code = compile_restricted(codigo, '<string>', 'exec')
-        exec(byte_code, safe_globals.copy())
+        if mensagens is None:
+            mensagens = montar_mensagens(prompt, contexto_limite)
+        chave = chave_da_pergunta(prompt, mensagens, cache_com_contexto)
+        if usar_cache:
+            texto = ler_cache(chave)
+            if texto is not None:
+                yield texto
+                return
+
+        for nome, delta in roteador.gerar_stream(prompt, mensagens, timeout, provedores or PROVEDORES_PERGUNTA):
+            partes.append(delta)
+            yield delta
     except Exception as e:
-        print(f"Erro ao executar: {e}")
+        yield mensagem_erro_ia(e)
+        return
+    if usar_cache and partes and nome == "gpt":
+        gravar_cache(chave, "".join(partes).strip())
+
+# ⚙️ Execução de código em sandbox: pool de processos pré-aquecidos, cada execução com limite de
+# tempo de relógio, de CPU (RLIMIT_CPU), de memória (RLIMIT_AS) e de tamanho da saída
+SANDBOX_WORKERS = 2
+SANDBOX_RECICLAR_APOS = 50        # execuções por worker antes de trocá-lo por um novo
+SANDBOX_TEMPO_LIMITE = 5          # segundos de relógio
+SANDBOX_CPU_LIMITE = 3            # segundos de CPU
+SANDBOX_MEMORIA_MB = 256          # além do que o worker já ocupa ao nascer
+SANDBOX_SAIDA_MAX = 64 * 1024     # caracteres de stdout (e de stderr)
+
+class _SaidaLimitada(io.StringIO):
+    def __init__(self, limite):
+        super().__init__()
+        self.limite = limite
+        self.cortada = False
+
+    def write(self, texto):
+        restante = self.limite - self.tell()
+        if len(texto) > restante:
+            self.cortada = True
+            texto = texto[:max(restante, 0)]
+        super().write(texto)
+        return len(texto)
+
+# O RestrictedPython troca print(...) por _print_(...)._call_print(...); aqui vai direto para o stdout capturado
+class _ImpressaoSandbox:
+    def __init__(self, _getattr_=None):
+        self._getattr_ = _getattr_
+
+    def _call_print(self, *objetos, **kwargs):
+        kwargs["file"] = sys.stdout
+        print(*objetos, **kwargs)
+
+_OPERADORES_INPLACE = {
+    "+=": operator.iadd, "-=": operator.isub, "*=": operator.imul, "/=": operator.itruediv,
+    "//=": operator.ifloordiv, "%=": operator.imod, "**=": operator.ipow,
+}
+
+def _operacao_inplace(operacao, valor, operando):
+    if operacao not in _OPERADORES_INPLACE:
+        raise SyntaxError(f"Operador {operacao} não é permitido no sandbox.")
+    return _OPERADORES_INPLACE[operacao](valor, operando)
+
+def _globais_sandbox():
+    from RestrictedPython import safe_globals, limited_builtins
+    from RestrictedPython.Eval import default_guarded_getitem, default_guarded_getiter
+    from RestrictedPython.Guards import (
+        full_write_guard, guarded_iter_unpack_sequence, guarded_unpack_sequence, safer_getattr
+    )
+    globais = safe_globals.copy()
+    globais["__builtins__"] = {**safe_globals["__builtins__"], **limited_builtins}
+    globais.update(
+        __name__="__sandbox__",
+        _print_=_ImpressaoSandbox,
+        _getattr_=safer_getattr,
+        _getitem_=default_guarded_getitem,
+        _getiter_=default_guarded_getiter,
+        _iter_unpack_sequence_=guarded_iter_unpack_sequence,
+        _unpack_sequence_=guarded_unpack_sequence,
+        _write_=full_write_guard,
+        _inplacevar_=_operacao_inplace,
+    )
+    return globais
+
+def _compilar_restrito(codigo):
+    from RestrictedPython import compile_restricted
+    with warnings.catch_warnings():
+        # "Prints, but never reads 'printed' variable": o print aqui vai para o stdout capturado
+        warnings.simplefilter("ignore", SyntaxWarning)
+        return compile_restricted(codigo, '<string>', 'exec')
+
+# 🗜️ Cache do bytecode restrito: o mesmo código (exercícios, desafios repetidos) não passa de novo pela
+# transformação de AST do RestrictedPython. LRU em memória + cópia opcional em disco (marshal).
+# O worker executa o que sai do disco: a pasta é privada (0700) e cada entrada leva um HMAC com chave local
+CACHE_BYTECODE_MAX = 256
+PASTA_BYTECODE = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                              "teteu", "bytecode")   # None desliga o armazenamento em disco
+bytecode_stats = {"hits": 0, "hits_disco": 0, "misses": 0, "tempo_economizado": 0.0}
+_cache_bytecode = OrderedDict()     # hash -> (bytecode serializado, segundos gastos na compilação)
+_cache_bytecode_lock = threading.Lock()
+
+# Bytecode só vale para a mesma versão do Python e do RestrictedPython
+@functools.lru_cache(maxsize=None)
+def _etiqueta_bytecode():
+    return f"{importlib.util.MAGIC_NUMBER.hex()}-{_versao_pacote('RestrictedPython')}"
+
+def _arquivo_bytecode(chave):
+    return os.path.join(PASTA_BYTECODE, f"{chave}.marshal")
+
+# Chave da instalação (32 bytes aleatórios, 0600) dentro da pasta privada; None se a pasta não for só nossa
+@functools.lru_cache(maxsize=None)
+def _chave_hmac_bytecode(pasta):
+    try:
+        os.makedirs(pasta, mode=0o700, exist_ok=True)
+        info = os.stat(pasta)
+        if info.st_mode & 0o077 or (hasattr(os, "getuid") and info.st_uid != os.getuid()):
+            return None
+        arquivo = os.path.join(pasta, "chave")
+        try:
+            descritor = os.open(arquivo, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(arquivo, "rb") as f:
+                chave = f.read()
+            return chave if len(chave) == 32 else None
+        chave = os.urandom(32)
+        with os.fdopen(descritor, "wb") as f:
+            f.write(chave)
+        return chave
+    except OSError:
+        return None
+
+def _assinatura_bytecode(segredo, chave, dados):
+    return hmac.new(segredo, chave.encode("ascii") + dados, hashlib.sha256).digest()
+
+def _ler_bytecode_do_disco(chave):
+    segredo = PASTA_BYTECODE and _chave_hmac_bytecode(PASTA_BYTECODE)
+    if not segredo:
+        return None
+    arquivo = _arquivo_bytecode(chave)
+    try:
+        with open(arquivo, "rb") as f:
+            assinatura, dados = f.read(32), f.read()
+    except OSError:
+        return None
+    try:
+        if not hmac.compare_digest(assinatura, _assinatura_bytecode(segredo, chave, dados)):
+            raise ValueError("assinatura inválida")
+        bytecode, tempo = dados[8:], struct.unpack("<d", dados[:8])[0]
+        marshal.loads(bytecode)
+        return bytecode, tempo
+    except (ValueError, EOFError, TypeError, struct.error):
+        # Entrada adulterada ou corrompida: sai do disco e o código é recompilado
+        with contextlib.suppress(OSError):
+            os.remove(arquivo)
+        return None
+
+def _gravar_bytecode_no_disco(chave, bytecode, tempo):
+    segredo = PASTA_BYTECODE and _chave_hmac_bytecode(PASTA_BYTECODE)
+    if not segredo:
+        return
+    try:
+        dados = struct.pack("<d", tempo) + bytecode
+        temporario = f"{_arquivo_bytecode(chave)}.{os.getpid()}.{threading.get_ident()}"
+        with open(temporario, "wb") as f:
+            f.write(_assinatura_bytecode(segredo, chave, dados) + dados)
+        os.replace(temporario, _arquivo_bytecode(chave))
+    except OSError:
+        pass
+
+def _chave_do_codigo(codigo):
+    return hashlib.sha256(f"{_etiqueta_bytecode()}\0{codigo}".encode("utf-8")).hexdigest()
+
+# Tira do cache (memória e disco) um bytecode que o worker não conseguiu carregar
+def descartar_bytecode(codigo):
+    chave = _chave_do_codigo(codigo)
+    with _cache_bytecode_lock:
+        _cache_bytecode.pop(chave, None)
+    if PASTA_BYTECODE:
+        with contextlib.suppress(OSError):
+            os.remove(_arquivo_bytecode(chave))
+
+# Devolve o bytecode restrito já serializado (pronto para o pipe do worker); SyntaxError se o código for inválido
+def compilar_com_cache(codigo):
+    chave = _chave_do_codigo(codigo)
+    with _cache_bytecode_lock:
+        entrada = _cache_bytecode.get(chave)
+        if entrada:
+            _cache_bytecode.move_to_end(chave)
+            bytecode_stats["hits"] += 1
+            bytecode_stats["tempo_economizado"] += entrada[1]
+            return entrada[0]
+    entrada = _ler_bytecode_do_disco(chave)
+    if entrada:
+        with _cache_bytecode_lock:
+            bytecode_stats["hits_disco"] += 1
+            bytecode_stats["tempo_economizado"] += entrada[1]
+    else:
+        inicio = time.perf_counter()
+        bytecode = marshal.dumps(_compilar_restrito(codigo))
+        entrada = (bytecode, time.perf_counter() - inicio)
+        _gravar_bytecode_no_disco(chave, *entrada)
+        with _cache_bytecode_lock:
+            bytecode_stats["misses"] += 1
+    with _cache_bytecode_lock:
+        _cache_bytecode[chave] = entrada
+        _cache_bytecode.move_to_end(chave)
+        while len(_cache_bytecode) > CACHE_BYTECODE_MAX:
+            _cache_bytecode.popitem(last=False)
+    return entrada[0]
+
+def _memoria_atual():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+# Laço de cada worker: recebe código pelo pipe e devolve um dicionário com o resultado
+def _worker_sandbox(conexao, cpu_limite, memoria_mb, saida_max):
+    try:
+        import resource
+    except ImportError:  # Windows: sem rlimits, só o limite de relógio
+        resource = None
+    if resource:
+        limite_memoria = _memoria_atual() + memoria_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limite_memoria, limite_memoria))
+    while True:
+        try:
+            bytecode = conexao.recv()
+        except (EOFError, OSError):
+            break
+        if bytecode is None:
+            break
+        if resource:
+            # RLIMIT_CPU é acumulado pelo processo: o limite suave é reposicionado a cada execução
+            uso = resource.getrusage(resource.RUSAGE_SELF)
+            resource.setrlimit(resource.RLIMIT_CPU,
+                               (int(uso.ru_utime + uso.ru_stime) + cpu_limite, resource.RLIM_INFINITY))
+        conexao.send(_executar_no_worker(bytecode, saida_max))
+
+def _executar_no_worker(bytecode, saida_max):
+    saida, erros = _SaidaLimitada(saida_max), _SaidaLimitada(saida_max)
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        codigo = marshal.loads(bytecode)
+    except (ValueError, EOFError, TypeError) as e:
+        return {"ok": False, "erro": f"Bytecode inválido: {e}", "stdout": "", "stderr": "", "cortada": False,
+                "tempo": None, "bytecode_invalido": True}
+    with contextlib.redirect_stdout(saida), contextlib.redirect_stderr(erros):
+        try:
+            exec(codigo, _globais_sandbox())
+        except MemoryError:
+            erro = "Limite de memória excedido."
+        except BaseException as e:  # SystemExit do código do usuário também não derruba o worker
+            erro = str(e) or type(e).__name__
+    return {
+        "ok": erro is None,
+        "erro": erro,
+        "stdout": saida.getvalue(),
+        "stderr": erros.getvalue(),
+        "cortada": saida.cortada or erros.cortada,
+        "tempo": time.perf_counter() - inicio,
+    }
+
+class _TrabalhadorSandbox:
+    def __init__(self, contexto, cpu_limite, memoria_mb, saida_max):
+        self.conexao, conexao_filho = contexto.Pipe()
+        self.processo = contexto.Process(target=_worker_sandbox, args=(conexao_filho, cpu_limite, memoria_mb, saida_max),
+                                         daemon=True, name="teteu-sandbox")
+        self.processo.start()
+        conexao_filho.close()
+        self.execucoes = 0
+
+    def encerrar(self, educadamente=True):
+        try:
+            if educadamente:
+                self.conexao.send(None)
+                self.processo.join(1)
+        except (OSError, ValueError):
+            pass
+        if self.processo.is_alive():
+            self.processo.kill()
+            self.processo.join()
+        self.conexao.close()
+
+class PoolSandbox:
+    def __init__(self, workers=SANDBOX_WORKERS, reciclar_apos=SANDBOX_RECICLAR_APOS, cpu_limite=SANDBOX_CPU_LIMITE,
+                 memoria_mb=SANDBOX_MEMORIA_MB, saida_max=SANDBOX_SAIDA_MAX):
+        self._contexto = multiprocessing.get_context()
+        self._parametros = (cpu_limite, memoria_mb, saida_max)
+        self.reciclar_apos = reciclar_apos
+        self._ociosos = queue.Queue()
+        # Workers nascem já prontos (pré-aquecidos), para a execução não pagar a criação do processo
+        for _ in range(workers):
+            self._ociosos.put(self._novo())
+
+    def _novo(self):
+        return _TrabalhadorSandbox(self._contexto, *self._parametros)
+
+    def executar(self, codigo, tempo_limite=SANDBOX_TEMPO_LIMITE):
+        # A compilação (com cache) fica no processo principal; o worker recebe o bytecode pronto
+        try:
+            bytecode = compilar_com_cache(codigo)
+        except SyntaxError as e:
+            # compile_restricted junta todas as violações numa tupla
+            return self._falha("; ".join(e.args[0]) if e.args and isinstance(e.args[0], tuple) else str(e))
+        trabalhador = self._ociosos.get()
+        try:
+            try:
+                trabalhador.conexao.send(bytecode)
+                if not trabalhador.conexao.poll(tempo_limite):
+                    trabalhador.encerrar(educadamente=False)
+                    trabalhador = self._novo()
+                    return self._falha(f"Tempo limite de {tempo_limite}s excedido.")
+                resultado = trabalhador.conexao.recv()
+            except (EOFError, OSError):
+                # O worker morreu no meio da execução (SIGXCPU pelo limite de CPU, ou o kernel sem memória)
+                trabalhador.processo.join(1)
+                morto_por_cpu = trabalhador.processo.exitcode == -getattr(signal, "SIGXCPU", 0)
+                trabalhador.encerrar(educadamente=False)
+                trabalhador = self._novo()
+                if morto_por_cpu:
+                    return self._falha(f"Limite de {self._parametros[0]}s de CPU excedido.")
+                return self._falha("A execução foi interrompida (limite de CPU ou de memória).")
+            if resultado.pop("bytecode_invalido", False):
+                descartar_bytecode(codigo)
+            trabalhador.execucoes += 1
+            if trabalhador.execucoes >= self.reciclar_apos:
+                trabalhador.encerrar()
+                trabalhador = self._novo()
+            return resultado
+        finally:
+            self._ociosos.put(trabalhador)
+
+    def _falha(self, erro):
+        return {"ok": False, "erro": erro, "stdout": "", "stderr": "", "cortada": False, "tempo": None}
+
+    def encerrar(self):
+        while True:
+            try:
+                self._ociosos.get_nowait().encerrar()
+            except queue.Empty:
+                break
+
+_pool_sandbox = None
+_pool_sandbox_lock = threading.Lock()
+
+def executar_no_sandbox(codigo, tempo_limite=SANDBOX_TEMPO_LIMITE):
+    global _pool_sandbox
+    with _pool_sandbox_lock:
+        if _pool_sandbox is None:
+            _pool_sandbox = PoolSandbox()
+    return _pool_sandbox.executar(codigo, tempo_limite)
+
+def encerrar_sandbox():
+    global _pool_sandbox
+    with _pool_sandbox_lock:
+        if _pool_sandbox is not None:
+            _pool_sandbox.encerrar()
+            _pool_sandbox = None
+
+def executar_codigo(codigo):
+    resultado = executar_no_sandbox(codigo)
+    if resultado["stdout"]:
+        print(resultado["stdout"], end="" if resultado["stdout"].endswith("\n") else "\n")
+    if resultado["stderr"]:
+        print(resultado["stderr"], end="", file=sys.stderr)
+    if resultado["cortada"]:
+        print(f"✂️ Saída cortada em {SANDBOX_SAIDA_MAX} caracteres.")
+    if not resultado["ok"]:
+        print(f"Erro ao executar: {resultado['erro']}")
+    return resultado
 
 # 📜 Mostrar histórico
 def mostrar_historico(limite=10):
-    cur.execute('SELECT id, comando, resposta FROM historico ORDER BY id DESC LIMIT ?', (limite,))
-    registros = cur.fetchall()
+    descarregar_escritas()
+    registros = banco.consultar('SELECT id, comando, resposta FROM historico ORDER BY id DESC LIMIT ?', (limite,))
     if registros:
         for r in registros[::-1]:
             print(f"\n🆔 {r[0]} — Comando: {r[1]}\nResposta: {r[2]}")
@@ -103,309 +1290,2467 @@ def mostrar_historico(limite=10):
         print("📭 Histórico vazio.")
 
 # 🔍 Buscar no histórico
-def buscar_no_historico(termo):
-    cur.execute("SELECT id, comando, resposta FROM historico WHERE comando LIKE ? OR resposta LIKE ? ORDER BY id", 
-                (f"%{termo}%", f"%{termo}%"))
-    resultados = cur.fetchall()
+# Cada palavra vira um prefixo entre aspas ("pri"* acha print, printf...), sem expor a sintaxe do FTS5
+def _consulta_fts(termo):
+    return " ".join(f'"{palavra}"*' for palavra in re.findall(r"\w+", termo))
+
+# Devolve (resultados, tem_mais); os resultados são (id, comando, resposta) com os trechos encontrados entre « »
+def pesquisar_historico(termo, pagina=1, por_pagina=10):
+    descarregar_escritas()
+    deslocamento = (max(pagina, 1) - 1) * por_pagina
+    consulta = _consulta_fts(termo)
+    if busca_fts and consulta:
+        resultados = banco.consultar("""
+            SELECT rowid, snippet(historico_fts, 0, '«', '»', '…', 16), snippet(historico_fts, 1, '«', '»', '…', 32)
+            FROM historico_fts WHERE historico_fts MATCH ?
+            ORDER BY bm25(historico_fts) LIMIT ? OFFSET ?
+        """, (consulta, por_pagina + 1, deslocamento))
+    else:
+        resultados = banco.consultar(
+            "SELECT id, comando, resposta FROM historico WHERE comando LIKE ? OR resposta LIKE ? ORDER BY id LIMIT ? OFFSET ?",
+            (f"%{termo}%", f"%{termo}%", por_pagina + 1, deslocamento))
+    return resultados[:por_pagina], len(resultados) > por_pagina
+
+def buscar_no_historico(termo, pagina=1, por_pagina=10):
+    resultados, tem_mais = pesquisar_historico(termo, pagina, por_pagina)
     if resultados:
         for r in resultados:
             print(f"\n🆔 {r[0]} — Comando: {r[1]}\nResposta: {r[2]}")
+        if tem_mais:
+            print(f"\n📄 Página {pagina} — há mais resultados na página {pagina + 1}.")
     else:
         print(f"🔍 Nada encontrado para '{termo}'.")
 
+# Gerada a partir do registro de comandos (na ordem em que foram registrados)
 def mostrar_ajuda():
-    print("""
-Comandos disponíveis:
-- sair: Encerra o programa
-- exec <codigo>: Executa código Python
-- historico: Mostra as últimas interações
-- buscar <termo>: Busca no histórico
-- limpar_historico: Limpa todo o histórico
-- exportar_historico: Exporta o histórico para um arquivo
-- exportar_para_notebook: Exporta o histórico para Jupyter Notebook
-- modelo <nome>: Troca o modelo GPT (ex: modelo gpt-4)
-- explica <codigo>: Explica detalhadamente um código Python
-- resuma <texto>: Resume um texto longo
-- erro <mensagem>: Explica um erro de Python e como resolver
-- corrija <codigo>: Sugere melhorias e corrige um código Python
-- quiz: Recebe uma pergunta de múltipla escolha sobre programação
-- desafio: Recebe um desafio de programação para praticar
-- ranking: Mostra o ranking de pontuação dos quizzes
-- corrigir_exercicio <codigo_do_aluno> <gabarito>: Corrige automaticamente um exercício comparando com o gabarito
-- explica_erro <mensagem de erro>: Explica o erro de execução do Python
-- mini_projeto <tema>: Cria um mini-projeto guiado em etapas
-- desafio_diario: Recebe um desafio de programação para o dia
-- entrevista: Simula uma entrevista técnica de Python
-- conceito <tema>: Explica um conceito de Python de forma didática
-- materiais: Sugere materiais gratuitos para aprender Python
-- materiais_personalizados <tema>: Sugere materiais gratuitos sobre um tema específico
-- curva_aprendizado: Mostra sua evolução em quizzes e pontos
-- exercicios_online <tema>: Sugere exercícios online gratuitos sobre um tema
-- debug <codigo>: Simula a execução passo a passo de um código Python
-- stackoverflow <pergunta>: Busca respostas no Stack Overflow
-- biblioteca <nome>: Explica para que serve uma biblioteca Python e mostra exemplo
-- analisar <codigo>: Analisa o código com linters e IA
-- projetos <nível>: Sugere ideias de projetos por nível (iniciante, intermediário, avançado)
-- ajuda: Mostra esta mensagem de ajuda
-""")
+    linhas = ["", "Comandos disponíveis:"]
+    for comando in dict.fromkeys(COMANDOS.values()):
+        nome = f"{comando.nome} {comando.uso}".strip()
+        if comando.apelidos:
+            nome += f" (ou {', '.join(comando.apelidos)})"
+        linhas.append(f"- {nome}: {comando.ajuda}")
+    print("\n".join(linhas) + "\n")
 
 def limpar_historico():
-    cur.execute('DELETE FROM historico')
-    con.commit()
+    descarregar_escritas()
+    banco.executar('DELETE FROM historico')
+    apagar_indice_vetorial()
     print("🧹 Histórico limpo com sucesso!")
 
-def exportar_historico():
-    cur.execute('SELECT id, comando, resposta FROM historico ORDER BY id')
-    registros = cur.fetchall()
-    if registros:
-        with open("historico_teteu.txt", "w", encoding="utf-8") as f:
-            for r in registros:
-                f.write(f"ID: {r[0]}\nComando: {r[1]}\nResposta: {r[2]}\n{'-'*40}\n")
-        print("📤 Histórico exportado para 'historico_teteu.txt'.")
+# 📤 Exportação em streaming: o histórico é lido em lotes pelo cursor e escrito linha a linha,
+# com memória constante; "incremental" exporta só o que entrou depois da última exportação para o mesmo arquivo
+EXPORTACAO_LOTE = 500
+FORMATOS_EXPORTACAO = {".txt": "txt", ".jsonl": "jsonl", ".ndjson": "jsonl", ".ipynb": "ipynb"}
+
+# Datas aceitam timestamp, date/datetime ou texto ISO ("2024-05-01", "2024-05-01T13:00"); data_fim é exclusiva
+def _para_timestamp(valor):
+    import datetime
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    if isinstance(valor, str):
+        valor = datetime.datetime.fromisoformat(valor)
+    if not isinstance(valor, datetime.datetime):
+        valor = datetime.datetime.combine(valor, datetime.time())
+    return valor.timestamp()
+
+def iterar_historico(id_inicio=None, id_fim=None, data_inicio=None, data_fim=None, lote=None):
+    lote = lote or EXPORTACAO_LOTE
+    filtros, params = [], []
+    for condicao, valor in (('id >= ?', id_inicio), ('id <= ?', id_fim),
+                            ('criado_em >= ?', data_inicio), ('criado_em < ?', data_fim)):
+        if valor is not None:
+            filtros.append(condicao)
+            params.append(valor if condicao.startswith('id') else _para_timestamp(valor))
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+    descarregar_escritas()
+    # Cursor próprio: não interfere no cursor global usado pelo resto do programa
+    cursor = banco.executar(f'SELECT id, comando, resposta FROM historico {where} ORDER BY id', params)
+    try:
+        while True:
+            linhas = cursor.fetchmany(lote)
+            if not linhas:
+                break
+            yield from linhas
+    finally:
+        cursor.close()
+
+def _ultimo_id_exportado(destino):
+    linha = banco.consultar_um('SELECT ultimo_id FROM exportacoes WHERE destino = ?', (destino,))
+    return linha[0] if linha else 0
+
+def _registrar_exportacao(destino, ultimo_id):
+    banco.executar('INSERT OR REPLACE INTO exportacoes VALUES (?, ?, ?)', (destino, ultimo_id, time.time()))
+
+def _escrever_txt(f, linhas):
+    for id_, comando, resposta in linhas:
+        f.write(f"ID: {id_}\nComando: {comando}\nResposta: {resposta}\n{'-'*40}\n")
+        yield id_
+
+def _escrever_jsonl(f, linhas):
+    for id_, comando, resposta in linhas:
+        f.write(json.dumps({"id": id_, "comando": comando, "resposta": resposta}, ensure_ascii=False) + "\n")
+        yield id_
+
+_RODAPE_IPYNB = b'\n ],\n "metadata": '
+
+# O .ipynb é um único objeto JSON: as células são escritas uma a uma entre o cabeçalho e o rodapé,
+# sem montar o notebook inteiro em memória. continuacao (incremental) escreve só as células novas, que
+# entram no lugar do rodapé de um notebook já exportado: True se ele já tem células (vírgula antes)
+def _escrever_ipynb(f, linhas, continuacao=None):
+    import nbformat as nbf
+    if continuacao is None:
+        f.write('{\n "cells": [\n')
+    for i, (id_, comando, resposta) in enumerate(linhas):
+        celula = nbf.v4.new_markdown_cell(f"**Comando:** `{comando}`\n\n**Resposta:**\n{resposta}")
+        f.write((",\n" if i or continuacao else "") + json.dumps(celula, ensure_ascii=False))
+        yield id_
+    if continuacao is None:
+        nb = nbf.v4.new_notebook()
+        f.write(f'\n ],\n "metadata": {json.dumps(nb.metadata)},\n'
+                f' "nbformat": {nb.nbformat},\n "nbformat_minor": {nb.nbformat_minor}\n}}\n')
+
+# Onde começa o rodapé de um .ipynb escrito por _escrever_ipynb (só o fim do arquivo é lido) e se a lista
+# de células já tem alguma. ValueError se o notebook foi regravado por outro programa
+def _rodape_ipynb(arquivo):
+    arquivo.seek(0, os.SEEK_END)
+    tamanho = arquivo.tell()
+    inicio = max(0, tamanho - 64 * 1024)
+    arquivo.seek(inicio)
+    fim = arquivo.read()
+    posicao = fim.rfind(_RODAPE_IPYNB)
+    if posicao < 0:
+        raise ValueError("o notebook foi alterado fora do TETEU; exporte de novo sem incremental")
+    antes = fim[:posicao].rstrip()
+    if not antes and inicio:
+        arquivo.seek(inicio - 1)
+        antes = arquivo.read(1)
+    return inicio + posicao, not antes.endswith(b"[")
+
+def _copiar_trecho(origem, destino, inicio, fim=None):
+    origem.seek(inicio)
+    restante = None if fim is None else fim - inicio
+    while restante is None or restante > 0:
+        bloco = origem.read(1 << 20 if restante is None else min(restante, 1 << 20))
+        if not bloco:
+            break
+        destino.write(bloco)
+        if restante is not None:
+            restante -= len(bloco)
+
+ESCRITORES_EXPORTACAO = {"txt": _escrever_txt, "jsonl": _escrever_jsonl, "ipynb": _escrever_ipynb}
+
+def exportar(caminho, formato=None, id_inicio=None, id_fim=None, data_inicio=None, data_fim=None, incremental=False):
+    formato = formato or FORMATOS_EXPORTACAO.get(os.path.splitext(caminho)[1].lower(), "txt")
+    destino = os.path.abspath(caminho)
+    # A marca d'água só vale para quem exportou tudo até ali: um filtro deixaria linhas para trás
+    registrar = incremental or (id_inicio, id_fim, data_inicio, data_fim) == (None, None, None, None)
+    if incremental:
+        id_inicio = max(id_inicio or 0, _ultimo_id_exportado(destino) + 1)
+    linhas = iterar_historico(id_inicio, id_fim, data_inicio, data_fim)
+    primeira = next(linhas, None)
+    if primeira is None:
+        # Nada a exportar: o arquivo que já existe fica intacto
+        linhas.close()
+        return 0
+    linhas = itertools.chain([primeira], linhas)
+    escritor = ESCRITORES_EXPORTACAO[formato]
+    total, ultimo_id = 0, None
+    # txt e jsonl recebem os registros novos no fim do arquivo
+    if incremental and formato != "ipynb":
+        with open(caminho, "a", encoding="utf-8") as f:
+            for ultimo_id in escritor(f, linhas):
+                total += 1
+    else:
+        # Um .ipynb incremental é copiado em blocos até o rodapé, recebe as células novas e o rodapé antigo.
+        # O arquivo novo é montado ao lado e só substitui o antigo (os.replace) quando está completo
+        with contextlib.ExitStack() as pilha:
+            antigo = None
+            if incremental and os.path.exists(caminho):
+                antigo = pilha.enter_context(open(caminho, "rb"))
+                rodape, tem_celulas = _rodape_ipynb(antigo)
+                escritor = functools.partial(escritor, continuacao=tem_celulas)
+            temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(temporario, "w", encoding="utf-8") as f:
+                    if antigo:
+                        _copiar_trecho(antigo, f.buffer, 0, rodape)
+                    for ultimo_id in escritor(f, linhas):
+                        total += 1
+                    if antigo:
+                        f.flush()
+                        _copiar_trecho(antigo, f.buffer, rodape)
+                os.replace(temporario, caminho)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(temporario)
+                raise
+    if registrar:
+        _registrar_exportacao(destino, ultimo_id)
+    return total
+
+def exportar_historico(caminho="historico_teteu.txt", **filtros):
+    total = exportar(caminho, **filtros)
+    if total:
+        print(f"📤 {total} registros exportados para '{caminho}'.")
+    else:
+        print("📭 Histórico vazio, nada para exportar.")
+
+def exportar_para_notebook(caminho="historico_teteu.ipynb", **filtros):
+    if exportar(caminho, formato="ipynb", **filtros):
+        print(f"📓 Histórico exportado para '{caminho}'.")
     else:
         print("📭 Histórico vazio, nada para exportar.")
 
-def exportar_para_notebook():
-    cur.execute('SELECT comando, resposta FROM historico ORDER BY id')
-    registros = cur.fetchall()
-    nb = nbf.v4.new_notebook()
-    cells = []
-    for comando, resposta in registros:
-        cells.append(nbf.v4.new_markdown_cell(f"**Comando:** `{comando}`\n\n**Resposta:**\n{resposta}"))
-    nb['cells'] = cells
-    with open("historico_teteu.ipynb", "w", encoding="utf-8") as f:
-        nbf.write(nb, f)
-    print("📓 Histórico exportado para 'historico_teteu.ipynb'.")
-
-def explicar_codigo(codigo):
+def explicar_codigo(codigo, stream=False):
     prompt = f"Explique detalhadamente o que faz o seguinte código Python:\n\n{codigo}"
-    return perguntar_ao_gpt(prompt)
+    return perguntar_ao_gpt(prompt, stream=stream)
 
-def resumir_texto(texto):
+def resumir_texto(texto, stream=False):
     prompt = f"Resuma o texto a seguir em poucas linhas, de forma clara e objetiva:\n\n{texto}"
-    return perguntar_ao_gpt(prompt)
+    return perguntar_ao_gpt(prompt, stream=stream)
 
-def explicar_erro(erro):
+def explicar_erro(erro, stream=False):
     prompt = f"Explique o seguinte erro de Python e como resolvê-lo:\n\n{erro}"
-    return perguntar_ao_gpt(prompt)
+    return perguntar_ao_gpt(prompt, stream=stream)
 
-def corrigir_codigo(codigo):
+def corrigir_codigo(codigo, stream=False):
     prompt = f"Revise o seguinte código Python, aponte erros e sugira melhorias:\n\n{codigo}"
-    return perguntar_ao_gpt(prompt)
+    return perguntar_ao_gpt(prompt, stream=stream)
 
-def sugerir_materiais():
+def sugerir_materiais(stream=False):
     prompt = "Sugira materiais gratuitos para aprender Python, como sites, vídeos e livros."
-    return perguntar_ao_gpt(prompt)
+    return perguntar_ao_gpt(prompt, stream=stream)
 
-def quiz_programacao():
+def quiz_programacao(stream=False):
     prompt = (
         "Crie uma pergunta de múltipla escolha sobre programação Python, "
         "com 4 alternativas e indique a correta no final."
     )
-    return perguntar_ao_gpt(prompt)
+    return perguntar_ao_gpt(prompt, usar_cache=False, stream=stream)
 
-def desafio_programacao():
+def desafio_programacao(stream=False):
     prompt = (
         "Me proponha um desafio simples de programação em Python para iniciantes, "
         "explique o que deve ser feito e mostre a solução ao final."
     )
-    return perguntar_ao_gpt(prompt)
+    return perguntar_ao_gpt(prompt, usar_cache=False, stream=stream)
 
-def explicar_biblioteca(nome):
+def explicar_biblioteca(nome, stream=False):
     prompt = f"Explique para que serve a biblioteca Python '{nome}' e mostre um exemplo de uso."
-    return perguntar_ao_gpt(prompt)
+    return perguntar_ao_gpt(prompt, stream=stream)
+
+def corrigir_exercicio(codigo_aluno, gabarito, stream=False):
+    prompt = (
+        "Corrija o exercício de Python de um aluno comparando com o gabarito. Diga se a solução está correta, "
+        "aponte os erros e dê uma nota de 0 a 10.\n\n"
+        f"Código do aluno:\n{codigo_aluno}\n\nGabarito:\n{gabarito}"
+    )
+    return perguntar_ao_gpt(prompt, stream=stream)
+
+def criar_mini_projeto(tema, stream=False):
+    prompt = f"Crie um mini-projeto guiado em Python sobre '{tema}', dividido em etapas curtas, com o objetivo de cada etapa."
+    return perguntar_ao_gpt(prompt, stream=stream)
+
+def desafio_diario(stream=False):
+    import datetime
+    # A data no prompt faz o cache devolver o mesmo desafio o dia inteiro
+    prompt = (
+        f"Desafio de programação Python do dia {datetime.date.today().isoformat()}: proponha um exercício curto, "
+        "explique o que deve ser feito e mostre a solução ao final."
+    )
+    return perguntar_ao_gpt(prompt, stream=stream)
 
-def buscar_stackoverflow(pergunta):
-    url = "https://api.stackexchange.com/2.3/search/advanced"
+def simular_entrevista(stream=False):
+    prompt = (
+        "Simule uma entrevista técnica de Python para uma vaga júnior: faça 3 perguntas, uma de cada vez "
+        "(conceito, código e resolução de problema), e mostre ao final o que se espera de uma boa resposta."
+    )
+    return perguntar_ao_gpt(prompt, usar_cache=False, stream=stream)
+
+def explicar_conceito(tema, stream=False):
+    prompt = f"Explique o conceito de Python '{tema}' de forma didática, com um exemplo simples e um erro comum."
+    return perguntar_ao_gpt(prompt, stream=stream)
+
+def sugerir_materiais_personalizados(tema, stream=False):
+    prompt = f"Sugira materiais gratuitos (cursos, artigos, vídeos, documentação) para aprender '{tema}' em Python."
+    return perguntar_ao_gpt(prompt, stream=stream)
+
+def sugerir_exercicios_online(tema, stream=False):
+    prompt = f"Sugira sites com exercícios online gratuitos de Python sobre '{tema}', dizendo o nível de cada um."
+    return perguntar_ao_gpt(prompt, stream=stream)
+
+def simular_execucao(codigo, stream=False):
+    prompt = (
+        "Simule a execução passo a passo do código Python abaixo, mostrando o valor das variáveis "
+        f"a cada linha e a saída final:\n\n{codigo}"
+    )
+    return perguntar_ao_gpt(prompt, stream=stream)
+
+# 🔍 Busca no Stack Overflow com cache local: todos os itens de uma busca ficam guardados em
+# teteu_cache.db, então repetir a pergunta ou pedir o "proximo" resultado não gasta cota da API
+STACKEXCHANGE_URL = os.getenv("TETEU_STACKEXCHANGE_URL", "https://api.stackexchange.com/2.3")
+STACKOVERFLOW_TTL = 24 * 3600   # segundos
+STACKOVERFLOW_MAX_ITENS = 2000
+stackoverflow_stats = {"hits": 0, "misses": 0, "requisicoes": 0}
+_stackoverflow_lock = threading.Lock()
+_buscas_em_andamento = {}       # consulta normalizada -> Future da requisição em curso
+_ultima_busca = {"pergunta": None, "posicao": 0}
+
+# Só a chave do cache é normalizada (caixa, acentos, espaços); textos não latinos continuam inteiros
+def normalizar_consulta(pergunta):
+    return " ".join(re.findall(r"[\w#+.]+", _sem_acentos(pergunta.lower())))
+
+def _ler_cache_stackoverflow(consulta):
+    linha = banco_cache.consultar_um('SELECT itens, criado_em FROM cache_stackoverflow WHERE consulta = ?', (consulta,))
+    if linha and time.time() - linha[1] <= STACKOVERFLOW_TTL:
+        return json.loads(linha[0])
+    return None
+
+def _gravar_cache_stackoverflow(consulta, itens):
+    with banco_cache.transacao() as conexao:
+        conexao.execute('INSERT OR REPLACE INTO cache_stackoverflow VALUES (?, ?, ?)',
+                        (consulta, json.dumps(itens, ensure_ascii=False), time.time()))
+        excesso = conexao.execute('SELECT COUNT(*) FROM cache_stackoverflow').fetchone()[0] - STACKOVERFLOW_MAX_ITENS
+        if excesso > 0:
+            conexao.execute('''
+                DELETE FROM cache_stackoverflow WHERE consulta IN (
+                    SELECT consulta FROM cache_stackoverflow ORDER BY criado_em LIMIT ?
+                )
+            ''', (excesso,))
+
+def _consultar_stackexchange(pergunta):
+    url = f"{STACKEXCHANGE_URL}/search/advanced"
     params = {
         "order": "desc",
         "sort": "relevance",
-        "q": pergunta,
+        "q": pergunta.strip(),
         "site": "stackoverflow",
         "accepted": True,
-        "answers": 1
+        "answers": 1,
+        "pagesize": 30,
     }
-    resp = requests.get(url, params=params)
+    stackoverflow_stats["requisicoes"] += 1
+    resp = requisicao_http("GET", url, params=params)
     data = resp.json()
-    if data["items"]:
-        titulo = data["items"][0]["title"]
-        link = data["items"][0]["link"]
-        return f"Encontrei isso no Stack Overflow:\n{titulo}\n{link}"
-    else:
+    # O StackExchange pede, no campo "backoff", um intervalo mínimo antes da próxima chamada ao mesmo método
+    if data.get("backoff"):
+        registrar_backoff(url, data["backoff"])
+    if "items" not in data:
+        raise RuntimeError(data.get("error_message") or f"HTTP {resp.status_code}")
+    # Guarda só o necessário para exibir cada resultado
+    return [{"title": item["title"], "link": item["link"], "score": item.get("score", 0)} for item in data["items"]]
+
+def itens_stackoverflow(pergunta):
+    consulta = normalizar_consulta(pergunta)
+    itens = _ler_cache_stackoverflow(consulta)
+    if itens is not None:
+        stackoverflow_stats["hits"] += 1
+        return consulta, itens
+    # Single-flight: quem pede a mesma consulta enquanto ela está em curso recebe a mesma resposta
+    with _stackoverflow_lock:
+        tarefa = _buscas_em_andamento.get(consulta)
+        dono = tarefa is None
+        if dono:
+            tarefa = _buscas_em_andamento[consulta] = Future()
+    if not dono:
+        stackoverflow_stats["hits"] += 1
+        return consulta, tarefa.result()
+    stackoverflow_stats["misses"] += 1
+    try:
+        itens = _consultar_stackexchange(pergunta)
+        _gravar_cache_stackoverflow(consulta, itens)
+        tarefa.set_result(itens)
+        return consulta, itens
+    except Exception as e:
+        tarefa.set_exception(e)
+        raise
+    finally:
+        with _stackoverflow_lock:
+            _buscas_em_andamento.pop(consulta, None)
+
+def buscar_stackoverflow(pergunta, posicao=0):
+    try:
+        _, itens = itens_stackoverflow(pergunta)
+    except Exception as e:
+        return f"Erro ao buscar no Stack Overflow: {e}"
+    _ultima_busca.update(pergunta=pergunta, posicao=posicao)
+    if not itens:
         return "Nenhuma resposta encontrada no Stack Overflow."
+    if posicao >= len(itens):
+        return "Não há mais resultados para essa busca no Stack Overflow."
+    item = itens[posicao]
+    return f"Encontrei isso no Stack Overflow ({posicao + 1}/{len(itens)}):\n{html.unescape(item['title'])}\n{item['link']}"
 
-import subprocess
-import os
+# Próximo item da última busca, servido pelo cache
+def proximo_stackoverflow():
+    if _ultima_busca["pergunta"] is None:
+        return "Faça uma busca primeiro: stackoverflow <pergunta>"
+    return buscar_stackoverflow(_ultima_busca["pergunta"], _ultima_busca["posicao"] + 1)
 
-def analisar_codigo(codigo):
-    with open("temp_code.py", "w", encoding="utf-8") as f:
-        f.write(codigo)
-    resultados = []
+# 📁 Pasta temporária exclusiva deste processo: nada é escrito no diretório atual nem compartilhado
+# com outras instâncias; é removida por limpar_arquivos_temporarios (também registrada no atexit)
+_pasta_privada = None
+_pasta_privada_lock = threading.Lock()
+
+def pasta_privada():
+    global _pasta_privada
+    with _pasta_privada_lock:
+        if _pasta_privada is None:
+            _pasta_privada = tempfile.mkdtemp(prefix=f"teteu-{os.getpid()}-")
+        return _pasta_privada
+
+# 🧹 Linters em processos persistentes: cada worker importa flake8/pylint/mypy/black uma única vez
+# e recebe o código em memória (pelo stdin da ferramenta), sem arquivo temporário
+FERRAMENTAS_LINT = ("flake8", "pylint", "mypy", "black")
+ARGS_PYLINT = ["--disable=all", "--enable=E,W", "--score=n", "--persistent=n"]
+TEMPO_LIMITE_LINT = 60  # segundos por ferramenta
+_pool_linters = None
+_pool_linters_lock = threading.Lock()
+_tarefas_linters = {}  # pool -> Futures ainda em andamento nele
+_pasta_worker = None  # dentro de um worker: subpasta própria (cache do mypy)
+
+def _iniciar_worker_linter(pasta_pai):
+    global _pasta_worker
+    _pasta_worker = tempfile.mkdtemp(prefix="worker-", dir=pasta_pai)
+    for modulo in ("flake8.main.cli", "pylint.lint", "mypy.api", "black"):
+        try:
+            importlib.import_module(modulo)
+        except ImportError:
+            pass
+
+def _obter_pool_linters():
+    global _pool_linters
+    with _pool_linters_lock:
+        if _pool_linters is None:
+            try:
+                _pool_linters = ProcessPoolExecutor(max_workers=len(FERRAMENTAS_LINT), initializer=_iniciar_worker_linter,
+                                                    initargs=(pasta_privada(),))
+            except (OSError, NotImplementedError):
+                return None
+        return _pool_linters
+
+def _matar_workers(pool):
+    for processo in list((getattr(pool, "_processes", None) or {}).values()):
+        try:
+            processo.terminate()
+        except Exception:
+            pass
+    pool.shutdown(wait=False, cancel_futures=True)
+
+# Worker travado: as próximas análises já vão para um pool novo; o antigo termina as tarefas que ainda
+# tem (de outras análises) e depois seus processos são terminados, levando junto o travado
+def _aposentar_pool_linters(pool):
+    global _pool_linters
+    with _pool_linters_lock:
+        if _pool_linters is not pool:
+            return  # já aposentado por outra tarefa
+        _pool_linters = None
+        pendentes = set(_tarefas_linters.get(pool, ()))
+
+    def encerrar():
+        wait(pendentes, timeout=TEMPO_LIMITE_LINT)
+        with _pool_linters_lock:
+            _tarefas_linters.pop(pool, None)
+        _matar_workers(pool)
+    threading.Thread(target=encerrar, name="teteu-linters-aposentar", daemon=True).start()
+
+def _enviar_linter(pool, ferramenta, codigo):
+    tarefa = pool.submit(_rodar_linter, ferramenta, codigo)
+    with _pool_linters_lock:
+        _tarefas_linters.setdefault(pool, set()).add(tarefa)
+
+    def concluida(tarefa):
+        with _pool_linters_lock:
+            _tarefas_linters.get(pool, set()).discard(tarefa)
+    tarefa.add_done_callback(concluida)
+    return tarefa
+
+def encerrar_linters():
+    global _pool_linters
+    with _pool_linters_lock:
+        pool, _pool_linters = _pool_linters, None
+        _tarefas_linters.pop(pool, None)
+    if pool is not None:
+        _matar_workers(pool)
+
+def _usar_stdin(codigo):
+    sys.stdin = io.TextIOWrapper(io.BytesIO(codigo.encode("utf-8")), encoding="utf-8")
+
+def _flake8_em_processo(codigo):
+    from flake8 import utils
+    from flake8.main.cli import main
+    utils.stdin_get_value.cache_clear()  # o flake8 guarda o stdin lido na primeira chamada
+    _usar_stdin(codigo)
+    bruto = io.BytesIO()
+    saida = io.TextIOWrapper(bruto, encoding="utf-8")
+    with contextlib.redirect_stdout(saida):
+        try:
+            main(["--jobs=1", "--stdin-display-name", "temp_code.py", "-"])
+        except SystemExit:
+            pass
+    saida.flush()
+    return bruto.getvalue().decode("utf-8")
+
+def _pylint_em_processo(codigo):
+    from pylint.lint import Run
+    from pylint.reporters.text import TextReporter
+    _usar_stdin(codigo)
+    saida = io.StringIO()
     try:
-        # Flake8
-        flake8 = subprocess.run(["flake8", "temp_code.py"], capture_output=True, text=True)
-        if flake8.stdout:
-            resultados.append(f"⚠️ Flake8 encontrou problemas:\n{flake8.stdout}")
-        else:
-            resultados.append("✅ Flake8: Nenhum problema encontrado.")
+        Run(["--from-stdin", "temp_code.py", *ARGS_PYLINT], reporter=TextReporter(saida), exit=False)
+    except SystemExit:
+        pass
+    return saida.getvalue()
 
-        # Pylint
-        pylint = subprocess.run(
-            ["pylint", "temp_code.py", "--disable=all", "--enable=errors,warnings"],
-            capture_output=True, text=True
-        )
-        if pylint.stdout and "Your code has been rated" not in pylint.stdout:
-            resultados.append(f"⚠️ Pylint encontrou problemas:\n{pylint.stdout}")
-        else:
-            resultados.append("✅ Pylint: Nenhum problema encontrado.")
+def _mypy_em_processo(codigo):
+    from mypy import api
+    # Cache do mypy na pasta do worker: continua quente entre chamadas sem disputar o .mypy_cache com ninguém
+    return api.run(["-c", codigo, "--cache-dir", os.path.join(_pasta_worker or pasta_privada(), "mypy")])[0]
+
+def _black_em_processo(codigo):
+    import black
+    try:
+        formatado = black.format_str(codigo, mode=black.Mode())
+    except black.InvalidInput:
+        return ""
+    return "would reformat temp_code.py" if formatado != codigo else ""
+
+_LINTERS_EM_PROCESSO = {
+    "flake8": _flake8_em_processo,
+    "pylint": _pylint_em_processo,
+    "mypy": _mypy_em_processo,
+    "black": _black_em_processo,
+}
+
+# Plano B, quando a ferramenta não é importável no worker: o executável, alimentado pelo stdin,
+# com o que ele precisar gravar (cache do mypy) numa pasta só desta chamada
+def _linter_por_subprocesso(ferramenta, codigo):
+    with tempfile.TemporaryDirectory(prefix=f"{ferramenta}-", dir=pasta_privada()) as pasta:
+        comandos = {
+            "flake8": ["flake8", "--stdin-display-name", "temp_code.py", "-"],
+            "pylint": ["pylint", "--from-stdin", "temp_code.py", *ARGS_PYLINT],
+            "mypy": ["mypy", "-c", codigo, "--cache-dir", os.path.join(pasta, "mypy")],
+            "black": ["black", "--check", "-"],
+        }
+        try:
+            processo = subprocess.run(comandos[ferramenta], input=codigo, capture_output=True, text=True,
+                                      timeout=TEMPO_LIMITE_LINT)
+        except (FileNotFoundError, subprocess.TimeoutExpired):
+            return None
+    # O black escreve o "would reformat" no stderr
+    return processo.stdout + processo.stderr if ferramenta == "black" else processo.stdout
+
+# Roda dentro do worker e devolve o que a ferramenta escreveria no stdout (None se não estiver instalada)
+def _rodar_linter(ferramenta, codigo):
+    try:
+        return _LINTERS_EM_PROCESSO[ferramenta](codigo)
+    except ImportError:
+        return _linter_por_subprocesso(ferramenta, codigo)
 
+def _formatar_resultado_lint(ferramenta, saida):
+    if saida is None:
+        return f"⚠️ {ferramenta.capitalize()}: ferramenta não instalada."
+    if ferramenta == "flake8":
+        if saida:
+            return f"⚠️ Flake8 encontrou problemas:\n{saida}"
+        return "✅ Flake8: Nenhum problema encontrado."
+    if ferramenta == "pylint":
+        if saida.strip() and "Your code has been rated" not in saida:
+            return f"⚠️ Pylint encontrou problemas:\n{saida}"
+        return "✅ Pylint: Nenhum problema encontrado."
+    if ferramenta == "mypy":
         # Mypy (opcional, se usar type hints)
-        mypy = subprocess.run(["mypy", "temp_code.py"], capture_output=True, text=True)
-        if mypy.stdout and "Success" not in mypy.stdout:
-            resultados.append(f"⚠️ Mypy encontrou problemas de tipos:\n{mypy.stdout}")
-        else:
-            resultados.append("✅ Mypy: Tipos corretos ou não utilizados.")
+        if saida and "Success" not in saida:
+            return f"⚠️ Mypy encontrou problemas de tipos:\n{saida}"
+        return "✅ Mypy: Tipos corretos ou não utilizados."
+    # Black (sugestão de formatação)
+    if "would reformat" in saida:
+        return "💡 Black: O código pode ser melhor formatado. Use o Black para padronizar."
+    return "✅ Black: O código já está bem formatado."
 
-        # Black (sugestão de formatação)
-        black = subprocess.run(["black", "--check", "temp_code.py"], capture_output=True, text=True)
-        if "would reformat" in black.stdout:
-            resultados.append("💡 Black: O código pode ser melhor formatado. Use o Black para padronizar.")
-        else:
-            resultados.append("✅ Black: O código já está bem formatado.")
-    finally:
-        if os.path.exists("temp_code.py"):
-            os.remove("temp_code.py")
-    return "\n\n".join(resultados)
+# 🗃️ Cache das análises: por ferramenta, chaveado pelo hash do código + versão/configuração da ferramenta
+CACHE_ANALISES_MAX = 2000       # linhas no teteu.db
+CACHE_ANALISES_MEMORIA = 256    # entradas em memória, na frente do SQLite
+ARQUIVOS_CONFIG_LINT = {
+    "flake8": (".flake8", "setup.cfg", "tox.ini"),
+    "pylint": (".pylintrc", "pylintrc", "pyproject.toml", "setup.cfg"),
+    "mypy": ("mypy.ini", ".mypy.ini", "pyproject.toml", "setup.cfg"),
+    "black": ("pyproject.toml",),
+}
+ARGS_LINT = {"flake8": [], "pylint": ARGS_PYLINT, "mypy": [], "black": ["--check"]}
+_cache_analises_memoria = OrderedDict()
+_cache_analises_lock = threading.Lock()   # acessado por tarefas em segundo plano e pelos pools do servidor
+_assinaturas_config = {}
+
+@functools.lru_cache(maxsize=None)
+def _versao_pacote(pacote):
+    import importlib.metadata
+    try:
+        return importlib.metadata.version(pacote)
+    except importlib.metadata.PackageNotFoundError:
+        return "?"
+
+# Versão + argumentos + conteúdo dos arquivos de configuração; só relê os arquivos quando mtime/tamanho mudam
+def assinatura_linter(ferramenta):
+    estado = []
+    for arquivo in ARQUIVOS_CONFIG_LINT[ferramenta]:
+        try:
+            info = os.stat(arquivo)
+            estado.append((arquivo, info.st_mtime_ns, info.st_size))
+        except OSError:
+            pass
+    estado = tuple(estado)
+    memorizada = _assinaturas_config.get(ferramenta)
+    if memorizada and memorizada[0] == estado:
+        return memorizada[1]
+    h = hashlib.sha256(f"{ferramenta}|{_versao_pacote(ferramenta)}|{ARGS_LINT[ferramenta]}".encode("utf-8"))
+    for arquivo, _, _ in estado:
+        with open(arquivo, "rb") as f:
+            h.update(arquivo.encode("utf-8") + b"\0" + f.read())
+    assinatura = h.hexdigest()
+    _assinaturas_config[ferramenta] = (estado, assinatura)
+    return assinatura
+
+def ler_cache_analise(ferramenta, hash_codigo, assinatura):
+    chave = (ferramenta, hash_codigo)
+    with _cache_analises_lock:
+        memoria = _cache_analises_memoria.get(chave)
+        if memoria and memoria[0] == assinatura:
+            _cache_analises_memoria.move_to_end(chave)
+            return memoria[1]
+    linha = banco.consultar_um('SELECT assinatura, saida FROM cache_analises WHERE ferramenta = ? AND hash_codigo = ?',
+                               chave)
+    if not linha or linha[0] != assinatura:
+        return None
+    banco.executar('UPDATE cache_analises SET acessado_em = ? WHERE ferramenta = ? AND hash_codigo = ?',
+                   (time.time(), *chave))
+    _guardar_em_memoria(chave, assinatura, linha[1])
+    return linha[1]
+
+def gravar_cache_analise(ferramenta, hash_codigo, assinatura, saida):
+    _guardar_em_memoria((ferramenta, hash_codigo), assinatura, saida)
+    with banco.transacao() as conexao:
+        conexao.execute('INSERT OR REPLACE INTO cache_analises VALUES (?, ?, ?, ?, ?)',
+                        (ferramenta, hash_codigo, assinatura, saida, time.time()))
+        excesso = conexao.execute('SELECT COUNT(*) FROM cache_analises').fetchone()[0] - CACHE_ANALISES_MAX
+        if excesso > 0:
+            # LRU: remove as análises acessadas há mais tempo
+            conexao.execute('''
+                DELETE FROM cache_analises WHERE rowid IN (
+                    SELECT rowid FROM cache_analises ORDER BY acessado_em LIMIT ?
+                )
+            ''', (excesso,))
+
+def _guardar_em_memoria(chave, assinatura, saida):
+    with _cache_analises_lock:
+        _cache_analises_memoria[chave] = (assinatura, saida)
+        _cache_analises_memoria.move_to_end(chave)
+        while len(_cache_analises_memoria) > CACHE_ANALISES_MEMORIA:
+            _cache_analises_memoria.popitem(last=False)
+
+def _rodar_linters(ferramentas, codigo):
+    pool = _obter_pool_linters()
+    saidas = {}
+    if pool is not None:
+        # As ferramentas rodam em paralelo, cada uma em um worker já aquecido
+        tarefas = {ferramenta: _enviar_linter(pool, ferramenta, codigo) for ferramenta in ferramentas}
+        for ferramenta, tarefa in tarefas.items():
+            try:
+                saidas[ferramenta] = tarefa.result(timeout=TEMPO_LIMITE_LINT)
+            except Exception:
+                # Worker travado ou morto: troca o pool sem cancelar as outras análises e usa o executável
+                _aposentar_pool_linters(pool)
+                saidas[ferramenta] = _linter_por_subprocesso(ferramenta, codigo)
+    else:
+        for ferramenta in ferramentas:
+            saidas[ferramenta] = _linter_por_subprocesso(ferramenta, codigo)
+    return saidas
+
+def analisar_codigo(codigo):
+    hash_codigo = hashlib.sha256(codigo.encode("utf-8")).hexdigest()
+    assinaturas = {ferramenta: assinatura_linter(ferramenta) for ferramenta in FERRAMENTAS_LINT}
+    saidas = {}
+    for ferramenta in FERRAMENTAS_LINT:
+        saida = ler_cache_analise(ferramenta, hash_codigo, assinaturas[ferramenta])
+        if saida is not None:
+            saidas[ferramenta] = saida
+    # Só roda de novo as ferramentas sem resultado válido (código novo, versão ou configuração alterada)
+    pendentes = [ferramenta for ferramenta in FERRAMENTAS_LINT if ferramenta not in saidas]
+    if pendentes:
+        novas = _rodar_linters(pendentes, codigo)
+        for ferramenta, saida in novas.items():
+            if saida is not None:
+                gravar_cache_analise(ferramenta, hash_codigo, assinaturas[ferramenta], saida)
+        saidas.update(novas)
+    return "\n\n".join(_formatar_resultado_lint(ferramenta, saidas[ferramenta]) for ferramenta in FERRAMENTAS_LINT)
 
-def sugerir_projetos(nivel="iniciante"):
+def sugerir_projetos(nivel="iniciante", stream=False):
     prompt = f"Me sugira 3 ideias de projetos em Python para o nível {nivel}, com breve descrição de cada."
-    return perguntar_ao_gpt(prompt)
+    return perguntar_ao_gpt(prompt, stream=stream)
 
-def revisar_com_gpt(codigo):
+def revisar_com_gpt(codigo, stream=False):
     prompt = (
         "Analise o seguinte código Python, explique os principais erros encontrados, "
         "mostre exemplos de código corrigido quando possível e sugira melhorias de clareza, performance e boas práticas:\n\n"
         f"{codigo}"
     )
-    return perguntar_ao_gpt(prompt)
+    return perguntar_ao_gpt(prompt, stream=stream)
+
+def salvar_no_historico(comando, resposta, modelo=None, latencia_ms=None, sincrono=False):
+    fila_escrita.adicionar_historico(
+        (comando, resposta, tokens_do_turno(comando, resposta), time.time(), usuario_atual(), modelo, latencia_ms),
+        sincrono)
+
+# Mostra a resposta pedaço por pedaço e grava o texto completo no histórico ao final
+def imprimir_stream(comando, pedacos):
+    print("\nTETEU 🤖 ", end="", flush=True)
+    inicio = time.perf_counter()
+    partes = []
+    falhou = False
+    for pedaco in pedacos:
+        print(pedaco, end="", flush=True)
+        partes.append(pedaco)
+        falhou = falhou or isinstance(pedaco, RespostaComErro)
+    print()
+    resposta = "".join(partes).strip()
+    if not falhou:
+        salvar_no_historico(comando, resposta, modelo=modelo_gpt,
+                            latencia_ms=round((time.perf_counter() - inicio) * 1000))
+    return resposta
+
+# 🗂️ Registro de comandos: verbo -> Comando, consultado em O(1); o argumento chega com a caixa original.
+# tipo "sincrono": devolve o texto a mostrar (ou imprime e devolve None); "stream": devolve os pedaços da
+# resposta do GPT, exibidos e gravados por imprimir_stream; "async": corrotina, roda no event loop de fundo.
+# argumento: None (sem argumento), "opcional" ou "obrigatorio". Terminar a linha com " &" roda em segundo plano.
+# pool: "rede" (espera a API) ou "cpu" (sandbox, linters) — no modo servidor cada um tem seus próprios workers
+COMANDOS = {}
+TIPOS_COMANDO = ("sincrono", "stream", "async")
+POOLS_COMANDO = ("rede", "cpu")
+TAREFAS_FUNDO_MAX = 4
+SAIR = object()
+_loop_async = None
+_loop_async_lock = threading.Lock()
+_executor_fundo = None
+_tarefas_fundo = {}     # número -> (entrada, Future)
+_tarefas_lock = threading.Lock()
+
+class Comando:
+    def __init__(self, nome, funcao, tipo="sincrono", argumento=None, uso="", ajuda="", apelidos=(), pool="rede"):
+        if tipo not in TIPOS_COMANDO:
+            raise ValueError(f"Tipo de comando inválido: {tipo}")
+        if pool not in POOLS_COMANDO:
+            raise ValueError(f"Pool de comando inválido: {pool}")
+        self.nome = nome
+        self.funcao = funcao
+        self.tipo = tipo
+        self.argumento = argumento
+        self.uso = uso
+        self.ajuda = ajuda
+        self.apelidos = tuple(apelidos)
+        self.pool = pool
+
+    def chamar(self, argumento):
+        return self.funcao(argumento) if self.argumento else self.funcao()
+
+def registrar_comando(nome, tipo="sincrono", argumento=None, uso="", ajuda="", apelidos=(), pool="rede"):
+    def decorador(funcao):
+        comando = Comando(nome, funcao, tipo, argumento, uso, ajuda, apelidos, pool)
+        for verbo in (nome, *apelidos):
+            COMANDOS[verbo] = comando
+        return funcao
+    return decorador
+
+def interpretar_entrada(entrada):
+    entrada = entrada.strip()
+    em_fundo = entrada.endswith(" &")
+    if em_fundo:
+        entrada = entrada[:-2].rstrip()
+    verbo, _, argumento = entrada.partition(" ")
+    return verbo.lower(), argumento.strip(), em_fundo
+
+def _obter_loop_async():
+    global _loop_async
+    with _loop_async_lock:
+        if _loop_async is None:
+            import asyncio
+            _loop_async = asyncio.new_event_loop()
+            threading.Thread(target=_loop_async.run_forever, name="teteu-async", daemon=True).start()
+        return _loop_async
+
+# Roda o comando e devolve o texto da resposta; em primeiro plano o texto também é exibido.
+# ao_pedaco recebe cada pedaço de um comando stream rodando fora do terminal (WebSocket do servidor)
+def executar_comando(comando, argumento="", entrada=None, em_fundo=False, ao_pedaco=None):
+    entrada = entrada or f"{comando.nome} {argumento}".strip()
+    if comando.tipo == "stream":
+        pedacos = comando.chamar(argumento)
+        if not em_fundo:
+            return imprimir_stream(entrada, pedacos)
+        partes = []
+        for pedaco in pedacos:
+            if isinstance(pedaco, RespostaComErro):
+                raise pedaco.erro
+            partes.append(pedaco)
+            if ao_pedaco is not None:
+                ao_pedaco(pedaco)
+        resposta = "".join(partes).strip()
+        salvar_no_historico(entrada, resposta, modelo=modelo_gpt)
+        return resposta
+    if comando.tipo == "async":
+        import asyncio
+        resultado = asyncio.run_coroutine_threadsafe(comando.chamar(argumento), _obter_loop_async()).result()
+    else:
+        resultado = comando.chamar(argumento)
+    if isinstance(resultado, RespostaComErro) and em_fundo:
+        raise resultado.erro
+    if isinstance(resultado, str) and not em_fundo:
+        print(resultado)
+    return resultado
+
+def _rodar_em_fundo(comando, argumento, entrada):
+    global _executor_fundo
+    with _tarefas_lock:
+        if _executor_fundo is None:
+            _executor_fundo = ThreadPoolExecutor(max_workers=TAREFAS_FUNDO_MAX, thread_name_prefix="teteu-fundo")
+        numero = max(_tarefas_fundo, default=0) + 1
+        tarefa = _executor_fundo.submit(_em_faixa, "fundo", executar_comando, comando, argumento, entrada, True)
+        _tarefas_fundo[numero] = (entrada, tarefa)
+
+    def ao_terminar(tarefa):
+        try:
+            resultado = tarefa.result()
+            texto = resultado if isinstance(resultado, str) else "(concluído)"
+            print(f"\n✅ [{numero}] {entrada}\n{texto}\n>>> ", end="", flush=True)
+        except Exception as e:
+            print(f"\n❌ [{numero}] {entrada}: {e}\n>>> ", end="", flush=True)
+
+    tarefa.add_done_callback(ao_terminar)
+    print(f"⏳ [{numero}] rodando em segundo plano: {entrada}")
+    return tarefa
+
+def despachar(entrada):
+    verbo, argumento, em_fundo = interpretar_entrada(entrada)
+    if not verbo:
+        return None
+    comando = COMANDOS.get(verbo)
+    if comando is None:
+        print("🤖 TETEU: Não entendi esse comando. Digite 'ajuda' para ver as opções.")
+        return None
+    if comando.argumento == "obrigatorio" and not argumento:
+        print(f"⚠️ Uso: {comando.nome} {comando.uso}")
+        return None
+    if em_fundo and comando.funcao is not _cmd_sair:
+        return _rodar_em_fundo(comando, argumento, f"{verbo} {argumento}".strip())
+    return executar_comando(comando, argumento, f"{verbo} {argumento}".strip())
+
+def aguardar_tarefas_fundo():
+    with _tarefas_lock:
+        pendentes = [tarefa for _, tarefa in _tarefas_fundo.values() if not tarefa.done()]
+    if pendentes:
+        print(f"⏳ Aguardando {len(pendentes)} tarefa(s) em segundo plano...")
+        wait(pendentes)
+
+@registrar_comando("sair", ajuda="Encerra o programa")
+def _cmd_sair():
+    return SAIR
+
+@registrar_comando("exec", argumento="obrigatorio", uso="<codigo>", ajuda="Executa código Python", pool="cpu")
+def _cmd_exec(codigo):
+    executar_codigo(codigo)
+
+@registrar_comando("historico", argumento="opcional", uso="[quantidade]", ajuda="Mostra as últimas interações")
+def _cmd_historico(quantidade):
+    return mostrar_historico_interface(int(quantidade) if quantidade.isdigit() else 10)
+
+@registrar_comando("buscar", argumento="obrigatorio", uso="<termo> [página]", ajuda="Busca no histórico")
+def _cmd_buscar(argumento):
+    termo, _, pagina = argumento.rpartition(" ")
+    if termo and pagina.isdigit():
+        buscar_no_historico(termo, int(pagina))
+    else:
+        buscar_no_historico(argumento)
+
+@registrar_comando("limpar_historico", ajuda="Limpa todo o histórico")
+def _cmd_limpar_historico():
+    limpar_historico()
+
+@registrar_comando("exportar_historico", argumento="opcional", uso="[arquivo .txt|.jsonl]",
+                   ajuda="Exporta o histórico para um arquivo")
+def _cmd_exportar_historico(caminho):
+    exportar_historico(caminho or "historico_teteu.txt")
+
+@registrar_comando("exportar_para_notebook", argumento="opcional", uso="[arquivo]",
+                   ajuda="Exporta o histórico para Jupyter Notebook")
+def _cmd_exportar_para_notebook(caminho):
+    exportar_para_notebook(caminho or "historico_teteu.ipynb")
+
+@registrar_comando("modelo", argumento="obrigatorio", uso="<nome>", ajuda="Troca o modelo GPT (ex: modelo gpt-4)")
+def _cmd_modelo(nome):
+    global modelo_gpt
+    modelo_gpt = nome
+    return f"🔁 Modelo alterado para {nome}."
+
+@registrar_comando("contexto", argumento="obrigatorio", uso="<recentes|semantico>",
+                   ajuda="Escolhe se o GPT recebe as últimas interações ou as mais parecidas com a pergunta")
+def _cmd_contexto(modo):
+    definir_modo_contexto(modo)
+
+def _registrar_stream(nome, funcao, uso="", ajuda="", apelidos=()):
+    argumento = "obrigatorio" if uso.startswith("<") else ("opcional" if uso else None)
+    if argumento:
+        # Opcional e vazio: a função usa o próprio valor padrão
+        chamada = lambda texto: funcao(texto, stream=True) if texto else funcao(stream=True)  # noqa: E731
+    else:
+        chamada = lambda: funcao(stream=True)  # noqa: E731
+    registrar_comando(nome, "stream", argumento, uso, ajuda, apelidos)(chamada)
+
+_registrar_stream("explica", explicar_codigo, "<codigo>", "Explica detalhadamente um código Python")
+_registrar_stream("resuma", resumir_texto, "<texto>", "Resume um texto longo")
+_registrar_stream("erro", explicar_erro, "<mensagem>", "Explica um erro de Python e como resolver",
+                  apelidos=("explica_erro",))
+_registrar_stream("corrija", corrigir_codigo, "<codigo>", "Sugere melhorias e corrige um código Python")
+_registrar_stream("quiz", quiz_programacao, ajuda="Recebe uma pergunta de múltipla escolha sobre programação")
+_registrar_stream("desafio", desafio_programacao, ajuda="Recebe um desafio de programação para praticar")
+
+@registrar_comando("ranking", argumento="opcional", uso="[página]",
+                   ajuda="Mostra o ranking de pontuação dos quizzes e a sua posição")
+def _cmd_ranking(pagina):
+    mostrar_ranking(int(pagina) if pagina.isdigit() else 1)
+
+@registrar_comando("corrigir_exercicio", "stream", "obrigatorio", "<codigo_do_aluno> ||| <gabarito>",
+                   "Corrige automaticamente um exercício comparando com o gabarito")
+def _cmd_corrigir_exercicio(argumento):
+    codigo, separador, gabarito = argumento.partition("|||")
+    if not separador:
+        return iter(["⚠️ Separe o código do gabarito com |||"])
+    return corrigir_exercicio(codigo.strip(), gabarito.strip(), stream=True)
+
+_registrar_stream("mini_projeto", criar_mini_projeto, "<tema>", "Cria um mini-projeto guiado em etapas")
+_registrar_stream("desafio_diario", desafio_diario, ajuda="Recebe um desafio de programação para o dia")
+_registrar_stream("entrevista", simular_entrevista, ajuda="Simula uma entrevista técnica de Python")
+_registrar_stream("conceito", explicar_conceito, "<tema>", "Explica um conceito de Python de forma didática")
+_registrar_stream("materiais", sugerir_materiais, ajuda="Sugere materiais gratuitos para aprender Python")
+_registrar_stream("materiais_personalizados", sugerir_materiais_personalizados, "<tema>",
+                  "Sugere materiais gratuitos sobre um tema específico")
+
+@registrar_comando("curva_aprendizado", argumento="opcional", uso="[nome]", ajuda="Mostra sua evolução em quizzes e pontos")
+def _cmd_curva_aprendizado(nome):
+    return curva_aprendizado(nome or usuario_atual())
+
+_registrar_stream("exercicios_online", sugerir_exercicios_online, "<tema>",
+                  "Sugere exercícios online gratuitos sobre um tema")
+_registrar_stream("debug", simular_execucao, "<codigo>", "Simula a execução passo a passo de um código Python")
+
+@registrar_comando("stackoverflow", argumento="obrigatorio", uso="<pergunta>", ajuda="Busca respostas no Stack Overflow")
+def _cmd_stackoverflow(pergunta):
+    return buscar_stackoverflow(pergunta)
+
+@registrar_comando("proximo", ajuda="Mostra o próximo resultado da última busca no Stack Overflow")
+def _cmd_proximo():
+    return proximo_stackoverflow()
+
+_registrar_stream("biblioteca", explicar_biblioteca, "<nome>", "Explica para que serve uma biblioteca Python e mostra exemplo")
+
+# Linters (no pool de processos) e revisão do GPT rodam ao mesmo tempo
+@registrar_comando("analisar", "async", "obrigatorio", "<codigo>", "Analisa o código com linters e IA", pool="cpu")
+async def _cmd_analisar(codigo):
+    import asyncio
+    linters, revisao = await asyncio.gather(asyncio.to_thread(analisar_codigo, codigo),
+                                            asyncio.to_thread(revisar_com_gpt, codigo))
+    resposta = f"{linters}\n\n🤖 Revisão da IA:\n{revisao}"
+    salvar_no_historico(f"analisar {codigo}", resposta, modelo=modelo_gpt)
+    return resposta
+
+_registrar_stream("revisar", revisar_com_gpt, "<codigo>", "Revisão detalhada do código pelo GPT, com exemplos corrigidos")
+_registrar_stream("projetos", sugerir_projetos, "[nível]",
+                  "Sugere ideias de projetos por nível (iniciante, intermediário, avançado)")
+
+@registrar_comando("tarefas", ajuda="Lista os comandos rodando em segundo plano (inicie um com '<comando> &')")
+def _cmd_tarefas():
+    with _tarefas_lock:
+        tarefas = list(_tarefas_fundo.items())
+    if not tarefas:
+        return "📭 Nenhuma tarefa em segundo plano."
+    return "\n".join(f"[{numero}] {'✅' if tarefa.done() else '⏳'} {entrada}" for numero, (entrada, tarefa) in tarefas)
+
+@registrar_comando("provedores", ajuda="Mostra a saúde de cada IA: latência, taxa de erro e circuito")
+def _cmd_provedores():
+    linhas = []
+    for nome, info in roteador.estado().items():
+        linha = f"{nome}: {info['estado']}"
+        if not info["configurado"]:
+            linha += " (sem chave configurada)"
+        if info["latencia_ms"] is not None:
+            linha += f" — {info['latencia_ms']:.0f} ms em média"
+        if info["taxa_erro"] is not None:
+            linha += f", {info['taxa_erro']:.0%} de erros"
+        if info["estado"] == "aberto":
+            linha += f" — volta a tentar em {info['reabre_em']:.0f}s ({info['motivo']})"
+        if info["limite"]["na_fila"] or info["limite"]["pausado_por"]:
+            linha += f" — {info['limite']['na_fila']} na fila do limite de taxa"
+        linhas.append(linha)
+    return "\n".join(linhas)
+
+@registrar_comando("ajuda", ajuda="Mostra esta mensagem de ajuda")
+def _cmd_ajuda():
+    mostrar_ajuda()
 
 # 🧠 Loop principal do TETEU
 def teteu_loop():
-    global modelo_gpt
+    try:
+        import readline  # noqa: F401  (edição de linha e setas no input)
+    except ImportError:
+        pass
     print("🤖 TETEU IA — Assistente de Código")
-    print("Comandos: 'sair', 'exec <codigo>', 'historico', 'buscar <termo>'")
+    print("Comandos: 'sair', 'exec <codigo>', 'historico', 'buscar <termo>' — digite 'ajuda' para ver todos")
 
-    def comando_ajuda():
-        mostrar_ajuda()
+    while True:
+        try:
+            entrada = input(">>> ")
+        except EOFError:
+            break
+        try:
+            if despachar(entrada) is SAIR:
+                break
+        except Exception as e:
+            print(f"⚠️ Erro ao executar o comando: {e}")
+    aguardar_tarefas_fundo()
 
-    def comando_historico():
-        print(mostrar_historico_interface())
+# 📦 Modo lote: comandos JSONL (um texto ou {"id": ..., "comando": "..."} por linha) vindos de um arquivo
+# ou do stdin, rodados pelos mesmos handlers do REPL em até LOTE_CONCORRENCIA threads. Cada resultado vira
+# uma linha JSONL {"id", "comando", "ok", "resposta" | "erro", "ms"}, na ordem de entrada ou de conclusão.
+# As gravações no histórico passam pela fila de escrita, que agrupa muitas linhas por transação
+LOTE_CONCORRENCIA = 4
+ORDENS_LOTE = ("entrada", "conclusao")
 
-    comandos = {
-        "ajuda": comando_ajuda,
-        "historico": comando_historico,
-        # ...adicione os outros comandos
-    }
+# O que um handler imprime vai para o buffer da thread que o está rodando (sys.stdout é global)
+class _SaidaPorThread(io.TextIOBase):
+    def __init__(self, original):
+        self.original = original
+        self.local = threading.local()
 
-    while True:
-        comando = input(">>> ").strip().lower()
-        if comando in comandos:
-            comandos[comando]()
+    def _destino(self):
+        buffer = getattr(self.local, "buffer", None)
+        return self.original if buffer is None else buffer
+
+    def writable(self):
+        return True
+
+    def write(self, texto):
+        return self._destino().write(texto)
+
+    def flush(self):
+        self._destino().flush()
+
+_captura_lock = threading.Lock()
+
+@contextlib.contextmanager
+def capturar_saida():
+    with _captura_lock:
+        if not isinstance(sys.stdout, _SaidaPorThread):
+            sys.stdout = _SaidaPorThread(sys.stdout)
+        proxy = sys.stdout
+    buffer = io.StringIO()
+    proxy.local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        proxy.local.buffer = None
+
+# Roda uma linha de comando fora do REPL (lote, servidor) e devolve o texto da resposta.
+# permitidos (se dado) é a lista fechada de comandos aceitos; bloqueados vale sempre
+def executar_texto(texto, ao_pedaco=None, bloqueados=("sair",), permitidos=None):
+    verbo, argumento, _ = interpretar_entrada(texto)  # " &" não muda nada fora do terminal
+    comando = COMANDOS.get(verbo)
+    if comando is None or comando.nome in bloqueados or (permitidos is not None and comando.nome not in permitidos):
+        raise ValueError(f"comando desconhecido: {verbo!r}")
+    if comando.argumento == "obrigatorio" and not argumento:
+        raise ValueError(f"uso: {comando.nome} {comando.uso}")
+    with capturar_saida() as saida:
+        resultado = executar_comando(comando, argumento, f"{verbo} {argumento}".strip(), em_fundo=True,
+                                     ao_pedaco=ao_pedaco)
+    return resultado if isinstance(resultado, str) else saida.getvalue().strip()
+
+def _executar_item_lote(numero, linha):
+    inicio = time.perf_counter()
+    registro = {"id": numero}
+    try:
+        item = json.loads(linha)
+        if isinstance(item, str):
+            item = {"comando": item}
+        if not isinstance(item, dict) or not isinstance(item.get("comando"), str):
+            raise ValueError("cada linha deve ser um texto JSON ou um objeto com o campo 'comando'")
+        registro["id"] = item.get("id", numero)
+        registro["comando"] = item["comando"]
+        registro["resposta"] = executar_texto(item["comando"])
+        registro["ok"] = True
+    except Exception as e:
+        registro["ok"] = False
+        registro["erro"] = f"{type(e).__name__}: {e}"
+    registro["ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    return registro
+
+# Devolve {"total", "erros"}. No máximo 2 * concorrencia itens ficam em memória (rodando ou esperando a vez
+# de sair na ordem de entrada), então arquivos grandes são lidos aos poucos
+def processar_lote(entrada, saida, concorrencia=None, ordem="entrada"):
+    if ordem not in ORDENS_LOTE:
+        raise ValueError(f"Ordem inválida: {ordem}. Use: {', '.join(ORDENS_LOTE)}")
+    concorrencia = max(1, concorrencia or LOTE_CONCORRENCIA)
+    janela = 2 * concorrencia
+    resumo = {"total": 0, "erros": 0}
+    pendentes = {}  # Future -> posição na entrada
+    prontos = {}    # posição -> registro esperando os anteriores (ordem de entrada)
+    proximo = 0
+
+    def escrever(registro):
+        saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        saida.flush()
+        resumo["total"] += 1
+        resumo["erros"] += not registro["ok"]
+
+    def colher():
+        nonlocal proximo
+        feitos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+        for tarefa in feitos:
+            posicao = pendentes.pop(tarefa)
+            if ordem == "conclusao":
+                escrever(tarefa.result())
+            else:
+                prontos[posicao] = tarefa.result()
+        while proximo in prontos:
+            escrever(prontos.pop(proximo))
+            proximo += 1
+
+    with ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="teteu-lote") as executor:
+        posicao = 0
+        for numero, linha in enumerate(entrada, 1):
+            if not linha.strip():
+                continue
+            while len(pendentes) + len(prontos) >= janela:
+                colher()
+            pendentes[executor.submit(_em_faixa, "lote", _executar_item_lote, numero, linha)] = posicao
+            posicao += 1
+        while pendentes:
+            colher()
+    descarregar_escritas()
+    return resumo
+
+# 🌐 Modo servidor: uma instância do TETEU para a turma toda (um processo, uma conexão SQLite por thread).
+# Comandos e consultas em HTTP/JSON; em /ws (WebSocket) as respostas do GPT chegam em pedaços.
+# Todo pedido ocupa uma vaga de SERVIDOR_FILA_MAX até terminar; sem vaga a resposta é 429 com Retry-After.
+# Comandos de rede e de CPU (sandbox, linters) rodam em pools separados, para um não ocupar os workers do
+# outro. No encerramento os pedidos novos recebem 503 enquanto os que já entraram terminam
+SERVIDOR_HOST = os.getenv("TETEU_HOST", "127.0.0.1")
+SERVIDOR_PORTA = int(os.getenv("TETEU_PORTA", "8765"))
+SERVIDOR_FILA_MAX = 64
+SERVIDOR_WORKERS_REDE = 16
+SERVIDOR_WORKERS_CPU = max(1, (os.cpu_count() or 2) - 1)
+SERVIDOR_DRENAGEM = 30          # segundos esperando os pedidos em andamento
+SERVIDOR_CORPO_MAX = 1_000_000  # bytes por pedido ou mensagem WebSocket
+SERVIDOR_POR_PAGINA_MAX = 100
+SERVIDOR_USUARIO_MAX = 64       # caracteres do nome enviado no pedido
+# Só estes comandos são aceitos em /comando e /ws. Ficam de fora os que gravam arquivos no servidor
+# (exportar_*), mexem no estado de todos (limpar_historico, modelo, contexto), dependem da última ação
+# do processo (proximo, tarefas) ou só fazem sentido no terminal (sair). Comando novo entra aqui de propósito
+COMANDOS_SERVIDOR = frozenset((
+    "explica", "resuma", "erro", "corrija", "revisar", "analisar", "exec", "debug", "quiz", "desafio",
+    "desafio_diario", "corrigir_exercicio", "mini_projeto", "entrevista", "conceito", "biblioteca", "projetos",
+    "materiais", "materiais_personalizados", "exercicios_online", "stackoverflow", "historico", "buscar",
+    "ranking", "curva_aprendizado", "provedores", "ajuda",
+))
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+class ServidorOcupado(Exception):
+    def __init__(self, mensagem, status=429):
+        super().__init__(mensagem)
+        self.status = status
+
+def _campo(dados, nome):
+    valor = dados.get(nome)
+    if not isinstance(valor, str) or not valor.strip():
+        raise ValueError(f"campo obrigatório: {nome!r}")
+    return valor
+
+def _pagina(dados):
+    pagina = int(dados.get("pagina", 1))
+    por_pagina = min(max(int(dados.get("por_pagina", 10)), 1), SERVIDOR_POR_PAGINA_MAX)
+    return pagina, por_pagina
+
+# Nome do aluno: campo "usuario" do pedido ou cabeçalho X-Teteu-Usuario; None usa o --usuario do servidor
+def _usuario_do_pedido(dados, cabecalho=None):
+    nome = dados.get("usuario", cabecalho)
+    if nome is None:
+        return None
+    if not isinstance(nome, str) or not nome.strip() or len(nome) > SERVIDOR_USUARIO_MAX:
+        raise ValueError(f"usuario inválido (texto de 1 a {SERVIDOR_USUARIO_MAX} caracteres)")
+    return nome.strip()
+
+def _com_usuario(nome, funcao, *args):
+    with como_usuario(nome):
+        return funcao(*args)
+
+def _pool_do_comando(dados):
+    comando = COMANDOS.get(interpretar_entrada(_campo(dados, "comando"))[0])
+    return comando.pool if comando else "rede"
+
+def _perguntar_em_pedacos(pergunta, ao_pedaco=None):
+    partes = []
+    for pedaco in perguntar_ao_gpt(pergunta, stream=True, cache_com_contexto=True):
+        if isinstance(pedaco, RespostaComErro):
+            raise pedaco.erro
+        partes.append(pedaco)
+        if ao_pedaco is not None:
+            ao_pedaco(pedaco)
+    resposta = "".join(partes).strip()
+    salvar_no_historico(pergunta, resposta, modelo=modelo_gpt)
+    return resposta
+
+def _rota_comando(dados):
+    return {"resposta": executar_texto(_campo(dados, "comando"), permitidos=COMANDOS_SERVIDOR)}
+
+def _rota_perguntar(dados):
+    return {"resposta": _perguntar_em_pedacos(_campo(dados, "pergunta"))}
+
+def _rota_analisar(dados):
+    return {"resposta": analisar_codigo(_campo(dados, "codigo"))}
+
+def _rota_executar(dados):
+    return executar_no_sandbox(_campo(dados, "codigo"))
+
+def _rota_busca(dados):
+    resultados, tem_mais = pesquisar_historico(_campo(dados, "termo"), *_pagina(dados))
+    return {"resultados": [{"id": r[0], "comando": r[1], "resposta": r[2]} for r in resultados], "tem_mais": tem_mais}
+
+def _rota_ranking(dados):
+    linhas, tem_mais = placar.pagina(*_pagina(dados))
+    eu = usuario_atual()
+    minha = placar.posicao(eu) if eu else None
+    return {"ranking": [{"posicao": posicao, "nome": nome, "pontos": pontos, "quizzes": quizzes}
+                        for posicao, nome, pontos, quizzes in linhas], "tem_mais": tem_mais,
+            "voce": {"nome": eu, "posicao": minha[0], "total": minha[1]} if minha else None}
+
+# (método, caminho) -> (pool, função); uma função no lugar do pool escolhe pelo conteúdo do pedido.
+# Toda rota passa por um pool: conta na fila (429), respeita a drenagem e usa conexões SQLite dos workers
+ROTAS_SERVIDOR = {
+    ("POST", "/comando"): (_pool_do_comando, _rota_comando),
+    ("POST", "/perguntar"): ("rede", _rota_perguntar),
+    ("POST", "/analisar"): ("cpu", _rota_analisar),
+    ("POST", "/executar"): ("cpu", _rota_executar),
+    ("GET", "/historico/busca"): ("rede", _rota_busca),
+    ("GET", "/ranking"): ("rede", _rota_ranking),
+}
+
+# Lado servidor do RFC 6455: só quadros de texto, ping/pong, fragmentos e fechamento
+class ConexaoWebSocket:
+    def __init__(self, leitor, escritor):
+        self.leitor = leitor
+        self.escritor = escritor
+        self.fechada = False
+        self._lock = threading.Lock()   # workers diferentes escrevem na mesma conexão
+
+    def _enviar_quadro(self, opcode, dados):
+        tamanho = len(dados)
+        if tamanho < 126:
+            cabecalho = struct.pack("!BB", 0x80 | opcode, tamanho)
+        elif tamanho < 65536:
+            cabecalho = struct.pack("!BBH", 0x80 | opcode, 126, tamanho)
         else:
-            print("🤖 TETEU: Não entendi esse comando. Digite 'ajuda' para ver as opções.")
+            cabecalho = struct.pack("!BBQ", 0x80 | opcode, 127, tamanho)
+        with self._lock:
+            if self.fechada:
+                raise ConnectionError("conexão WebSocket fechada")
+            self.escritor.write(cabecalho + dados)
+            self.escritor.flush()
+
+    def enviar(self, mensagem):
+        self._enviar_quadro(0x1, json.dumps(mensagem, ensure_ascii=False).encode("utf-8"))
+
+    def _ler(self, tamanho):
+        dados = self.leitor.read(tamanho)
+        if len(dados) < tamanho:
+            raise ConnectionError("conexão WebSocket fechada")
+        return dados
 
-def mostrar_ranking():
-    cur.execute('SELECT nome, pontos, quizzes FROM ranking ORDER BY pontos DESC, quizzes DESC')
-    for i, (nome, pontos, quizzes) in enumerate(cur.fetchall(), 1):
-        print(f"{i}º {nome} — {pontos} pontos ({quizzes} quizzes)")
+    # Próxima mensagem de texto, ou None quando o cliente fecha a conexão
+    def receber(self):
+        partes = []
+        while True:
+            primeiro, segundo = self._ler(2)
+            opcode, tamanho = primeiro & 0x0F, segundo & 0x7F
+            if tamanho == 126:
+                tamanho = struct.unpack("!H", self._ler(2))[0]
+            elif tamanho == 127:
+                tamanho = struct.unpack("!Q", self._ler(8))[0]
+            if tamanho + sum(map(len, partes)) > SERVIDOR_CORPO_MAX:
+                raise ValueError("mensagem WebSocket grande demais")
+            mascara = self._ler(4) if segundo & 0x80 else None
+            dados = self._ler(tamanho)
+            if mascara and tamanho:
+                # XOR do quadro inteiro de uma vez (inteiros grandes), em vez de byte a byte
+                chave = (mascara * (tamanho // 4 + 1))[:tamanho]
+                dados = (int.from_bytes(dados, "big") ^ int.from_bytes(chave, "big")).to_bytes(tamanho, "big")
+            if opcode == 0x8:
+                self.fechar()
+                return None
+            if opcode == 0x9:
+                self._enviar_quadro(0xA, dados)
+            elif opcode in (0x0, 0x1):
+                partes.append(dados)
+                if primeiro & 0x80:
+                    return b"".join(partes).decode("utf-8")
 
-def limpar_arquivos_temporarios(padrao="temp_code*.py"):
-    for arquivo in glob.glob(padrao):
+    def fechar(self):
         try:
-            os.remove(arquivo)
+            self._enviar_quadro(0x8, b"")
+        except (ConnectionError, OSError):
+            pass
+        self.fechada = True
+
+class ServidorTeteu:
+    def __init__(self, host=None, porta=None, fila_max=None, workers_rede=None, workers_cpu=None):
+        self.host = host or SERVIDOR_HOST
+        self.porta = SERVIDOR_PORTA if porta is None else porta
+        self.fila_max = fila_max or SERVIDOR_FILA_MAX
+        self.pools = {
+            "rede": ThreadPoolExecutor(max_workers=workers_rede or SERVIDOR_WORKERS_REDE, thread_name_prefix="teteu-rede"),
+            "cpu": ThreadPoolExecutor(max_workers=workers_cpu or SERVIDOR_WORKERS_CPU, thread_name_prefix="teteu-cpu"),
+        }
+        self.stats = {"aceitos": 0, "recusados": 0, "erros": 0}
+        self.drenando = False
+        self._em_andamento = 0
+        self._condicao = threading.Condition()
+        self._http = None
+
+    # Reserva uma vaga e manda a função para o pool; a vaga só é devolvida quando ela termina
+    def enviar(self, pool, funcao, *args):
+        with self._condicao:
+            if self.drenando:
+                raise ServidorOcupado("servidor encerrando", status=503)
+            if self._em_andamento >= self.fila_max:
+                self.stats["recusados"] += 1
+                raise ServidorOcupado("fila cheia, tente de novo em instantes")
+            self._em_andamento += 1
+            self.stats["aceitos"] += 1
+        try:
+            tarefa = self.pools[pool].submit(funcao, *args)
+        except Exception:
+            self._liberar()
+            raise
+        tarefa.add_done_callback(self._liberar)
+        return tarefa
+
+    def _liberar(self, _tarefa=None):
+        with self._condicao:
+            self._em_andamento -= 1
+            self._condicao.notify_all()
+
+    def atender(self, rota, dados, usuario=None):
+        pool, funcao = rota
+        nome = _usuario_do_pedido(dados, usuario)
+        if callable(pool):
+            pool = pool(dados)
+        return self.enviar(pool, _com_usuario, nome, funcao, dados).result()
+
+    def saude(self):
+        with self._condicao:
+            return {"ok": not self.drenando, "em_andamento": self._em_andamento, "fila_max": self.fila_max,
+                    "drenando": self.drenando, **self.stats, "provedores": roteador.estado()}
+
+    # Mensagens: {"id": ..., "comando": "explica x = 1"} ou {"id": ..., "pergunta": "..."}, com "usuario"
+    # opcional (senão vale o X-Teteu-Usuario do upgrade). Respostas com o
+    # mesmo id: {"tipo": "pedaco", "texto"} para cada pedaço, depois {"tipo": "fim", "resposta"} ou
+    # {"tipo": "erro", "status", "erro"}. Vários pedidos podem rodar ao mesmo tempo na mesma conexão
+    def atender_websocket(self, ws, usuario=None):
+        tarefas = []
+        try:
+            while True:
+                texto = ws.receber()
+                if texto is None:
+                    break
+                tarefa = self._mensagem_websocket(ws, texto, usuario)
+                if tarefa is not None:
+                    tarefas.append(tarefa)
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            wait(tarefas)
+            ws.fechar()
+
+    def _mensagem_websocket(self, ws, texto, usuario=None):
+        identificador = None
+        try:
+            dados = json.loads(texto)
+            if not isinstance(dados, dict):
+                raise ValueError("a mensagem deve ser um objeto JSON")
+            identificador = dados.get("id")
+            nome = _usuario_do_pedido(dados, usuario)
+
+            def ao_pedaco(pedaco):
+                ws.enviar({"id": identificador, "tipo": "pedaco", "texto": pedaco})
+            if "pergunta" in dados:
+                pergunta = _campo(dados, "pergunta")
+                return self.enviar("rede", self._responder_websocket, ws, identificador,
+                                   lambda: _com_usuario(nome, _perguntar_em_pedacos, pergunta, ao_pedaco))
+            texto_comando = _campo(dados, "comando")
+
+            def comando():
+                with como_usuario(nome):
+                    return executar_texto(texto_comando, ao_pedaco, permitidos=COMANDOS_SERVIDOR)
+            return self.enviar(_pool_do_comando(dados), self._responder_websocket, ws, identificador, comando)
+        except ServidorOcupado as e:
+            ws.enviar({"id": identificador, "tipo": "erro", "status": e.status, "erro": str(e)})
+        except ValueError as e:
+            ws.enviar({"id": identificador, "tipo": "erro", "status": 400, "erro": str(e)})
+        return None
+
+    def _responder_websocket(self, ws, identificador, funcao):
+        try:
+            mensagem = {"id": identificador, "tipo": "fim", "resposta": funcao()}
+        except (ConnectionError, OSError):
+            return  # o cliente foi embora no meio da resposta
+        except ValueError as e:
+            mensagem = {"id": identificador, "tipo": "erro", "status": 400, "erro": str(e)}
+        except ErroProvedor as e:
+            mensagem = {"id": identificador, "tipo": "erro", "status": 502, "erro": mensagem_erro_ia(e)}
         except Exception as e:
-            print(f"Não foi possível remover {arquivo}: {e}")
+            self.stats["erros"] += 1
+            mensagem = {"id": identificador, "tipo": "erro", "status": 500, "erro": f"{type(e).__name__}: {e}"}
+        try:
+            ws.enviar(mensagem)
+        except (ConnectionError, OSError):
+            pass
 
-# 🚀 Rodar
-if __name__ == "__main__":
+    def iniciar(self):
+        from http.server import ThreadingHTTPServer
+        self._http = ThreadingHTTPServer((self.host, self.porta), _criar_manipulador(self))
+        self._http.daemon_threads = True
+        self.porta = self._http.server_address[1]
+        threading.Thread(target=self._http.serve_forever, name="teteu-servidor", daemon=True).start()
+        return self
+
+    # Para de aceitar pedidos (503), espera os que já entraram por até `timeout` segundos e desliga tudo.
+    # Devolve False se sobrou pedido sem terminar
+    def encerrar(self, timeout=None):
+        with self._condicao:
+            self.drenando = True
+            drenou = self._condicao.wait_for(lambda: self._em_andamento == 0,
+                                             SERVIDOR_DRENAGEM if timeout is None else timeout)
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+        for pool in self.pools.values():
+            pool.shutdown(wait=drenou, cancel_futures=not drenou)
+        return drenou
+
+def _criar_manipulador(servidor):
+    import base64
+    from http.server import BaseHTTPRequestHandler
+
+    class Manipulador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        server_version = "TETEU"
+
+        def log_message(self, formato, *args):
+            pass  # uma linha por pedido encheria o terminal do servidor
+
+        def _responder(self, status, dados, cabecalhos=()):
+            corpo = json.dumps(dados, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            for nome, valor in cabecalhos:
+                self.send_header(nome, valor)
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            if url.path == "/saude":
+                return self._responder(200, servidor.saude())
+            if url.path == "/ws":
+                return self._websocket()
+            self._atender("GET", url.path, dict(urllib.parse.parse_qsl(url.query)))
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length") or 0)
+            if tamanho > SERVIDOR_CORPO_MAX:
+                self.close_connection = True
+                return self._responder(413, {"erro": "pedido grande demais"})
+            try:
+                dados = json.loads(self.rfile.read(tamanho) or b"{}")
+            except ValueError as e:
+                return self._responder(400, {"erro": f"JSON inválido: {e}"})
+            if not isinstance(dados, dict):
+                return self._responder(400, {"erro": "o corpo deve ser um objeto JSON"})
+            self._atender("POST", urllib.parse.urlsplit(self.path).path, dados)
+
+        def _atender(self, metodo, caminho, dados):
+            rota = ROTAS_SERVIDOR.get((metodo, caminho))
+            if rota is None:
+                return self._responder(404, {"erro": f"rota desconhecida: {metodo} {caminho}"})
+            try:
+                resposta = servidor.atender(rota, dados, self.headers.get("X-Teteu-Usuario"))
+            except ServidorOcupado as e:
+                return self._responder(e.status, {"erro": str(e)}, [("Retry-After", "1")])
+            except ValueError as e:
+                return self._responder(400, {"erro": str(e)})
+            except ErroProvedor as e:
+                return self._responder(502, {"erro": mensagem_erro_ia(e)})
+            except Exception as e:
+                servidor.stats["erros"] += 1
+                return self._responder(500, {"erro": f"{type(e).__name__}: {e}"})
+            self._responder(200, resposta)
+
+        def _websocket(self):
+            chave = self.headers.get("Sec-WebSocket-Key")
+            if self.headers.get("Upgrade", "").lower() != "websocket" or not chave:
+                return self._responder(400, {"erro": "esperado um pedido de upgrade para WebSocket"})
+            aceite = base64.b64encode(hashlib.sha1((chave + _WS_GUID).encode("ascii")).digest()).decode("ascii")
+            self.send_response(101, "Switching Protocols")
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", aceite)
+            self.end_headers()
+            self.wfile.flush()
+            self.close_connection = True
+            servidor.atender_websocket(ConexaoWebSocket(self.rfile, self.wfile), self.headers.get("X-Teteu-Usuario"))
+
+    return Manipulador
+
+def servir(host=None, porta=None):
+    servidor = ServidorTeteu(host, porta).iniciar()
+    parar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    print(f"🌐 TETEU em http://{servidor.host}:{servidor.porta} (WebSocket em /ws) — Ctrl+C para encerrar")
     try:
-        teteu_loop()
-    finally:
-        limpar_arquivos_temporarios()
-        con.close()
+        while not parar.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        pass
+    print("⏳ Encerrando: esperando os pedidos em andamento...")
+    if not servidor.encerrar():
+        print(f"⚠️ Pedidos ainda rodando após {SERVIDOR_DRENAGEM}s foram abandonados.")
+
+# 🏆 Placar em memória: lista ordenada de (-pontos, -quizzes, nome) mantida com bisect.
+# Top-N é uma fatia, a posição de um jogador é uma busca binária; atualizar_pontuacao ajusta só a
+# entrada do jogador. O banco (índice idx_ranking_placar) só é lido na carga e a cada PLACAR_TTL segundos,
+# para incluir pontos gravados por outras instâncias
+PLACAR_TTL = 60     # segundos
+
+class Placar:
+    def __init__(self, gerenciador, ttl=None):
+        self.gerenciador = gerenciador
+        self.ttl = ttl if ttl is not None else PLACAR_TTL
+        self._ordenado = []     # chaves (-pontos, -quizzes, nome)
+        self._jogadores = {}    # nome -> (pontos, quizzes)
+        self._carregado_em = None
+        # Quem enfileira pontos segura este lock junto com registrar(), para a recarga nunca contar
+        # um ponto duas vezes (no banco e na memória) nem perdê-lo
+        self.lock = threading.RLock()
+
+    def carregar(self):
+        with self.lock:
+            descarregar_escritas()
+            # ORDER BY igual ao índice: a leitura percorre o índice já ordenado, sem tocar na tabela
+            linhas = self.gerenciador.consultar(
+                'SELECT nome, pontos, quizzes FROM ranking ORDER BY pontos DESC, quizzes DESC, nome')
+            self._jogadores = {nome: (pontos or 0, quizzes or 0) for nome, pontos, quizzes in linhas}
+            self._ordenado = [(-p, -q, nome) for nome, (p, q) in self._jogadores.items()]
+            self._ordenado.sort()
+            self._carregado_em = time.monotonic()
+
+    def _em_dia(self):
+        if self._carregado_em is None or time.monotonic() - self._carregado_em > self.ttl:
+            self.carregar()
+
+    def registrar(self, nome, pontos=0, quizzes=0):
+        with self.lock:
+            if self._carregado_em is None:
+                return  # ainda não carregado: a carga vai ler o valor do banco
+            antigo = self._jogadores.get(nome)
+            if antigo is not None:
+                chave = (-antigo[0], -antigo[1], nome)
+                del self._ordenado[bisect.bisect_left(self._ordenado, chave)]
+            novo = (antigo[0] + pontos, antigo[1] + quizzes) if antigo else (pontos, quizzes)
+            self._jogadores[nome] = novo
+            bisect.insort(self._ordenado, (-novo[0], -novo[1], nome))
+
+    # Devolve ([(posição, nome, pontos, quizzes)], tem_mais); empatados dividem a mesma posição
+    def pagina(self, pagina=1, por_pagina=10):
+        self._em_dia()
+        inicio = (max(pagina, 1) - 1) * por_pagina
+        with self.lock:
+            fatia = self._ordenado[inicio:inicio + por_pagina]
+            linhas = [(bisect.bisect_left(self._ordenado, (p, q)) + 1, nome, -p, -q) for p, q, nome in fatia]
+            return linhas, inicio + por_pagina < len(self._ordenado)
+
+    # (posição, total de jogadores) ou None se o jogador não está no ranking
+    def posicao(self, nome):
+        self._em_dia()
+        with self.lock:
+            atual = self._jogadores.get(nome)
+            if atual is None:
+                return None
+            return bisect.bisect_left(self._ordenado, (-atual[0], -atual[1])) + 1, len(self._ordenado)
+
+placar = None
 
-def perguntar_ao_cohere(prompt):
+def mostrar_ranking(pagina=1, por_pagina=10):
+    linhas, tem_mais = placar.pagina(pagina, por_pagina)
+    if not linhas:
+        print("📭 Ranking vazio." if pagina <= 1 else "📭 Não há mais jogadores no ranking.")
+        return
+    for posicao, nome, pontos, quizzes in linhas:
+        print(f"{posicao}º {nome} — {pontos} pontos ({quizzes} quizzes)")
+    eu = usuario_atual()
+    minha = placar.posicao(eu) if eu else None
+    if minha and eu not in [linha[1] for linha in linhas]:
+        print(f"… você ({eu}) está em {minha[0]}º de {minha[1]}")
+    if tem_mais:
+        print(f"➡️ Digite 'ranking {pagina + 1}' para ver mais.")
+
+# Pontos, posição no placar e interações por dia (últimos 7 dias com atividade)
+def curva_aprendizado(nome):
+    descarregar_escritas()
+    linha = banco.consultar_um('SELECT pontos, quizzes FROM ranking WHERE nome = ?', (nome,))
+    if not linha:
+        return f"📭 {nome} ainda não está no ranking."
+    pontos, quizzes = linha
+    linhas = [f"📈 {nome}: {pontos} pontos em {quizzes} quizzes"
+              + (f" (média {pontos / quizzes:.1f} por quiz)" if quizzes else "")]
+    posicao = placar.posicao(nome)
+    if posicao:
+        linhas.append(f"🏆 Posição no ranking: {posicao[0]}º de {posicao[1]}")
+    dias = banco.consultar('''
+        SELECT date(criado_em, 'unixepoch', 'localtime') AS dia, COUNT(*) FROM historico
+        WHERE usuario = ? AND criado_em IS NOT NULL GROUP BY dia ORDER BY dia DESC LIMIT 7
+    ''', (nome,))
+    for dia, total in reversed(dias):
+        linhas.append(f"{dia} {'▇' * min(total, 40)} {total}")
+    return "\n".join(linhas)
+
+# Remove só a pasta privada deste processo; análises de outras instâncias não são afetadas
+def limpar_arquivos_temporarios():
+    global _pasta_privada
+    with _pasta_privada_lock:
+        pasta, _pasta_privada = _pasta_privada, None
+    if pasta:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+atexit.register(limpar_arquivos_temporarios)
+
+# Clientes reaproveitados entre chamadas (cada um mantém seu próprio pool de conexões)
+_clientes_cohere = {}
+_clientes_lock = threading.Lock()
+_github = None
+
+def cliente_cohere(timeout=None):
+    chave = (os.getenv("COHERE_API_KEY"), timeout)
+    with _clientes_lock:
+        if chave not in _clientes_cohere:
+            import cohere
+            extras = {"timeout": timeout} if timeout else {}
+            _clientes_cohere[chave] = cohere.Client(chave[0], **extras)  # Ou coloque sua chave direto aqui
+        return _clientes_cohere[chave]
+
+def cliente_github():
+    global _github
+    with _clientes_lock:
+        if _github is None:
+            from github import Github
+            _github = Github()
+        return _github
+
+# 🔀 Provedores de IA: interface comum (gerar, gerar_stream, gerar_async) com erros tipados no lugar das
+# mensagens soltas de cada biblioteca, e um roteador que acompanha a saúde de cada provedor: latência média
+# e taxa de erro nas últimas ROTEADOR_JANELA chamadas, cota esgotada e circuit breaker. Depois de
+# ROTEADOR_FALHAS falhas seguidas o circuito abre e o provedor é pulado na hora, sem esperar timeout, por
+# CIRCUITO_ESPERA segundos; depois disso uma única chamada de teste decide se ele volta. Cada pedido vai
+# para o provedor saudável mais rápido (medido em pelo menos ROTEADOR_MIN_MEDICOES chamadas recentes; sem
+# medição vale a ordem de preferência), e uma falha passa o pedido para o próximo
+ROTEADOR_JANELA = 20
+ROTEADOR_JANELA_SEGUNDOS = 300  # chamadas mais antigas não contam: um provedor rebaixado volta a ser tentado
+ROTEADOR_FALHAS = 3
+ROTEADOR_TAXA_ERRO_MAX = 0.5    # acima disso o provedor vai para trás dos saudáveis, mesmo sendo o preferido
+ROTEADOR_MIN_MEDICOES = 5       # chamadas recentes para julgar a taxa de erro e a latência
+# "rapido": entre os saudáveis, o de menor latência medida; "preferencia": sempre a ordem configurada
+# (o GPT primeiro) e os outros só como reserva
+CRITERIOS_ROTEADOR = ("rapido", "preferencia")
+ROTEADOR_CRITERIO = os.getenv("TETEU_ROTEAMENTO", "rapido")
+CIRCUITO_ESPERA = 30        # segundos
+COTA_ESPERA = 3600          # segundos sem tentar um provedor sem cota ou com a chave recusada
+# Quem pode responder pelo perguntar_ao_gpt (o bloomz-560m do Hugging Face fica de fora por padrão)
+PROVEDORES_PERGUNTA = tuple(os.getenv("TETEU_PROVEDORES", "gpt,cohere").split(","))
+
+class ErroProvedor(Exception):
+    def __init__(self, mensagem, provedor=None, espera=None):
+        super().__init__(mensagem)
+        self.provedor = provedor
+        self.espera = espera    # segundos até valer a pena tentar de novo (None: a regra do circuito)
+
+# Timeout, conexão, 5xx: conta para abrir o circuito
+class ErroTemporario(ErroProvedor):
+    pass
+
+# 429: o provedor pede uma pausa (Retry-After)
+class LimiteRequisicoes(ErroProvedor):
+    pass
+
+class CotaEsgotada(ErroProvedor):
+    pass
+
+# Chave ausente ou recusada, biblioteca não instalada
+class ErroConfiguracao(ErroProvedor):
+    pass
+
+# O pedido é que está errado (4xx): outro provedor não resolveria e o circuito não é afetado
+class ErroRequisicao(ErroProvedor):
+    pass
+
+class CircuitoAberto(ErroProvedor):
+    pass
+
+class SemProvedorDisponivel(ErroProvedor):
+    pass
+
+def _erro_por_status(status, texto, provedor, espera=None):
+    if status == 429:
+        return LimiteRequisicoes(texto, provedor, espera)
+    if status == 402:
+        return CotaEsgotada(texto, provedor, COTA_ESPERA)
+    if status in (401, 403):
+        return ErroConfiguracao(texto, provedor, COTA_ESPERA)
+    if 400 <= status < 500:
+        return ErroRequisicao(texto, provedor)
+    return ErroTemporario(texto, provedor, espera)
+
+# Traduz a exceção de qualquer cliente (openai, cohere, requests) sem importar as bibliotecas
+def classificar_erro(erro, provedor):
+    if isinstance(erro, ErroProvedor):
+        erro.provedor = erro.provedor or provedor
+        return erro
+    texto = str(erro) or type(erro).__name__
+    nome = type(erro).__name__
+    resposta = getattr(erro, "response", None)
+    status = getattr(erro, "status_code", None) or getattr(resposta, "status_code", None)
+    if getattr(erro, "code", None) == "insufficient_quota" or "insufficient_quota" in texto:
+        return CotaEsgotada(texto, provedor, COTA_ESPERA)
+    if isinstance(erro, ImportError) or any(parte in nome for parte in ("Authentication", "PermissionDenied")):
+        return ErroConfiguracao(texto, provedor, COTA_ESPERA)
+    if "RateLimit" in nome or "TooManyRequests" in nome:
+        status = 429
+    if isinstance(status, int):
+        cabecalhos = getattr(resposta, "headers", None) or {}
+        return _erro_por_status(status, texto, provedor, _ler_retry_after(cabecalhos.get("Retry-After")))
+    return ErroTemporario(texto, provedor)
+
+# 🚦 Limite de taxa por provedor: dois baldes de fichas, pedidos e tokens por minuto, compartilhados por todas
+# as threads e tarefas. Cada chamada reserva 1 pedido e os tokens estimados (prompt + max_tokens da resposta);
+# sem saldo ela espera na fila em vez de levar 429, e ao terminar os tokens não usados voltam ao balde.
+# A fila tem faixas de prioridade (PRIORIDADES_IA): o terminal e o servidor passam na frente de comandos em
+# segundo plano e do modo lote. Os baldes enchem a LIMITE_MARGEM do contratado, perto do teto sem encostar
+LIMITES_IA = {"gpt": (500, 60_000), "cohere": (20, 0), "huggingface": (60, 0)}  # (pedidos/min, tokens/min); 0 = livre
+LIMITE_MARGEM = 0.9
+LIMITE_RAJADA = 10          # segundos de saldo acumulado (um minuto inteiro de uma vez também leva 429)
+LIMITE_PAUSA = 5            # segundos de pausa após um 429 sem Retry-After
+LIMITE_ESPERA_MAX = 60      # Retry-After maior que isso abre o circuito em vez de segurar a fila
+PRIORIDADES_IA = ("interativo", "fundo", "lote")
+_prioridade_ia = contextvars.ContextVar("prioridade_ia", default="interativo")
+
+# Ex.: TETEU_LIMITE_GPT=3500/90000 (pedidos/min e tokens/min do seu plano)
+def limites_ia(nome):
+    valor = os.getenv(f"TETEU_LIMITE_{nome.upper()}")
+    if not valor:
+        return LIMITES_IA.get(nome, (0, 0))
+    rpm, _, tpm = valor.partition("/")
+    return int(rpm or 0), int(tpm or 0)
+
+@contextlib.contextmanager
+def prioridade_ia(faixa):
+    if faixa not in PRIORIDADES_IA:
+        raise ValueError(f"Prioridade inválida: {faixa}. Use uma de {PRIORIDADES_IA}.")
+    marca = _prioridade_ia.set(faixa)
     try:
-        co = cohere.Client(os.getenv("COHERE_API_KEY"))  # Ou coloque sua chave direto aqui
-        resposta = co.generate(
+        yield
+    finally:
+        _prioridade_ia.reset(marca)
+
+# Threads de pools não herdam o contexto de quem enviou a tarefa: a faixa vai junto explicitamente
+def _em_faixa(faixa, funcao, *args):
+    with prioridade_ia(faixa):
+        return funcao(*args)
+
+class LimitadorTaxa:
+    def __init__(self, rpm=0, tpm=0, margem=None, rajada=None):
+        margem = LIMITE_MARGEM if margem is None else margem
+        rajada = rajada or LIMITE_RAJADA
+        self._baldes = {}   # nome -> [fichas por segundo, capacidade, saldo]
+        for nome, limite in (("pedidos", rpm), ("tokens", tpm)):
+            if limite:
+                taxa = limite * margem / 60
+                capacidade = max(taxa * rajada, 1.0)
+                self._baldes[nome] = [taxa, capacidade, capacidade]
+        self._atualizado = time.monotonic()
+        self._pausado_ate = 0.0
+        self._fila = []     # heap de (faixa, ordem de chegada)
+        self._ordem = itertools.count()
+        self._condicao = threading.Condition()
+        self.stats = {"reservas": 0, "esperas": 0, "segundos_esperando": 0.0}
+
+    def _reabastecer(self, agora):
+        decorrido, self._atualizado = agora - self._atualizado, agora
+        for balde in self._baldes.values():
+            balde[2] = min(balde[1], balde[2] + balde[0] * decorrido)
+
+    def _espera(self, custos, agora):
+        espera = max(0.0, self._pausado_ate - agora)
+        for nome, custo in custos.items():
+            balde = self._baldes.get(nome)
+            if balde is not None and balde[2] < custo:
+                espera = max(espera, (custo - balde[2]) / balde[0])
+        return espera
+
+    # Bloqueia até haver saldo e a vez ser desta chamada; devolve os tokens reservados (para ajustar)
+    def reservar(self, tokens=0, faixa=None):
+        faixa = faixa or _prioridade_ia.get()
+        if "tokens" in self._baldes:
+            tokens = min(tokens, self._baldes["tokens"][1])   # maior que o balde: espera o balde cheio
+        custos = {"pedidos": 1, "tokens": tokens}
+        vez = (PRIORIDADES_IA.index(faixa), next(self._ordem))
+        inicio = time.monotonic()
+        with self._condicao:
+            heapq.heappush(self._fila, vez)
+            try:
+                while True:
+                    agora = time.monotonic()
+                    self._reabastecer(agora)
+                    espera = self._espera(custos, agora)
+                    if self._fila[0] == vez and espera == 0:
+                        break
+                    # Só a primeira da fila acompanha o relógio; as outras acordam quando ela sai
+                    self._condicao.wait(espera if self._fila[0] == vez else None)
+                for nome, custo in custos.items():
+                    if nome in self._baldes:
+                        self._baldes[nome][2] -= custo
+            finally:
+                self._fila.remove(vez)
+                heapq.heapify(self._fila)
+                self._condicao.notify_all()
+            esperou = time.monotonic() - inicio
+            self.stats["reservas"] += 1
+            if esperou > 0.001:
+                self.stats["esperas"] += 1
+                self.stats["segundos_esperando"] += esperou
+        return tokens
+
+    # Devolve ao balde (ou cobra) a diferença entre os tokens reservados e os usados de fato
+    def ajustar(self, reservados, usados):
+        balde = self._baldes.get("tokens")
+        if balde is None:
+            return
+        with self._condicao:
+            balde[2] = min(balde[1], balde[2] + reservados - usados)
+            self._condicao.notify_all()
+
+    # O provedor respondeu 429: ninguém passa antes de `segundos`
+    def pausar(self, segundos):
+        with self._condicao:
+            self._pausado_ate = max(self._pausado_ate, time.monotonic() + segundos)
+
+    def estado(self):
+        agora = time.monotonic()
+        with self._condicao:
+            self._reabastecer(agora)
+            return {"na_fila": len(self._fila), "pausado_por": round(max(0.0, self._pausado_ate - agora), 1),
+                    **{nome: int(balde[2]) for nome, balde in self._baldes.items()}}
+
+def _tokens_entrada(prompt, mensagens):
+    if mensagens:
+        return sum(estimar_tokens(m.get("content")) + TOKENS_POR_MENSAGEM for m in mensagens)
+    return estimar_tokens(prompt)
+
+class Provedor:
+    nome = None
+    rotulo = None
+    idioma = "pt"           # "en": o roteador traduz o prompt antes de chamar
+    variavel_chave = None
+    max_tokens = 0          # tamanho máximo da resposta, reservado no limitador de tokens
+
+    def configurado(self):
+        return bool(os.getenv(self.variavel_chave))
+
+    def _gerar(self, prompt, mensagens, timeout):
+        raise NotImplementedError
+
+    # Sem streaming nativo: a resposta inteira vira um pedaço só
+    def _gerar_stream(self, prompt, mensagens, timeout):
+        yield self._gerar(prompt, mensagens, timeout)
+
+    def gerar(self, prompt, mensagens=None, timeout=None):
+        try:
+            return self._gerar(prompt, mensagens, timeout)
+        except ErroProvedor as e:
+            raise classificar_erro(e, self.nome)
+        except Exception as e:
+            raise classificar_erro(e, self.nome) from e
+
+    def gerar_stream(self, prompt, mensagens=None, timeout=None):
+        try:
+            yield from self._gerar_stream(prompt, mensagens, timeout)
+        except ErroProvedor as e:
+            raise classificar_erro(e, self.nome)
+        except Exception as e:
+            raise classificar_erro(e, self.nome) from e
+
+    async def gerar_async(self, prompt, mensagens=None, timeout=None):
+        import asyncio
+        return await asyncio.to_thread(self.gerar, prompt, mensagens, timeout)
+
+class ProvedorOpenAI(Provedor):
+    nome = "gpt"
+    rotulo = "OpenAI"
+    variavel_chave = "OPENAI_API_KEY"
+    max_tokens = 1500
+
+    def configurado(self):
+        return client is not None or super().configurado()
+
+    def _criar(self, prompt, mensagens, timeout, **extras):
+        if timeout:
+            extras["timeout"] = timeout
+        return cliente_openai().chat.completions.create(
+            model=modelo_gpt,
+            messages=mensagens or [{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=self.max_tokens,
+            **extras
+        )
+
+    def _gerar(self, prompt, mensagens, timeout):
+        return self._criar(prompt, mensagens, timeout).choices[0].message.content.strip()
+
+    def _gerar_stream(self, prompt, mensagens, timeout):
+        inicio = True
+        for evento in self._criar(prompt, mensagens, timeout, stream=True):
+            if not evento.choices:
+                continue
+            delta = evento.choices[0].delta.content
+            if delta:
+                # Não mostra o espaço em branco inicial, igual ao .strip() da versão sem streaming
+                if inicio:
+                    delta = delta.lstrip()
+                    if not delta:
+                        continue
+                    inicio = False
+                yield delta
+
+class ProvedorCohere(Provedor):
+    nome = "cohere"
+    rotulo = "Cohere"
+    idioma = "en"
+    variavel_chave = "COHERE_API_KEY"
+    max_tokens = 300
+
+    def _gerar(self, prompt, mensagens, timeout):
+        resposta = cliente_cohere(timeout).generate(
             model='command',  # ou 'command-light'
             prompt=prompt,
-            max_tokens=300
+            max_tokens=self.max_tokens
         )
         return resposta.generations[0].text.strip()
-    except Exception as e:
-        return f"Erro Cohere: {e}"
 
-def perguntar_ao_huggingface(prompt):
-    try:
-        API_URL = "https://api-inference.huggingface.co/models/bigscience/bloomz-560m"  # Você pode trocar por outro modelo!
+class ProvedorHuggingFace(Provedor):
+    nome = "huggingface"
+    rotulo = "Hugging Face"
+    idioma = "en"
+    variavel_chave = "HF_API_KEY"
+    max_tokens = 100
+    url = "https://api-inference.huggingface.co/models/bigscience/bloomz-560m"  # Você pode trocar por outro modelo!
+
+    def _gerar(self, prompt, mensagens, timeout):
         headers = {"Authorization": f"Bearer {os.getenv('HF_API_KEY')}"}
-        payload = {"inputs": prompt}
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=30)
-        resposta = response.json()
+        response = requisicao_http("POST", self.url, headers=headers, json={"inputs": prompt},
+                                   timeout=(HTTP_TIMEOUT[0], timeout or 30))
+        try:
+            resposta = response.json()
+        except ValueError:
+            resposta = response.text
+        if response.status_code >= 400:
+            detalhe = resposta.get("error", resposta) if isinstance(resposta, dict) else resposta
+            raise _erro_por_status(response.status_code, f"HTTP {response.status_code}: {detalhe}", self.nome,
+                                   _ler_retry_after(response.headers.get("Retry-After")))
         # Alguns modelos retornam uma lista, outros um dicionário
         if isinstance(resposta, list) and resposta and "generated_text" in resposta[0]:
             return resposta[0]["generated_text"].strip()
-        elif isinstance(resposta, dict) and "error" in resposta:
-            return f"Erro Hugging Face: {resposta['error']}"
-        else:
-            return str(resposta)
-    except Exception as e:
-        return f"Erro Hugging Face: {e}"
+        if isinstance(resposta, dict) and "error" in resposta:
+            raise ErroTemporario(resposta["error"], self.nome)
+        return str(resposta)
 
-def perguntar_todas_ias(prompt, contexto_limite=5):
-    respostas = []
+class Roteador:
+    def __init__(self, provedores=(), janela=None, limite_falhas=None, espera=None, criterio=None):
+        criterio = criterio or ROTEADOR_CRITERIO
+        if criterio not in CRITERIOS_ROTEADOR:
+            raise ValueError(f"Critério de roteamento inválido: {criterio}. Use um de {CRITERIOS_ROTEADOR}.")
+        self.criterio = criterio
+        self.provedores = {}
+        self.limitadores = {}
+        self.janela = janela or ROTEADOR_JANELA
+        self.limite_falhas = limite_falhas or ROTEADOR_FALHAS
+        self.espera = espera or CIRCUITO_ESPERA
+        self._saude = {}
+        self._lock = threading.Lock()
+        for provedor in provedores:
+            self.registrar(provedor)
 
-    # OpenAI GPT
-    try:
-        resposta_gpt = perguntar_ao_gpt(prompt, contexto_limite)
-        if resposta_gpt and not resposta_gpt.startswith("⚠️ Sua cota da OpenAI acabou"):
-            respostas.append("🤖 GPT:\n" + resposta_gpt)
-    except Exception:
-        pass
+    def registrar(self, provedor):
+        with self._lock:
+            self.provedores[provedor.nome] = provedor
+            self.limitadores[provedor.nome] = LimitadorTaxa(*limites_ia(provedor.nome))
+            self._saude[provedor.nome] = {"chamadas": deque(maxlen=self.janela), "falhas_seguidas": 0,
+                                          "aberto_ate": 0.0, "testando": False, "motivo": None}
+
+    def _estado(self, saude, agora):
+        if saude["aberto_ate"] > agora:
+            return "aberto"
+        return "meio_aberto" if saude["aberto_ate"] else "fechado"
+
+    def _disponivel(self, saude, agora):
+        estado = self._estado(saude, agora)
+        return estado == "fechado" or (estado == "meio_aberto" and not saude["testando"])
+
+    def _recentes(self, saude, agora):
+        return [(ok, duracao) for ok, duracao, quando in saude["chamadas"] if agora - quando <= ROTEADOR_JANELA_SEGUNDOS]
 
-    # Cohere
+    def _latencia(self, saude, agora):
+        tempos = [duracao for ok, duracao in self._recentes(saude, agora) if ok]
+        return sum(tempos) / len(tempos) if tempos else None
+
+    def _taxa_erro(self, saude, agora):
+        chamadas = self._recentes(saude, agora)
+        return sum(not ok for ok, _ in chamadas) / len(chamadas) if chamadas else None
+
+    # Confirma que o circuito deixa a chamada passar; no meio-aberto só uma chamada de teste por vez
+    def _reservar(self, nome):
+        agora = time.monotonic()
+        with self._lock:
+            saude = self._saude[nome]
+            if not self._disponivel(saude, agora):
+                raise CircuitoAberto(f"circuito aberto ({saude['motivo']})", nome, max(0.0, saude["aberto_ate"] - agora))
+            if self._estado(saude, agora) == "meio_aberto":
+                saude["testando"] = True
+
+    def _registrar_resultado(self, nome, inicio, erro=None):
+        agora = time.monotonic()
+        with self._lock:
+            saude = self._saude[nome]
+            teste, saude["testando"] = saude["testando"], False
+            if erro is None:
+                saude["chamadas"].append((True, agora - inicio, agora))
+                saude.update(falhas_seguidas=0, aberto_ate=0.0, motivo=None)
+                return
+            if isinstance(erro, ErroRequisicao):
+                return
+            if isinstance(erro, LimiteRequisicoes) and (erro.espera or 0) <= LIMITE_ESPERA_MAX:
+                # 429 curto não é problema de saúde: o limitador segura os próximos pedidos na fila
+                self.limitadores[nome].pausar(erro.espera or LIMITE_PAUSA)
+                return
+            saude["chamadas"].append((False, agora - inicio, agora))
+            saude["falhas_seguidas"] += 1
+            if erro.espera is not None or teste or saude["falhas_seguidas"] >= self.limite_falhas:
+                saude["aberto_ate"] = agora + (erro.espera if erro.espera is not None else self.espera)
+                saude["motivo"] = f"{type(erro).__name__}: {erro}"
+
+    # Provedores configurados e com o circuito deixando passar. Circuito em teste (meio-aberto) ou taxa de
+    # erro recente acima de ROTEADOR_TAXA_ERRO_MAX vão para o fim, os rebaixados do menor para o maior erro.
+    # Entre os saudáveis (critério "rapido"), quem tem ROTEADOR_MIN_MEDICOES chamadas recentes vem antes, do
+    # mais rápido para o mais lento; quem não tem medição não conta como rápido e segue a ordem de `nomes`,
+    # que também desempata
+    def candidatos(self, nomes=None):
+        agora = time.monotonic()
+        with self._lock:
+            ordenados = []
+            for ordem, nome in enumerate(nomes or self.provedores):
+                provedor, saude = self.provedores.get(nome), self._saude.get(nome)
+                if provedor is None or not provedor.configurado() or not self._disponivel(saude, agora):
+                    continue
+                taxa = self._taxa_erro(saude, agora)
+                medido = len(self._recentes(saude, agora)) >= ROTEADOR_MIN_MEDICOES
+                rebaixado = medido and taxa > ROTEADOR_TAXA_ERRO_MAX
+                latencia = self._latencia(saude, agora) if medido and self.criterio == "rapido" else None
+                chave = (self._estado(saude, agora) != "fechado", rebaixado, taxa if rebaixado else 0.0,
+                         latencia is None, latencia or 0.0, ordem)
+                ordenados.append((chave, provedor))
+        return [provedor for _, provedor in sorted(ordenados, key=operator.itemgetter(0))]
+
+    # Uma tentativa: circuito, vez no limitador de taxa, chamada e registro do resultado
+    def _chamar(self, nome, prompt, mensagens, timeout):
+        provedor, limitador = self.provedores[nome], self.limitadores[nome]
+        entrada = _tokens_entrada(prompt, mensagens)
+        self._reservar(nome)
+        reservados = limitador.reservar(entrada + provedor.max_tokens)
+        inicio, erro, texto = time.monotonic(), None, ""
+        try:
+            texto = provedor.gerar(prompt, mensagens, timeout)
+            return texto
+        except ErroProvedor as e:
+            erro = e
+            raise
+        finally:
+            limitador.ajustar(reservados, entrada + estimar_tokens(texto))
+            self._registrar_resultado(nome, inicio, erro)
+
+    def _chamar_stream(self, nome, prompt, mensagens, timeout):
+        provedor, limitador = self.provedores[nome], self.limitadores[nome]
+        entrada = _tokens_entrada(prompt, mensagens)
+        self._reservar(nome)
+        reservados = limitador.reservar(entrada + provedor.max_tokens)
+        inicio, erro, saida = time.monotonic(), None, 0
+        try:
+            for pedaco in provedor.gerar_stream(prompt, mensagens, timeout):
+                saida += estimar_tokens(pedaco)
+                yield pedaco
+        except ErroProvedor as e:
+            erro = e
+            raise
+        finally:
+            limitador.ajustar(reservados, entrada + saida)
+            self._registrar_resultado(nome, inicio, erro)
+
+    # Um provedor específico, com registro de saúde e circuito (sem trocar de provedor). Um 429 curto
+    # pausa o limitador e o pedido volta para a fila dele, uma vez
+    def chamar(self, nome, prompt, mensagens=None, timeout=None):
+        try:
+            return self._chamar(nome, prompt, mensagens, timeout)
+        except LimiteRequisicoes as e:
+            if (e.espera or 0) > LIMITE_ESPERA_MAX:
+                raise
+        return self._chamar(nome, prompt, mensagens, timeout)
+
+    def chamar_stream(self, nome, prompt, mensagens=None, timeout=None):
+        pedacos = self._chamar_stream(nome, prompt, mensagens, timeout)
+        try:
+            primeiro = next(pedacos)
+        except StopIteration:
+            return
+        except LimiteRequisicoes as e:
+            if (e.espera or 0) > LIMITE_ESPERA_MAX:
+                raise
+            pedacos = self._chamar_stream(nome, prompt, mensagens, timeout)
+            primeiro = next(pedacos, None)
+            if primeiro is None:
+                return
+        yield primeiro
+        yield from pedacos
+
+    def _prompt_para(self, provedor, prompt):
+        return traduzir_para_ingles(prompt) if provedor.idioma == "en" else prompt
+
+    def _falhar(self, erros):
+        if len(erros) == 1:
+            raise erros[0]
+        if erros:
+            raise SemProvedorDisponivel("; ".join(f"{e.provedor}: {e}" for e in erros))
+        raise SemProvedorDisponivel("nenhum provedor configurado com o circuito fechado")
+
+    # Devolve (nome do provedor, resposta), tentando os candidatos até um responder
+    def gerar(self, prompt, mensagens=None, timeout=None, nomes=None):
+        erros = []
+        for provedor in self.candidatos(nomes):
+            try:
+                return provedor.nome, self.chamar(provedor.nome, self._prompt_para(provedor, prompt), mensagens, timeout)
+            except ErroRequisicao:
+                raise
+            except ErroProvedor as e:
+                erros.append(e)
+        self._falhar(erros)
+
+    # Gera (nome do provedor, pedaço). Só troca de provedor antes do primeiro pedaço; depois dele um erro sobe
+    def gerar_stream(self, prompt, mensagens=None, timeout=None, nomes=None):
+        erros = []
+        for provedor in self.candidatos(nomes):
+            pedacos = self.chamar_stream(provedor.nome, self._prompt_para(provedor, prompt), mensagens, timeout)
+            try:
+                primeiro = next(pedacos)
+            except StopIteration:
+                return
+            except ErroRequisicao:
+                raise
+            except ErroProvedor as e:
+                erros.append(e)
+                continue
+            yield provedor.nome, primeiro
+            for pedaco in pedacos:
+                yield provedor.nome, pedaco
+            return
+        self._falhar(erros)
+
+    async def gerar_async(self, prompt, mensagens=None, timeout=None, nomes=None):
+        import asyncio
+        return await asyncio.to_thread(self.gerar, prompt, mensagens, timeout, nomes)
+
+    def estado(self):
+        agora = time.monotonic()
+        with self._lock:
+            estado = {}
+            for nome, saude in self._saude.items():
+                latencia, taxa = self._latencia(saude, agora), self._taxa_erro(saude, agora)
+                estado[nome] = {
+                    "estado": self._estado(saude, agora),
+                    "configurado": self.provedores[nome].configurado(),
+                    "latencia_ms": None if latencia is None else round(latencia * 1000, 1),
+                    "taxa_erro": None if taxa is None else round(taxa, 2),
+                    "falhas_seguidas": saude["falhas_seguidas"],
+                    "reabre_em": round(max(0.0, saude["aberto_ate"] - agora), 1),
+                    "motivo": saude["motivo"],
+                    "limite": self.limitadores[nome].estado(),
+                }
+            return estado
+
+roteador = Roteador([ProvedorOpenAI(), ProvedorCohere(), ProvedorHuggingFace()])
+
+# Texto de erro que ainda carrega a exceção: o REPL mostra o texto, o lote e o servidor levantam `erro`
+# (linha com ok=false, resposta de erro) e nada disso é gravado no histórico como resposta
+class RespostaComErro(str):
+    def __new__(cls, texto, erro):
+        resposta = super().__new__(cls, texto)
+        resposta.erro = erro
+        return resposta
+
+def mensagem_erro_ia(erro, provedor="gpt"):
+    provedor = getattr(erro, "provedor", None) or provedor
+    if isinstance(erro, CotaEsgotada) and provedor == "gpt":
+        return RespostaComErro("⚠️ Sua cota da OpenAI acabou. Verifique seu plano e billing em "
+                               "https://platform.openai.com/account/usage", erro)
+    rotulo = roteador.provedores[provedor].rotulo if provedor in roteador.provedores else provedor
+    return RespostaComErro(f"Erro ao acessar {rotulo}: {erro}", erro)
+
+def perguntar_ao_cohere(prompt, timeout=None):
     try:
-        prompt_en = traduzir_para_ingles(prompt)
-        resposta_cohere = perguntar_ao_cohere(prompt_en)
-        if resposta_cohere and not "quota" in str(resposta_cohere).lower():
-            respostas.append("🟣 Cohere:\n" + resposta_cohere)
-    except Exception:
-        pass
+        return roteador.chamar("cohere", prompt, timeout=timeout)
+    except Exception as e:
+        return f"Erro Cohere: {e}"
 
-    # Hugging Face
+def perguntar_ao_huggingface(prompt, timeout=30):
     try:
-        prompt_en = traduzir_para_ingles(prompt)
-        resposta_hf = perguntar_ao_huggingface(prompt_en)
-        if resposta_hf and not "quota" in str(resposta_hf).lower():
-            respostas.append("🤗 Hugging Face:\n" + resposta_hf)
-    except Exception:
-        pass
+        return roteador.chamar("huggingface", prompt, timeout=timeout)
+    except Exception as e:
+        return f"Erro Hugging Face: {e}"
+
+# ⚡ Consulta paralela às IAs
+# Prazo (em segundos) de cada provedor, contado a partir do disparo
+PRAZOS_IAS = {"gpt": 40, "cohere": 25, "huggingface": 30}
+ROTULOS_IAS = {"gpt": "🤖 GPT:\n", "cohere": "🟣 Cohere:\n", "huggingface": "🤗 Hugging Face:\n"}
+MODOS_IAS = ("todas", "primeiras", "primeira_boa")
+_executor_ias = ThreadPoolExecutor(max_workers=8, thread_name_prefix="teteu-ia")
+
+def _resposta_aceita(resposta):
+    if not resposta:
+        return False
+    if resposta.startswith("⚠️ Sua cota da OpenAI acabou"):
+        return False
+    return "quota" not in str(resposta).lower()
+
+def _resposta_boa(resposta):
+    return _resposta_aceita(resposta) and not resposta.startswith(("Erro", "⚠️"))
+
+def perguntar_todas_ias(prompt, contexto_limite=None, modo="todas", quantidade=1, prazos=None):
+    if modo not in MODOS_IAS:
+        raise ValueError(f"Modo inválido: {modo}. Use um de {MODOS_IAS}.")
+    prazos = {**PRAZOS_IAS, **(prazos or {})}
+    # O contexto é lido aqui, na thread dona da conexão SQLite
+    mensagens = montar_mensagens(prompt, contexto_limite)
+    # Uma única tradução, compartilhada por Cohere e Hugging Face
+    traducao = _executor_ias.submit(traduzir_para_ingles, prompt)
 
-    if respostas:
-        return "\n\n".join(respostas)
+    def cohere_traduzido():
+        return perguntar_ao_cohere(traducao.result(), timeout=prazos["cohere"])
+
+    def huggingface_traduzido():
+        return perguntar_ao_huggingface(traducao.result(), timeout=prazos["huggingface"])
+
+    inicio = time.monotonic()
+    tarefas = {
+        _executor_ias.submit(perguntar_ao_gpt, prompt, mensagens=mensagens, timeout=prazos["gpt"],
+                             provedores=("gpt",), cache_com_contexto=True): "gpt",
+        _executor_ias.submit(cohere_traduzido): "cohere",
+        _executor_ias.submit(huggingface_traduzido): "huggingface",
+    }
+    respostas = {}
+    pendentes = set(tarefas)
+    while pendentes:
+        proximo_prazo = min(inicio + prazos[tarefas[t]] for t in pendentes)
+        prontas, pendentes = wait(pendentes, timeout=max(0, proximo_prazo - time.monotonic()),
+                                  return_when=FIRST_COMPLETED)
+        for tarefa in prontas:
+            try:
+                resposta = tarefa.result()
+            except Exception:
+                continue
+            if not _resposta_aceita(resposta):
+                continue
+            if modo == "primeira_boa" and not _resposta_boa(resposta):
+                continue
+            respostas[tarefas[tarefa]] = resposta
+        # Provedor que estourou o prazo é abandonado (a thread termina sozinha pelo timeout dele)
+        agora = time.monotonic()
+        for tarefa in [t for t in pendentes if agora >= inicio + prazos[tarefas[t]]]:
+            tarefa.cancel()
+            pendentes.discard(tarefa)
+        if modo == "primeira_boa" and respostas:
+            break
+        if modo == "primeiras" and len(respostas) >= quantidade:
+            break
+
+    if modo == "todas":
+        # Mantém a ordem fixa GPT, Cohere, Hugging Face
+        ordem = [nome for nome in ROTULOS_IAS if nome in respostas]
+    else:
+        # Ordem de chegada
+        ordem = list(respostas)
+    if ordem:
+        return "\n\n".join(ROTULOS_IAS[nome] + respostas[nome] for nome in ordem)
     else:
         return "Nenhuma IA pôde responder no momento (todas atingiram o limite ou houve erro)."
 
+# 🌍 Memória de tradução: LRU em memória na frente da tabela memoria_traducao (teteu_cache.db),
+# chaveada por (origem, destino, hash do texto); falhas não são guardadas
+TRADUCAO_MEMORIA_MAX = 512
+TRADUCAO_LOTE_CARACTERES = 4500     # o Google Tradutor aceita até 5000 caracteres por chamada
+_SEPARADOR_LOTE = "\n§§\n"
+traducao_stats = {"memoria": 0, "disco": 0, "misses": 0, "erros": 0, "requisicoes": 0}
+_memoria_traducao = OrderedDict()
+_traducao_lock = threading.Lock()
+_traducoes_em_andamento = {}        # chave -> Future da tradução em curso
+
+def _chave_traducao(texto, origem, destino):
+    return (origem, destino, hashlib.sha256(texto.encode("utf-8")).hexdigest())
+
+def _lembrar_traducao(chave, traducao):
+    with _traducao_lock:
+        _memoria_traducao[chave] = traducao
+        _memoria_traducao.move_to_end(chave)
+        while len(_memoria_traducao) > TRADUCAO_MEMORIA_MAX:
+            _memoria_traducao.popitem(last=False)
+
+def _traducao_guardada(chave):
+    with _traducao_lock:
+        if chave in _memoria_traducao:
+            _memoria_traducao.move_to_end(chave)
+            traducao_stats["memoria"] += 1
+            return _memoria_traducao[chave]
+    linha = banco_cache.consultar_um('''
+        SELECT traducao FROM memoria_traducao WHERE origem = ? AND destino = ? AND hash_texto = ?
+    ''', chave)
+    if linha:
+        traducao_stats["disco"] += 1
+        _lembrar_traducao(chave, linha[0])
+        return linha[0]
+    return None
+
+def _gravar_traducoes(pares):
+    banco_cache.executar_lote('INSERT OR REPLACE INTO memoria_traducao VALUES (?, ?, ?, ?, ?)',
+                              [(*chave, traducao, time.time()) for chave, traducao in pares])
+    for chave, traducao in pares:
+        _lembrar_traducao(chave, traducao)
+
+# Agrupa os textos em chamadas de até TRADUCAO_LOTE_CARACTERES, unidos por um separador
+# ao_traduzir(grupo, traducoes) é chamado a cada requisição concluída, antes da próxima
+def _traduzir_remoto(textos, origem, destino, ao_traduzir=None):
+    from deep_translator import GoogleTranslator
+    tradutor = GoogleTranslator(source=origem, target=destino)
+    traducoes, grupo = [], []
+
+    def enviar():
+        traducao_stats["requisicoes"] += 1
+        if len(grupo) == 1:
+            partes = [tradutor.translate(grupo[0])]
+        else:
+            partes = [p.strip() for p in re.split(r"\s*§§\s*", tradutor.translate(_SEPARADOR_LOTE.join(grupo)))]
+            if len(partes) != len(grupo):
+                # O tradutor mexeu no separador: traduz um a um
+                traducao_stats["requisicoes"] += len(grupo)
+                partes = [tradutor.translate(texto) for texto in grupo]
+        traducoes.extend(partes)
+        if ao_traduzir:
+            ao_traduzir(grupo, partes)
+
+    for texto in textos:
+        if grupo and sum(map(len, grupo)) + len(texto) + len(_SEPARADOR_LOTE) * len(grupo) > TRADUCAO_LOTE_CARACTERES:
+            enviar()
+            grupo = []
+        grupo.append(texto)
+    if grupo:
+        enviar()
+    return traducoes
+
+def traduzir_lote(textos, origem='pt', destino='en'):
+    resultado = {}
+    esperando = {}      # texto -> Future de outra chamada que já está traduzindo
+    meus = {}           # texto -> (chave, Future) que esta chamada vai resolver
+    for texto in dict.fromkeys(textos):
+        if not texto or not texto.strip():
+            resultado[texto] = texto
+            continue
+        chave = _chave_traducao(texto, origem, destino)
+        traducao = _traducao_guardada(chave)
+        if traducao is not None:
+            resultado[texto] = traducao
+            continue
+        with _traducao_lock:
+            tarefa = _traducoes_em_andamento.get(chave)
+            if tarefa is None:
+                tarefa = _traducoes_em_andamento[chave] = Future()
+                meus[texto] = (chave, tarefa)
+            else:
+                esperando[texto] = tarefa
+    if meus:
+        traducao_stats["misses"] += len(meus)
+        pendentes = dict(meus)
+
+        def entregar(texto, traducao):
+            chave, tarefa = pendentes.pop(texto)
+            resultado[texto] = traducao
+            with _traducao_lock:
+                _traducoes_em_andamento.pop(chave, None)
+            tarefa.set_result(traducao)
+
+        # Cada grupo é guardado e entregue assim que chega: uma falha num grupo seguinte não o descarta
+        def concluir(grupo, traducoes):
+            _gravar_traducoes([(meus[texto][0], traducao) for texto, traducao in zip(grupo, traducoes)])
+            for texto, traducao in zip(grupo, traducoes):
+                entregar(texto, traducao)
+
+        try:
+            _traduzir_remoto(list(meus), origem, destino, ao_traduzir=concluir)
+        except Exception:
+            # Sem tradução o texto segue no idioma original (e nada é guardado)
+            traducao_stats["erros"] += 1
+            for texto in list(pendentes):
+                entregar(texto, texto)
+        finally:
+            # Interrompido por BaseException (Ctrl+C, SystemExit): quem espera esses textos não fica pendurado
+            for texto, (chave, tarefa) in list(pendentes.items()):
+                with _traducao_lock:
+                    _traducoes_em_andamento.pop(chave, None)
+                tarefa.set_exception(RuntimeError("Tradução interrompida."))
+    for texto, tarefa in esperando.items():
+        traducao_stats["memoria"] += 1
+        resultado[texto] = tarefa.result()
+    return [resultado[texto] for texto in textos]
+
+def traduzir(texto, origem='pt', destino='en'):
+    return traduzir_lote([texto], origem, destino)[0]
+
 def traduzir_para_ingles(texto):
-    try:
-        return GoogleTranslator(source='pt', target='en').translate(texto)
-    except Exception:
-        return texto
+    return traduzir(texto, 'pt', 'en')
+
+def estatisticas_traducao():
+    acertos = traducao_stats["memoria"] + traducao_stats["disco"]
+    total = acertos + traducao_stats["misses"]
+    return dict(traducao_stats, taxa_acerto=acertos / total if total else 0.0)
 
 def baixar_repositorio_github(url):
     try:
-        g = Github()
+        g = cliente_github()
         repo_name = url.split("github.com/")[1]
         repo = g.get_repo(repo_name)
         arquivos = repo.get_contents("")
@@ -415,12 +3760,13 @@ def baixar_repositorio_github(url):
         print(f"Erro ao baixar repositório: {e}")
 
 def notificar(texto):
+    from win10toast import ToastNotifier
     toaster = ToastNotifier()
     toaster.show_toast("TETEU IA", texto, duration=5)
 
 def mostrar_historico_interface(limite=10):
-    cur.execute('SELECT id, comando, resposta FROM historico ORDER BY id DESC LIMIT ?', (limite,))
-    registros = cur.fetchall()
+    descarregar_escritas()
+    registros = banco.consultar('SELECT id, comando, resposta FROM historico ORDER BY id DESC LIMIT ?', (limite,))
     if registros:
         texto = ""
         for r in registros[::-1]:
@@ -429,6 +3775,75 @@ def mostrar_historico_interface(limite=10):
     else:
         return "📭 Histórico vazio."
 
-def atualizar_pontuacao(nome, pontos_ganhos):
-    cur.execute('UPDATE ranking SET pontos = pontos + ?, quizzes = quizzes + 1 WHERE nome = ?', (pontos_ganhos, nome))
-    con.commit()
+def atualizar_pontuacao(nome, pontos_ganhos, sincrono=False):
+    with placar.lock:
+        fila_escrita.adicionar_pontuacao(nome, pontos_ganhos)
+        placar.registrar(nome, pontos_ganhos, 1)
+    if sincrono:
+        fila_escrita.descarregar()
+
+# ⏱️ Mede o "import teteu" num interpretador novo (python -X importtime) e mostra os módulos mais caros
+def medir_inicio(top=10, mostrar=True):
+    processo = subprocess.run([sys.executable, "-X", "importtime", "-c", "import teteu"],
+                              capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    medicoes = []
+    for linha in processo.stderr.splitlines():
+        # Formato: "import time: <próprio us> | <acumulado us> | <módulo>"
+        partes = linha.split("|")
+        if not linha.startswith("import time:") or len(partes) != 3:
+            continue
+        try:
+            medicoes.append((int(partes[0].split(":")[1]), int(partes[1]), partes[2].rstrip()))
+        except ValueError:
+            continue  # linha de cabeçalho
+    total_ms = next((acumulado for _, acumulado, nome in medicoes if nome.strip() == "teteu"), 0) / 1000
+    if mostrar:
+        print(f"⏱️ import teteu: {total_ms:.1f} ms (orçamento: {ORCAMENTO_INICIO_MS} ms)")
+        for proprio, acumulado, nome in sorted(medicoes, reverse=True)[:top]:
+            print(f"  {proprio / 1000:8.2f} ms  (acumulado {acumulado / 1000:8.2f} ms)  {nome.strip()}")
+    return total_ms
+
+# 🚀 Rodar
+def principal(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="TETEU IA — Assistente de Código")
+    parser.add_argument("--perfil-inicio", action="store_true", help="mede o tempo de 'import teteu' e sai")
+    parser.add_argument("--lote", metavar="ARQUIVO",
+                        help="roda os comandos de um arquivo JSONL ('-' para stdin) sem o modo interativo")
+    parser.add_argument("--saida", metavar="ARQUIVO", default="-", help="onde gravar os resultados JSONL (padrão: stdout)")
+    parser.add_argument("--concorrencia", type=int, default=LOTE_CONCORRENCIA, help="comandos rodando ao mesmo tempo")
+    parser.add_argument("--ordem", choices=ORDENS_LOTE, default="entrada",
+                        help="resultados na ordem do arquivo ou conforme terminam")
+    parser.add_argument("--servidor", action="store_true", help="atende por HTTP e WebSocket em vez do terminal")
+    parser.add_argument("--host", default=SERVIDOR_HOST, help="endereço do modo servidor")
+    parser.add_argument("--porta", type=int, default=SERVIDOR_PORTA, help="porta do modo servidor")
+    parser.add_argument("--usuario", help="nome usado no ranking e no histórico (sem perguntar)")
+    args = parser.parse_args(argv)
+    if args.perfil_inicio:
+        return 0 if medir_inicio() <= ORCAMENTO_INICIO_MS else 1
+    if args.servidor and args.lote:
+        parser.error("use --servidor ou --lote, não os dois")
+    padrao = "servidor" if args.servidor else ((os.getenv("USER") or "lote") if args.lote else None)
+    iniciar(args.usuario or padrao)
+    try:
+        if args.servidor:
+            servir(args.host, args.porta)
+            return 0
+        if not args.lote:
+            teteu_loop()
+            return 0
+        with contextlib.ExitStack() as pilha:
+            entrada = sys.stdin if args.lote == "-" else pilha.enter_context(open(args.lote, encoding="utf-8"))
+            saida = sys.stdout if args.saida == "-" else pilha.enter_context(open(args.saida, "w", encoding="utf-8"))
+            resumo = processar_lote(entrada, saida, args.concorrencia, args.ordem)
+        print(f"📦 {resumo['total']} comandos, {resumo['erros']} com erro.", file=sys.stderr)
+        return 1 if resumo["erros"] else 0
+    finally:
+        limpar_arquivos_temporarios()
+        encerrar_linters()
+        encerrar_sandbox()
+        encerrar_http()
+        fechar_banco()
+
+if __name__ == "__main__":
+    sys.exit(principal())